@@ -0,0 +1,353 @@
+"""Benchmarks for the launch, stream and log hot paths of etui.
+
+The TUI benchmarks run headless with Textual's pilot. All files are created in a
+temporary directory, nothing is written to the user config, the log folder, the
+state of detached runs or the caches.
+
+Usage:
+
+        uv run benchmarks/run_benchmarks.py --output results.json
+        uv run benchmarks/run_benchmarks.py --compare results.json --threshold 0.2
+
+With --compare the results are compared to a former result file. Benchmarks that got
+worse by more than the threshold are listed as regressions and the exit code is 1.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import etui.config
+import etui.matrix
+import etui.runs
+import etui.tui
+from etui.config import ScriptFolder
+from etui.environments import ENVIRONMENTS
+from etui.file_browser import FileBrowser
+from etui.file_utils import TEST_PATH, extract_argparse, get_version
+from etui.introspect import INTROSPECTOR
+from etui.log_tree import LogTree
+from etui.logging import cleanup_old_logs, create_log_file, create_matrix_log_dir
+from etui.runs import RunManager
+from etui.scriptlauncher import ScriptLauncher
+from etui.tui import ETui
+
+APP_SIZE = (160, 50)
+WAIT_TIMEOUT = 120.0
+
+
+@dataclass
+class Result:
+    name: str
+    unit: str
+    samples: list[float] = field(default_factory=list)
+    higher_is_better: bool = False
+
+    @property
+    def value(self) -> float:
+        return statistics.median(self.samples)
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {"value": self.value}
+
+
+class Benchmarks:
+    """Collection of all benchmarks, each bench_* method returns a list of results."""
+
+    def __init__(self, work_dir: Path, repeat: int, quick: bool) -> None:
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.quick = quick
+
+    def _scale(self, full, quick):
+        return quick if self.quick else full
+
+    async def _run_app(self, callback: Callable[[ETui, object], Awaitable[None]]):
+        app = ETui()
+        async with app.run_test(size=APP_SIZE) as pilot:
+            await pilot.pause()
+            await callback(app, pilot)
+
+    async def _wait_until(self, pilot, condition: Callable[[], bool]) -> None:
+        deadline = time.perf_counter() + WAIT_TIMEOUT
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Benchmark condition not reached")
+            await pilot.pause(0.001)
+
+    async def _open_launcher(self, app: ETui, pilot) -> ScriptLauncher:
+        launcher = ScriptLauncher()
+        await app.push_screen(launcher)
+        await pilot.pause()
+        return launcher
+
+    async def bench_app_start(self) -> list[Result]:
+        result = Result("app_start_to_first_frame", "s")
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            app = ETui()
+            async with app.run_test(size=APP_SIZE) as pilot:
+                await pilot.pause()
+                result.samples.append(time.perf_counter() - start)
+        return [result]
+
+    async def bench_folder_load(self) -> list[Result]:
+        results = []
+        for count in (10, *self._scale((1_000, 10_000), (100, 1_000))):
+            folder_path = self.work_dir / f"scripts_{count}"
+            folder_path.mkdir(exist_ok=True)
+            for index in range(count):
+                (folder_path / f"script_{index:05d}.py").write_text("print('hi')\n")
+            folder = ScriptFolder(f"bench_{count}", folder_path)
+            result = Result(f"folder_load_{count}_scripts", "s")
+
+            async def load(app: ETui, pilot, folder=folder, result=result) -> None:
+                launcher = await self._open_launcher(app, pilot)
+                launcher.script_folders[folder.name] = folder
+                for _ in range(self.repeat):
+                    start = time.perf_counter()
+                    launcher.load_scripts_for_folder(folder.name)
+                    await pilot.pause()
+                    result.samples.append(time.perf_counter() - start)
+
+            await self._run_app(load)
+            results.append(result)
+        return results
+
+    async def bench_extract_argparse(self) -> list[Result]:
+        script = self.work_dir / "many_args.py"
+        lines = ["import argparse", "parser = argparse.ArgumentParser()"]
+        for index in range(200):
+            lines.append(
+                f'parser.add_argument("--arg{index}", default="{index}", help="arg")'
+            )
+        lines.append("parser.parse_args()")
+        script.write_text("\n".join(lines) + "\n")
+        results = []
+        for name, path in (
+            ("extract_argparse_test_script", TEST_PATH / "test_script.py"),
+            ("extract_argparse_200_args", script),
+        ):
+            result = Result(f"{name}_per_second", "calls/s", higher_is_better=True)
+            calls = self._scale(500, 50)
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                for _ in range(calls):
+                    extract_argparse(path)
+                result.samples.append(calls / (time.perf_counter() - start))
+            results.append(result)
+        return results
+
+    async def bench_stream_throughput(self) -> list[Result]:
+        line_count = self._scale(100_000, 10_000)
+        folder_path = self.work_dir / "stream"
+        folder_path.mkdir(exist_ok=True)
+        (folder_path / "emit.py").write_text(
+            f"for i in range({line_count}):\n"
+            "    print(('INFO', 'WARNING', 'DEBUG')[i % 3], 'benchmark line', i)\n"
+        )
+        folder = ScriptFolder("stream", folder_path, Path(sys.executable))
+        result = Result("stream_lines_per_second", "lines/s", higher_is_better=True)
+
+        async def stream(app: ETui, pilot) -> None:
+            launcher = await self._open_launcher(app, pilot)
+            # action_run_script takes the executable of the selected folder
+            launcher.script_folders[launcher.folder_select.value] = folder
+            launcher.load_scripts_for_folder(launcher.folder_select.value)
+            await pilot.pause()
+            launcher.script_list.index = 0
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                await launcher.action_run_script()
+                await self._wait_until(pilot, lambda: launcher.run is None)
+                await pilot.pause()
+                result.samples.append(line_count / (time.perf_counter() - start))
+
+        await self._run_app(stream)
+        return [result]
+
+    async def bench_open_large_log(self) -> list[Result]:
+        results = []
+        for size_kb in (64, self._scale(4096, 256)):
+            log_file = self.work_dir / f"large_{size_kb}kb.log"
+            line = "[12:00:00] INFO some log line with a bit of text in it 1234567890\n"
+            with log_file.open("w") as f:
+                f.write(line * (size_kb * 1024 // len(line)))
+            result = Result(f"file_browser_open_{size_kb}kb_log", "s")
+
+            async def open_log(
+                app: ETui, pilot, log_file=log_file, result=result
+            ) -> None:
+                for _ in range(self.repeat):
+                    browser = FileBrowser(self.work_dir)
+                    await app.push_screen(browser)
+                    await pilot.pause()
+                    start = time.perf_counter()
+                    browser.path = str(log_file)
+                    await self._wait_until(
+                        pilot, lambda browser=browser: browser.sub_title
+                    )
+                    await pilot.pause()
+                    result.samples.append(time.perf_counter() - start)
+                    await app.pop_screen()
+
+            await self._run_app(open_log)
+            results.append(result)
+        return results
+
+    async def bench_log_tree_expand(self) -> list[Result]:
+        file_count = self._scale(20_000, 2_000)
+        log_root = self.work_dir / "log_tree"
+        folder_path = log_root / "folder"
+        folder_path.mkdir(parents=True)
+        for index in range(file_count):
+            day = index % 28 + 1
+            path = folder_path / f"script_{index % 10}_202601{day:02d}_{index:06d}.log"
+            path.touch()
+        result = Result(f"log_tree_expand_{file_count}_logs", "s")
+
+        async def expand(app: ETui, pilot) -> None:
+            for _ in range(self.repeat):
+                browser = FileBrowser(log_root)
+                await app.push_screen(browser)
+                tree = browser.query_one(LogTree)
+                await self._wait_until(pilot, lambda tree=tree: tree.root.children)
+                folder = tree.root.children[0]
+                start = time.perf_counter()
+                folder.expand()
+                await self._wait_until(pilot, lambda folder=folder: folder.children)
+                script = folder.children[0]
+                script.expand()
+                await self._wait_until(pilot, lambda script=script: script.children)
+                date = script.children[0]
+                date.expand()
+                await self._wait_until(pilot, lambda date=date: date.children)
+                result.samples.append(time.perf_counter() - start)
+                await app.pop_screen()
+
+        await self._run_app(expand)
+        return [result]
+
+    async def bench_cleanup_old_logs(self) -> list[Result]:
+        file_count = self._scale(20_000, 2_000)
+        result = Result(f"cleanup_old_logs_{file_count}_files", "s")
+        old = time.time() - 60 * 86400
+        for _ in range(self.repeat):
+            root = Path(tempfile.mkdtemp(dir=self.work_dir))
+            for index in range(file_count):
+                folder = root / f"folder_{index % 20}"
+                folder.mkdir(exist_ok=True)
+                path = folder / f"script_{index}_20260101_120000.log"
+                path.touch()
+                if index % 2:
+                    os.utime(path, (old, old))
+            start = time.perf_counter()
+            cleanup_old_logs(root, max_age_days=30)
+            result.samples.append(time.perf_counter() - start)
+        return [result]
+
+
+def _isolate(work_dir: Path) -> None:
+    """Points the user config, the log folder, the state of detached runs and the
+    caches of etui into the work directory.
+
+    The paths are bound as default arguments at import, so the functions and classes
+    using them are replaced by partials in the modules that call them."""
+    config_dir = work_dir / "config"
+    config_dir.mkdir()
+    log_root = work_dir / "log"
+    etui.config.USER_CONFIG_DIR = config_dir
+    etui.config.ensure_user_configs()
+    etui.runs.create_log_file = functools.partial(create_log_file, logs_root=log_root)
+    etui.matrix.create_matrix_log_dir = functools.partial(
+        create_matrix_log_dir, logs_root=log_root
+    )
+    etui.tui.cleanup_old_logs = functools.partial(cleanup_old_logs, log_root)
+    etui.runs.RUNS_STATE_PATH = work_dir / "runs"
+    etui.tui.RunManager = functools.partial(RunManager, etui.runs.RUNS_STATE_PATH)
+    INTROSPECTOR.cache.path = work_dir / "schemas"
+    ENVIRONMENTS.path = work_dir / "envs"
+
+
+async def run_benchmarks(names: list[str] | None, repeat: int, quick: bool) -> dict:
+    with tempfile.TemporaryDirectory(prefix="etui_bench_") as tmp:
+        work_dir = Path(tmp)
+        _isolate(work_dir)
+        benchmarks = Benchmarks(work_dir, repeat, quick)
+        results = {}
+        for attribute in sorted(dir(benchmarks)):
+            name = attribute.removeprefix("bench_")
+            if not attribute.startswith("bench_") or (names and name not in names):
+                continue
+            print(f"Running {name}…", file=sys.stderr)
+            for result in await getattr(benchmarks, attribute)():
+                results[result.name] = result.to_dict()
+                print(f"  {result.name}: {result.value:.4g} {result.unit}")
+    return {
+        "meta": {
+            "etui_version": get_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "repeat": repeat,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns a description of every benchmark that got worse than the threshold."""
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or not old["value"]:
+            continue
+        change = (result["value"] - old["value"]) / old["value"]
+        if result["higher_is_better"]:
+            change = -change
+        if change > threshold:
+            regressions.append(
+                f"{name}: {old['value']:.4g} -> {result['value']:.4g} "
+                f"{result['unit']} ({change:+.0%} worse)"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, help="write results as JSON to file")
+    parser.add_argument("--compare", type=Path, help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="smaller data sets")
+    parser.add_argument("--only", nargs="+", help="names of benchmarks to run")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args.only, args.repeat, args.quick))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions compared to {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
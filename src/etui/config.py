@@ -1,6 +1,7 @@
 """Handles config initialization and updates."""
 
 from dataclasses import dataclass
+from fnmatch import fnmatch
 from pathlib import Path
 import shutil
 import tomllib
@@ -14,6 +15,8 @@ DEFAULT_CONFIG_DIR = ROOT_PATH / "config_defaults"
 USER_CONFIG_DIR = Path(user_config_dir("etui"))
 SETTINGS_FILE = "settings.toml"
 SCRIPT_FOLDERS_FILE = "script_folders.toml"
+PRESETS_FILE = "presets.toml"
+TRIGGERS_FILE = "triggers.toml"
 
 
 @dataclass
@@ -24,6 +27,20 @@ class ScriptFolder:
     cwd: Path = ROOT_PATH
     file_extension: str = "*.py"
     exclude_start: tuple[str] = ("_", ".")
+    pty: bool = False
+    introspect: bool = False  # Run scripts to read dynamically built parsers
+    provision: bool = False  # Run scripts in environments with their dependencies
+
+    def scripts(self) -> list[Path]:
+        """Returns the scripts of the folder, except for names starting with
+        exclude_start characters."""
+        if not self.path.exists():
+            return []
+        return [
+            script
+            for script in sorted(self.path.glob(self.file_extension))
+            if script.name[0] not in self.exclude_start
+        ]
 
     def to_toml_dict(self) -> dict[str, str | tuple[str]]:
         """Returns dict for saving to toml."""
@@ -34,13 +51,16 @@ class ScriptFolder:
             "cwd": str(self.cwd),
             "file_extension": self.file_extension,
             "exclude_start": self.exclude_start,
+            "pty": self.pty,
+            "introspect": self.introspect,
+            "provision": self.provision,
         }
 
 
 def ensure_user_configs():
     """Ensures that the user config files are present."""
     USER_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-    for name in (SETTINGS_FILE, SCRIPT_FOLDERS_FILE):
+    for name in (SETTINGS_FILE, SCRIPT_FOLDERS_FILE, TRIGGERS_FILE):
         user_config = USER_CONFIG_DIR / name
         default_config = DEFAULT_CONFIG_DIR / name
         if not user_config.exists():
@@ -65,6 +85,13 @@ def load_settings() -> dict:
     return load_toml(USER_CONFIG_DIR / SETTINGS_FILE)
 
 
+def load_settings_section(section: str, defaults: dict) -> dict:
+    """Returns one section of the settings, missing keys are filled with defaults.
+
+    User settings files created by older versions might lack newer sections or keys."""
+    return defaults | load_settings().get(section, {})
+
+
 def load_script_folders() -> dict[str, ScriptFolder]:
     toml_folders = load_toml(USER_CONFIG_DIR / SCRIPT_FOLDERS_FILE).get("folders", [])
     folders = {}
@@ -78,10 +105,25 @@ def load_script_folders() -> dict[str, ScriptFolder]:
             folder["cwd"],
             folder["file_extension"],
             folder["exclude_start"],
+            folder.get("pty", False),
+            folder.get("introspect", False),
+            folder.get("provision", False),
         )
     return folders
 
 
+def load_trigger_rules(script_path: Path, file_path: Path | None = None) -> list[dict]:
+    """Returns the output triggers whose script pattern matches the script's name."""
+    file_path = file_path or USER_CONFIG_DIR / TRIGGERS_FILE
+    if not file_path.exists():
+        return []
+    return [
+        rule
+        for rule in load_toml(file_path).get("triggers", [])
+        if fnmatch(script_path.name, rule.get("script", "*"))
+    ]
+
+
 def save_script_folders(
     folders: dict[str, ScriptFolder],
     file_path: Path = USER_CONFIG_DIR / SCRIPT_FOLDERS_FILE,
@@ -94,6 +136,52 @@ def save_script_folders(
         tomli_w.dump({"folders": folder_list}, f)
 
 
+def _load_all_presets(file_path: Path) -> dict:
+    if not file_path.exists():
+        return {}
+    return load_toml(file_path).get("scripts", {})
+
+
+def load_presets(
+    script_path: Path, schema: str, file_path: Path | None = None
+) -> dict[str, dict]:
+    """Returns the argument presets of a script by name.
+
+    Presets are stored together with the hash of the argparse schema they were saved
+    for. If the arguments of the script changed since then, its presets are deleted,
+    so only pass the final schema, not one of a provisional fallback."""
+    file_path = file_path or USER_CONFIG_DIR / PRESETS_FILE
+    scripts = _load_all_presets(file_path)
+    entry = scripts.get(str(script_path.resolve()))
+    if not entry:
+        return {}
+    if entry.get("schema") != schema:
+        scripts.pop(str(script_path.resolve()))
+        with file_path.open("wb") as f:
+            tomli_w.dump({"scripts": scripts}, f)
+        return {}
+    return entry.get("presets", {})
+
+
+def save_preset(
+    script_path: Path,
+    schema: str,
+    name: str,
+    preset: dict,
+    file_path: Path | None = None,
+):
+    """Saves a named argument preset of a script to a toml file."""
+    file_path = file_path or USER_CONFIG_DIR / PRESETS_FILE
+    scripts = _load_all_presets(file_path)
+    entry = scripts.setdefault(str(script_path.resolve()), {})
+    if entry.get("schema") != schema:
+        entry.clear()
+        entry["schema"] = schema
+    entry.setdefault("presets", {})[name] = preset
+    with file_path.open("wb") as f:
+        tomli_w.dump({"scripts": scripts}, f)
+
+
 class Config:
     def __init__(self):
         ensure_user_configs()
@@ -0,0 +1,372 @@
+"""Local control API of a running etui: JSON-RPC 2.0 over a Unix domain socket.
+
+Requests and responses are JSON objects, one per line. Runs started over the API are
+managed like runs of the ScriptLauncher: they share the argparse cache, the ingest and
+export settings and are stopped when etui is quit. The socket is only accessible by
+the user running etui.
+
+Methods (parameters by name):
+
+    list_folders()                          -> [{name, path, executable, pty}]
+    list_scripts(folder)                    -> [script names]
+    get_schema(folder, script)              -> {parser name: {args, command}}
+    start_run(folder, script, args, pty)    -> run info
+    list_runs()                             -> [run info]
+    get_run(run_id)                         -> run info
+    send_input(run_id, text)                -> true if the line was sent
+    terminate_run(run_id)                   -> name of the signal that stopped the run
+    stream_output(run_id, since)            -> {return_code} after the run finished
+
+stream_output first sends an "output" notification for every line after the sequence
+number since (as far as still kept) and for every new line, until the run finished.
+If the client reads slower than the script writes, lines are dropped once
+STREAM_QUEUE_SIZE lines are waiting, which is sent as an "output_gap" notification
+with the number of dropped lines after the sequence number after.
+
+Send a single request from a shell with:
+
+        python -m etui.control_api start_run '{"folder": "Tests", "script": "x.py"}'
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import socket
+import sys
+from dataclasses import asdict
+from pathlib import Path
+from tempfile import gettempdir
+
+from etui.config import ScriptFolder, load_script_folders
+from etui.environments import ProvisioningError, provisioned_folder
+from etui.file_utils import cached_extract_argparse
+from etui.introspect import INTROSPECTOR
+from etui.logging import get_logger
+from etui.runs import RunEvent, RunManager, ScriptRun, build_command
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+STREAM_LIMIT = 2**20  # Max. length of a request line
+STREAM_QUEUE_SIZE = 10_000  # Max. lines waiting to be sent by stream_output
+
+
+def default_socket_path() -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "etui.sock"
+    # In a directory only the user can access, as the temporary directory is shared
+    return Path(gettempdir()) / f"etui-{os.getuid()}" / "etui.sock"
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class ControlServer:
+    """Serves the control API for the runs of one app.
+
+    Every request is handled in its own task, so a client can stream the output of a
+    run and send input or terminate it over the same connection."""
+
+    def __init__(self, runs: RunManager, socket_path: Path | None = None) -> None:
+        self.runs = runs
+        self.socket_path = socket_path or default_socket_path()
+        self._server: asyncio.Server | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._methods = {
+            "list_folders": self.list_folders,
+            "list_scripts": self.list_scripts,
+            "get_schema": self.get_schema,
+            "start_run": self.start_run,
+            "list_runs": self.list_runs,
+            "get_run": self.get_run,
+            "send_input": self.send_input,
+            "terminate_run": self.terminate_run,
+            "stream_output": self.stream_output,
+        }
+
+    async def start(self) -> None:
+        directory = self.socket_path.parent
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if directory.stat().st_uid != os.getuid():
+            raise OSError(f"Control API directory {directory} belongs to another user")
+        if self.socket_path.exists():
+            if _socket_in_use(self.socket_path):
+                raise OSError(f"Control API socket {self.socket_path} is in use")
+            self.socket_path.unlink()
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=self.socket_path, limit=STREAM_LIMIT
+        )
+        os.chmod(self.socket_path, 0o600)
+        get_logger().info("Control API listening on %s", self.socket_path)
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        # wait_closed waits for all connections, e.g. clients streaming output
+        for writer in list(self._clients):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        self.socket_path.unlink(missing_ok=True)
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        tasks = set()
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._handle_request(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):  # ValueError: line above the limit
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ApiError(PARSE_ERROR, f"Invalid JSON: {e}")
+            if not isinstance(request, dict) or "method" not in request:
+                raise ApiError(INVALID_REQUEST, "Expected an object with a method")
+            request_id = request.get("id")
+            method = self._methods.get(request["method"])
+            if method is None:
+                raise ApiError(METHOD_NOT_FOUND, f"Unknown method {request['method']}")
+            params = request.get("params") or {}
+            if not isinstance(params, dict) or "writer" in params:
+                raise ApiError(INVALID_PARAMS, "Parameters must be passed by name")
+            try:
+                inspect.signature(method).bind(**params)
+            except TypeError as e:
+                raise ApiError(INVALID_PARAMS, str(e))
+            if request["method"] == "stream_output":
+                params["writer"] = writer
+            result = await method(**params)
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except ApiError as e:
+            response = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": e.code, "message": e.message},
+            }
+        except Exception as e:  # noqa: BLE001 - any error is reported to the client
+            get_logger().exception("Control API request failed")
+            response = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": SERVER_ERROR, "message": str(e)},
+            }
+        await _send(writer, response)
+
+    def _folder(self, name: str) -> ScriptFolder:
+        folders = load_script_folders()
+        if name not in folders:
+            raise ApiError(SERVER_ERROR, f"Unknown script folder {name}")
+        return folders[name]
+
+    def _script(self, folder: ScriptFolder, name: str) -> Path:
+        for script in folder.scripts():
+            if script.name == name:
+                return script
+        raise ApiError(SERVER_ERROR, f"Unknown script {name} in {folder.name}")
+
+    def _run(self, run_id: int) -> ScriptRun:
+        run = self.runs.runs.get(run_id)
+        if run is None:
+            raise ApiError(SERVER_ERROR, f"Unknown run {run_id}")
+        return run
+
+    async def _provisioned(self, folder: ScriptFolder, script: Path) -> ScriptFolder:
+        """Returns the folder with the executable of the script's environment."""
+        try:
+            return await asyncio.to_thread(provisioned_folder, folder, script)
+        except ProvisioningError as e:
+            raise ApiError(SERVER_ERROR, f"Environment not built: {e}") from None
+
+    async def list_folders(self) -> list[dict]:
+        return [
+            {
+                "name": folder.name,
+                "path": str(folder.path),
+                "executable": str(folder.executable),
+                "pty": folder.pty,
+            }
+            for folder in load_script_folders().values()
+        ]
+
+    async def list_scripts(self, folder: str) -> list[str]:
+        return [script.name for script in self._folder(folder).scripts()]
+
+    async def get_schema(self, folder: str, script: str) -> dict:
+        script_folder = self._folder(folder)
+        script_path = self._script(script_folder, script)
+        parsers = None
+        if script_folder.introspect:
+            script_folder = await self._provisioned(script_folder, script_path)
+            parsers = await asyncio.to_thread(
+                INTROSPECTOR.parsers, script_path, script_folder.executable
+            )
+        if parsers is None:
+            parsers = await asyncio.to_thread(cached_extract_argparse, script_path)
+        return {
+            name: {
+                "command": parser.command,
+                "args": [asdict(arg) for arg in parser.args],
+            }
+            for name, parser in parsers.items()
+        }
+
+    async def start_run(
+        self,
+        folder: str,
+        script: str,
+        args: list[str] | None = None,
+        pty: bool | None = None,
+    ) -> dict:
+        script_folder = self._folder(folder)
+        script_path = self._script(script_folder, script)
+        args = args or []
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise ApiError(INVALID_PARAMS, "args must be a list of strings")
+        script_folder = await self._provisioned(script_folder, script_path)
+        run = self.runs.create(
+            script_path,
+            build_command(script_folder, script_path, args),
+            pty=script_folder.pty if pty is None else pty,
+            ingest=self.runs.create_ingest_filter(),
+        )
+        await run.start()
+        return run.info()
+
+    async def list_runs(self) -> list[dict]:
+        return [run.info() for run in self.runs.runs.values()]
+
+    async def get_run(self, run_id: int) -> dict:
+        return self._run(run_id).info()
+
+    async def send_input(self, run_id: int, text: str) -> bool:
+        return await self._run(run_id).send_input(text)
+
+    async def terminate_run(self, run_id: int) -> str | None:
+        released_by = await self._run(run_id).terminate()
+        return released_by.name if released_by else None
+
+    async def stream_output(
+        self,
+        run_id: int,
+        since: int = 0,
+        writer: asyncio.StreamWriter | None = None,
+    ) -> dict:
+        run = self._run(run_id)
+        queue: asyncio.Queue[RunEvent] = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        def on_event(event: RunEvent) -> None:
+            # Dropped lines show up as a gap in the sequence numbers. The run is
+            # finished before the exit event, so the loop ends even without it.
+            if event.kind in ("line", "status", "exit") and not queue.full():
+                queue.put_nowait(event)
+
+        run.add_listener(on_event)
+        try:
+            last_seq = since
+            for event in list(run.history):
+                if event.seq > last_seq:
+                    await _send(writer, _output_notification(run.id, event))
+                    last_seq = event.seq
+            while not run.finished.is_set() or not queue.empty():
+                event = await queue.get()
+                if event.kind == "exit":
+                    break
+                if event.seq > last_seq:
+                    if event.seq > last_seq + 1:
+                        dropped = event.seq - last_seq - 1
+                        await _send(
+                            writer, _gap_notification(run.id, last_seq, dropped)
+                        )
+                    await _send(writer, _output_notification(run.id, event))
+                    last_seq = event.seq
+            if run.history and run.history[-1].seq > last_seq:  # Dropped at the end
+                dropped = run.history[-1].seq - last_seq
+                await _send(writer, _gap_notification(run.id, last_seq, dropped))
+        finally:
+            run.remove_listener(on_event)
+        return {"return_code": run.return_code}
+
+
+def _output_notification(run_id: int, event: RunEvent) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "method": "output",
+        "params": {
+            "run_id": run_id,
+            "seq": event.seq,
+            "text": event.text,
+            "is_stderr": event.is_stderr,
+            "status": event.kind == "status",
+        },
+    }
+
+
+def _gap_notification(run_id: int, after: int, dropped: int) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "method": "output_gap",
+        "params": {"run_id": run_id, "after": after, "dropped": dropped},
+    }
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+def _socket_in_use(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+async def call(socket_path: Path, method: str, params: dict) -> None:
+    """Sends one request and prints every message until the response arrived."""
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+    await _send(writer, {"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+    while line := await reader.readline():
+        print(line.decode(), end="", flush=True)
+        if "id" in json.loads(line):
+            break
+    writer.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Calls the control API of etui.")
+    parser.add_argument("method", help="e.g. list_folders, start_run, stream_output")
+    parser.add_argument("params", nargs="?", default="{}", help="parameters as JSON")
+    parser.add_argument("--socket", type=Path, default=default_socket_path())
+    args = parser.parse_args()
+    asyncio.run(call(args.socket, args.method, json.loads(args.params)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
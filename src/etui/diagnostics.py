@@ -0,0 +1,209 @@
+"""Metrics and profiling to find out why etui is slow under a heavy run."""
+
+import asyncio
+import cProfile
+import io
+import pstats
+import statistics
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from textual.app import ComposeResult
+from textual.containers import Horizontal, VerticalScroll
+from textual.screen import Screen
+from textual.widgets import Button, Footer, Header, Static
+
+from etui.file_utils import LOG_PATH
+from etui.logging import get_logger
+
+PROFILE_PATH = LOG_PATH / "profiles"
+HISTOGRAM_SAMPLES = 1000
+LOOP_LAG_INTERVAL = 0.1
+REFRESH_INTERVAL = 0.5
+
+
+class Histogram:
+    """Keeps totals of all observations and the most recent ones for percentiles."""
+
+    def __init__(self, max_samples: int = HISTOGRAM_SAMPLES) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=max_samples)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, percent: int) -> float:
+        if len(self.samples) < 2:
+            return self.samples[0] if self.samples else 0.0
+        return statistics.quantiles(self.samples, n=100)[percent - 1]
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """Counters and histograms of the hot paths.
+
+    Recording is a no-op while disabled, so instrumented code doesn't need to check."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started = time.monotonic()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        if self.enabled:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.started = time.monotonic()
+
+    def report(self) -> str:
+        """Returns all metrics as a readable text block."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        lines = ["Counters:"]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"  {name:<28}{value:>12}  ({value / elapsed:,.1f}/s)")
+        lines.append("")
+        lines.append("Histograms (ms):")
+        lines.append(
+            f"  {'':<28}{'count':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}"
+        )
+        for name, histogram in sorted(self.histograms.items()):
+            values = (
+                histogram.mean,
+                histogram.percentile(50),
+                histogram.percentile(95),
+                histogram.max,
+            )
+            lines.append(
+                f"  {name:<28}{histogram.count:>10}"
+                + "".join(f"{value * 1000:>10.3f}" for value in values)
+            )
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+
+
+class Profiler:
+    """Toggles cProfile for the whole app and writes the results next to the logs."""
+
+    def __init__(self, profile_path: Path = PROFILE_PATH) -> None:
+        self.profile_path = profile_path
+        self._profile: cProfile.Profile | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> None:
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Path:
+        """Stops profiling and returns the path of the written profile.
+
+        Besides the binary .prof file (for snakeviz, pstats, ...) a .txt file with the
+        30 most expensive functions is written."""
+        self._profile.disable()
+        self.profile_path.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.profile_path / f"etui_{timestamp}.prof"
+        self._profile.dump_stats(path)
+        text = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=text)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+        path.with_suffix(".txt").write_text(text.getvalue())
+        self._profile = None
+        get_logger().info("Profile written to %s", path)
+        return path
+
+    def toggle(self) -> Path | None:
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+
+PROFILER = Profiler()
+
+
+async def monitor_event_loop_lag(
+    metrics: Metrics = METRICS, interval: float = LOOP_LAG_INTERVAL
+) -> None:
+    """Measures how much later than requested the event loop wakes up a sleeper."""
+    while metrics.enabled:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag", time.perf_counter() - start - interval)
+
+
+class DiagnosticsScreen(Screen):
+    """Live view of the metrics of the running app."""
+
+    def __init__(self, title: str = "Diagnostics") -> None:
+        super().__init__()
+        self.title = title
+        self.report = Static(id="diagnostics-report")
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        with Horizontal(id="diagnostics-buttons"):
+            yield Button("", id="toggle_metrics")
+            yield Button("", id="toggle_profiler")
+            yield Button("Reset", id="reset")
+        with VerticalScroll():
+            yield self.report
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.refresh_report()
+        self.set_interval(REFRESH_INTERVAL, self.refresh_report)
+
+    def refresh_report(self) -> None:
+        metrics_button = self.query_one("#toggle_metrics", Button)
+        metrics_button.label = (
+            "Disable Metrics" if METRICS.enabled else "Enable Metrics"
+        )
+        profiler_button = self.query_one("#toggle_profiler", Button)
+        profiler_button.label = (
+            "Stop Profiler" if PROFILER.running else "Start Profiler"
+        )
+        if not METRICS.enabled:
+            self.report.update("Metrics are disabled.")
+            return
+        workers = list(self.app.workers)
+        running = sum(1 for worker in workers if worker.is_running)
+        header = (
+            f"Running scripts: {len(self.app.runs.running())}\n"
+            f"Workers: {len(workers)} ({running} running)\n"
+            f"Profiler: {'running' if PROFILER.running else 'stopped'}\n\n"
+        )
+        self.report.update(header + METRICS.report())
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "toggle_metrics":
+            self.app.set_diagnostics(not METRICS.enabled)
+        elif event.button.id == "toggle_profiler":
+            self.app.action_toggle_profiler()
+        elif event.button.id == "reset":
+            METRICS.reset()
+        self.refresh_report()
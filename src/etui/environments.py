@@ -0,0 +1,341 @@
+"""Provisioned virtual environments for scripts with their own dependencies.
+
+For script folders with provision enabled, the dependencies of a script are read from
+its inline script metadata (PEP 723):
+
+        # /// script
+        # dependencies = ["requests<3", "rich"]
+        # ///
+
+or else from a requirements.txt next to the script, including the files it refers to
+with -r or -c. Scripts without either are run with the folder's executable as usual.
+
+One environment is built per hash of the base executable and the dependencies, so
+scripts with the same dependencies share it. Environments are built with uv if it is
+installed (which also shares the installed packages through its cache), otherwise
+with venv and pip. They are built in place, as both write absolute paths into the
+environment, under a file lock shared with other etui instances; a marker file is
+written last. A small thread pool builds them in the background, e.g. when a folder
+is selected, so starting a script with a built environment costs only reading the
+script's metadata.
+"""
+
+import fcntl
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+import threading
+import time
+import tomllib
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+from platformdirs import user_cache_dir
+
+from etui.config import ScriptFolder
+from etui.logging import get_logger
+
+ENVIRONMENTS_PATH = Path(user_cache_dir("etui")) / "envs"
+REQUIREMENTS_FILE = "requirements.txt"
+MARKER_FILE = "etui-env.json"  # Written last, an environment without it is incomplete
+BUILD_TIMEOUT = 600.0
+BUILD_WORKERS = 2
+# The reference regular expression of PEP 723
+METADATA_PATTERN = re.compile(
+    r"(?m)^# /// (?P<type>[a-zA-Z0-9-]+)$\s(?P<content>(^#(| .*)$\s)+)^# ///$"
+)
+# Lines of a requirements file that refer to another requirements or constraints file
+NESTED_FILE_PATTERN = re.compile(
+    r"^(-r|--requirement|-c|--constraint)(\s+|=|(?<=-[rc]))(?P<path>\S+)"
+)
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def script_metadata(script_path: Path) -> dict | None:
+    """Returns the inline script metadata (PEP 723) of a script, if it has any."""
+    text = script_path.read_text(encoding="utf-8", errors="replace")
+    if "# /// script" not in text:  # Cheap check before the regular expression
+        return None
+    blocks = [m for m in METADATA_PATTERN.finditer(text) if m["type"] == "script"]
+    if not blocks:
+        return None
+    if len(blocks) > 1:
+        raise ProvisioningError("Multiple script metadata blocks")
+    content = "".join(
+        line[2:] if line.startswith("# ") else line[1:]
+        for line in blocks[0]["content"].splitlines(keepends=True)
+    )
+    try:
+        return tomllib.loads(content)
+    except tomllib.TOMLDecodeError as e:
+        raise ProvisioningError(f"Invalid script metadata: {e}") from None
+
+
+def script_requirements(script_path: Path) -> tuple[str, list[str]] | None:
+    """Returns the source and the requirements of a script, None if it has none.
+
+    The source is "metadata" or the path of the requirements file."""
+    metadata = script_metadata(script_path)
+    if metadata is not None:
+        dependencies = metadata.get("dependencies", [])
+        if not isinstance(dependencies, list):
+            raise ProvisioningError("dependencies must be a list")
+        return "metadata", sorted(str(dependency) for dependency in dependencies)
+    requirements_path = script_path.parent / REQUIREMENTS_FILE
+    if requirements_path.is_file():
+        return str(requirements_path), read_requirements(requirements_path)
+    return None
+
+
+def read_requirements(path: Path, seen: set[Path] | None = None) -> list[str]:
+    """Returns the lines of a requirements file with the files it refers to inlined.
+
+    The lines of nested files follow the line referring to them, so a change of any of
+    them changes the environment key."""
+    seen = seen if seen is not None else set()
+    seen.add(path.resolve())
+    requirements = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        requirements.append(line)
+        match = NESTED_FILE_PATTERN.match(line)
+        if match:
+            nested_path = path.parent / match["path"]
+            if nested_path.resolve() in seen:
+                continue
+            try:
+                requirements.extend(read_requirements(nested_path, seen))
+            except FileNotFoundError:
+                raise ProvisioningError(f"{line} in {path}: file not found") from None
+    return requirements
+
+
+def environment_key(executable: Path, requirements: list[str]) -> str:
+    digest = hashlib.sha256(f"{executable}\0".encode())
+    digest.update("\n".join(requirements).encode())
+    return digest.hexdigest()[:32]
+
+
+def environment_python(env_path: Path) -> Path:
+    return env_path / "bin" / "python"
+
+
+def _run_tool(cmd: list[str], cwd: Path) -> None:
+    try:
+        result = subprocess.run(
+            cmd,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            timeout=BUILD_TIMEOUT,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        raise ProvisioningError(f"{Path(cmd[0]).name} timed out") from None
+    if result.returncode != 0:
+        get_logger().warning("%s failed:\n%s", " ".join(cmd), result.stderr)
+        lines = result.stderr.strip().splitlines()
+        raise ProvisioningError(lines[-1] if lines else f"{cmd[0]} failed")
+
+
+def build_environment(
+    env_path: Path,
+    executable: Path,
+    source: str,
+    requirements: list[str],
+    cwd: Path,
+) -> None:
+    """Creates a virtual environment with the requirements at env_path."""
+    # The tools run in the script's folder, a relative executable is relative to etui's
+    executable = executable.absolute()
+    uv = shutil.which("uv")
+    python = environment_python(env_path)
+    if source == "metadata":
+        packages = requirements
+    else:
+        packages = ["-r", source]
+    if uv:
+        _run_tool([uv, "venv", "-q", "--python", str(executable), str(env_path)], cwd)
+        if packages:
+            _run_tool(
+                [uv, "pip", "install", "-q", "--python", str(python), *packages], cwd
+            )
+    else:
+        _run_tool([str(executable), "-m", "venv", str(env_path)], cwd)
+        if packages:
+            _run_tool(
+                [
+                    str(python),
+                    "-m",
+                    "pip",
+                    "install",
+                    "-q",
+                    "--disable-pip-version-check",
+                    *packages,
+                ],
+                cwd,
+            )
+    marker = {
+        "executable": str(executable),
+        "requirements": requirements,
+        "tool": "uv" if uv else "venv",
+        "created_at": time.time(),
+    }
+    (env_path / MARKER_FILE).write_text(json.dumps(marker, indent=2))
+
+
+class EnvironmentCache:
+    """Built environments by dependency hash, with a small pool of build threads.
+
+    Each worker waits for the subprocesses of one build, so the pool limits how many
+    environments are built at the same time."""
+
+    def __init__(
+        self, path: Path = ENVIRONMENTS_PATH, workers: int = BUILD_WORKERS
+    ) -> None:
+        self.path = path
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="provision")
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()  # prepare is called from the UI and API threads
+        self._failed: dict[str, str] = {}  # Keys of environments that can't be built
+
+    def _resolve(self, executable: Path, script_path: Path) -> tuple[str, str, list]:
+        requirements = script_requirements(script_path)
+        if requirements is None:
+            return "", "", []
+        source, packages = requirements
+        # Absolute, as a relative executable depends on the working directory
+        return environment_key(executable.absolute(), packages), source, packages
+
+    def ready_executable(self, executable: Path, script_path: Path) -> Path | None:
+        """Returns the Python executable for the script, None if it isn't built yet.
+
+        Scripts without requirements use the given executable."""
+        try:
+            key, _, _ = self._resolve(executable, script_path)
+        except (OSError, ProvisioningError):
+            return None
+        if not key:
+            return executable
+        env_path = self.path / key
+        return (
+            environment_python(env_path) if (env_path / MARKER_FILE).exists() else None
+        )
+
+    def prepare(
+        self,
+        executable: Path,
+        script_path: Path,
+        callback: Callable[[Path, Path | None, str | None], None] | None = None,
+        retry: bool = False,
+    ) -> Future | None:
+        """Builds the environment of a script in the pool, unless it is built already.
+
+        The callback is called from the worker thread with the script, the Python
+        executable of the environment and an error message, only if the environment
+        is built. Returns None if nothing has to be done, a Future with the result
+        otherwise, which is already done if the environment can't be built. A failed
+        build is only tried again with retry, e.g. when the script is started."""
+        try:
+            key, source, requirements = self._resolve(executable, script_path)
+        except (OSError, ProvisioningError) as e:
+            return self._failed_future(str(e))
+        if not key or (self.path / key / MARKER_FILE).exists():
+            return None
+        if retry:
+            self._failed.pop(key, None)
+        elif key in self._failed:
+            return self._failed_future(self._failed[key])
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(
+                    self._build, key, executable, source, requirements, script_path
+                )
+                self._pending[key] = future
+        if callback is not None:
+
+            def on_done(done: Future) -> None:
+                if not done.cancelled():
+                    callback(script_path, *done.result())
+
+            future.add_done_callback(on_done)
+        return future
+
+    def _failed_future(self, error: str) -> Future:
+        future = Future()
+        future.set_result((None, error))
+        return future
+
+    def _build(
+        self,
+        key: str,
+        executable: Path,
+        source: str,
+        requirements: list[str],
+        script_path: Path,
+    ) -> tuple[Path | None, str | None]:
+        env_path = self.path / key
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / f"{key}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if (env_path / MARKER_FILE).exists():  # Built by another etui meanwhile
+                    return environment_python(env_path), None
+                shutil.rmtree(env_path, ignore_errors=True)  # Of an interrupted build
+                try:
+                    build_environment(
+                        env_path, executable, source, requirements, script_path.parent
+                    )
+                except BaseException:
+                    shutil.rmtree(env_path, ignore_errors=True)
+                    raise
+            get_logger().info("Environment %s built for %s", key, script_path)
+            return environment_python(env_path), None
+        except (ProvisioningError, OSError) as e:
+            get_logger().warning("Environment for %s failed: %s", script_path, e)
+            self._failed[key] = str(e)
+            return None, str(e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def executable(self, executable: Path, script_path: Path) -> Path:
+        """Returns the Python executable for the script, building it if necessary.
+
+        Blocks until the environment is built, raises ProvisioningError if it fails.
+        Environments that failed before are built again."""
+        ready = self.ready_executable(executable, script_path)
+        if ready is not None:
+            return ready
+        future = self.prepare(executable, script_path, retry=True)
+        if future is None:  # Built in the meantime
+            return self.ready_executable(executable, script_path) or executable
+        python, error = future.result()
+        if python is None:
+            raise ProvisioningError(error)
+        return python
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+ENVIRONMENTS = EnvironmentCache()
+
+
+def provisioned_folder(folder: ScriptFolder, script_path: Path) -> ScriptFolder:
+    """Returns the folder with the executable of the script's environment.
+
+    Blocks while the environment is built, so call it in a thread."""
+    if not folder.provision:
+        return folder
+    executable = ENVIRONMENTS.executable(folder.executable, script_path)
+    return replace(folder, executable=executable)
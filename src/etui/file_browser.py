@@ -1,16 +1,27 @@
 """FileBrowser based on the code browser example in the textualize repo."""
 
+import time
+from functools import partial
 from pathlib import Path
 
-from rich.traceback import Traceback
+from rich.text import Text
 from textual.app import ComposeResult
-from textual.containers import Container, VerticalScroll
-from textual.highlight import highlight
+from textual.containers import Container, Vertical, VerticalScroll
 from textual.reactive import var, reactive
 from textual.screen import Screen
-from textual.widgets import DirectoryTree, Footer, Header, Static
+from textual.widgets import Footer, Header, Static
+from textual.worker import get_current_worker
 
+from etui.diagnostics import METRICS
+from etui.file_preview import FilePreview, PreviewCache
 from etui.file_utils import ROOT_PATH, TCSS_PATH
+from etui.log_diff import LogDiff
+from etui.log_tree import LogTree
+from etui.logging import previous_run_log
+
+HUNKS_PER_PAGE = 20
+PREVIEW_GROUP = "preview"
+DIFF_STYLES = {"-": "red", "+": "green", " ": "dim"}
 
 
 class FileBrowser(Screen):
@@ -19,6 +30,8 @@ class FileBrowser(Screen):
     CSS_PATH = str(TCSS_PATH / "file_browser.tcss")
     BINDINGS = [
         ("f", "toggle_files", "Toggle Files"),
+        ("m", "mark_for_diff", "Mark for Diff"),
+        ("d", "diff", "Diff"),
         ("q", "quit", "Quit"),
     ]
 
@@ -28,6 +41,10 @@ class FileBrowser(Screen):
     def __init__(self, path: Path | str = ROOT_PATH) -> None:
         super().__init__()
         self.root_path = str(path)
+        self.diff_base: Path | None = None
+        self.previews = PreviewCache()
+        self._preview: FilePreview | None = None
+        self._loading_chunk = False
 
     def watch_show_tree(self, show_tree: bool) -> None:
         """Called when show_tree is modified."""
@@ -37,38 +54,224 @@ class FileBrowser(Screen):
         path = self.root_path
         yield Header(show_clock=True)
         with Container():
-            yield DirectoryTree(path, id="tree-view")
+            yield LogTree(path, id="tree-view")
             with VerticalScroll(id="file-view"):
-                yield Static(id="file", expand=True)
+                yield Vertical(id="file")
         yield Footer()
 
     def on_mount(self) -> None:
-        self.query_one(DirectoryTree).focus()
+        self.query_one(LogTree).focus()
+        # Checked on scrolling and after each chunk was laid out
+        file_view = self.query_one("#file-view")
+        self.watch(file_view, "scroll_y", self._load_on_scroll, init=False)
+        self.watch(file_view, "virtual_size", self._load_on_scroll, init=False)
 
-    def on_directory_tree_file_selected(
-        self, event: DirectoryTree.FileSelected
-    ) -> None:
+    def on_log_tree_file_selected(self, event: LogTree.FileSelected) -> None:
         """Called when the user clicks a file in the directory tree."""
         event.stop()
         self.path = str(event.path)
 
     def watch_path(self, path: str | None) -> None:
-        """Called when path changes."""
-        file_view = self.query_one("#file", Static)
+        """Called when path changes.
+
+        Shows a cached preview at once, otherwise the file is read in a worker. Workers
+        of the former selection are cancelled."""
+        self._preview = None
+        self._loading_chunk = False
+        self.workers.cancel_group(self, PREVIEW_GROUP)
+        file_view = self.query_one("#file", Vertical)
+        file_view.remove_children()
         if path is None:
-            file_view.update("")
             return
+        preview = self.previews.get(Path(path))
+        if preview is not None:
+            self._show_preview(preview)
+            return
+        file_view.mount(Static("Loading…", classes="file-chunk"))
+        self.run_worker(
+            partial(self._open_preview, Path(path)),
+            thread=True,
+            exclusive=True,
+            group=PREVIEW_GROUP,
+        )
+
+    def _open_preview(self, path: Path) -> None:
+        """Detects the file type and renders the first chunk, runs in a thread."""
+        start = time.perf_counter()
         try:
-            file = Path(path).read_text(encoding="utf-8")
-            syntax = highlight(file, path=path)
-        except Exception:
-            file_view.update(Traceback(theme="github-dark", width=None))
-            self.sub_title = "ERROR"
-        else:
-            file_view.update(syntax)
-            self.query_one("#file-view").scroll_home(animate=False)
-            self.sub_title = path
+            preview = FilePreview.open(path)
+            chunk = preview.read_chunk()
+        except OSError as e:
+            if not get_current_worker().is_cancelled:
+                self.app.call_from_thread(self._show_error, path, e)
+            return
+        METRICS.observe("file_preview_open", time.perf_counter() - start)
+        if not get_current_worker().is_cancelled:
+            self.app.call_from_thread(self._preview_opened, preview, chunk)
+
+    def _preview_opened(
+        self, preview: FilePreview, chunk: tuple[int, int, Text]
+    ) -> None:
+        if self.path != str(preview.path):
+            return
+        preview.add_chunk(*chunk)
+        self.previews.put(preview)
+        self._show_preview(preview)
+
+    def _show_preview(self, preview: FilePreview) -> None:
+        self._preview = preview
+        file_view = self.query_one("#file", Vertical)
+        file_view.remove_children()
+        file_view.mount_all(
+            Static(chunk, classes="file-chunk") for chunk in preview.chunks
+        )
+        self.query_one("#file-view").scroll_home(animate=False)
+        path = str(preview.path)
+        self.sub_title = f"{path} (binary)" if preview.binary else path
+
+    def _show_error(self, path: Path, error: OSError) -> None:
+        if self.path != str(path):
+            return
+        file_view = self.query_one("#file", Vertical)
+        file_view.remove_children()
+        file_view.mount(Static(Text(str(error), style="red"), classes="file-chunk"))
+        self.sub_title = "ERROR"
+
+    def _load_on_scroll(self) -> None:
+        """Loads the next chunk once the end of the loaded part comes into view."""
+        preview = self._preview
+        if preview is None or preview.complete or self._loading_chunk:
+            return
+        scroll = self.query_one("#file-view", VerticalScroll)
+        if scroll.scroll_y < scroll.max_scroll_y - scroll.size.height:
+            return
+        self._loading_chunk = True
+        self.run_worker(
+            partial(self._read_chunk, preview),
+            thread=True,
+            exclusive=True,
+            group=PREVIEW_GROUP,
+        )
+
+    def _read_chunk(self, preview: FilePreview) -> None:
+        try:
+            chunk = preview.read_chunk()
+        except OSError as e:
+            chunk = (preview.offset, preview.size, Text(str(e), style="red"))
+        if not get_current_worker().is_cancelled:
+            self.app.call_from_thread(self._chunk_loaded, preview, chunk)
+
+    def _chunk_loaded(self, preview: FilePreview, chunk: tuple[int, int, Text]) -> None:
+        self._loading_chunk = False
+        if not preview.add_chunk(*chunk) or preview is not self._preview:
+            return
+        self.query_one("#file", Vertical).mount(
+            Static(preview.chunks[-1], classes="file-chunk")
+        )
 
     def action_toggle_files(self) -> None:
         """Called in response to key binding."""
         self.show_tree = not self.show_tree
+
+    def action_mark_for_diff(self) -> None:
+        """Marks the selected log to compare other logs with."""
+        if self.path is None:
+            return
+        self.diff_base = Path(self.path)
+        self.notify(f"Marked {self.diff_base.name} for diff")
+
+    def action_diff(self) -> None:
+        """Compares the selected log with the marked log or the previous run."""
+        if self.path is None:
+            return
+        new_path = Path(self.path)
+        old_path = self.diff_base
+        if old_path is None or old_path == new_path:
+            old_path = previous_run_log(new_path)
+        if old_path is None:
+            self.notify(
+                "No previous run found, mark a log to compare with (m).",
+                severity="warning",
+            )
+            return
+        self.app.push_screen(LogDiffScreen(old_path, new_path))
+
+
+class LogDiffScreen(Screen):
+    """Shows the differences between two run logs page by page."""
+
+    CSS_PATH = str(TCSS_PATH / "file_browser.tcss")
+    BINDINGS = [
+        ("n", "next_page", "Next Hunks"),
+        ("p", "previous_page", "Previous Hunks"),
+    ]
+
+    def __init__(self, old_path: Path, new_path: Path, title: str = "Log Diff") -> None:
+        super().__init__()
+        self.title = title
+        self.old_path = old_path
+        self.new_path = new_path
+        self.diff: LogDiff | None = None
+        self.page = 0
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        yield Static(
+            f"Comparing {self.old_path.name} → {self.new_path.name} …",
+            id="diff-summary",
+        )
+        with VerticalScroll(id="diff-view"):
+            yield Static(id="diff", expand=True)
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.run_worker(self._compute_diff, thread=True, exclusive=True)
+
+    def _compute_diff(self) -> None:
+        """Builds the line indices and the diff outside of the event loop."""
+        try:
+            diff = LogDiff(self.old_path, self.new_path)
+        except OSError as e:
+            self.app.call_from_thread(self.notify, str(e), severity="error")
+            return
+        self.app.call_from_thread(self._show_diff, diff)
+
+    def _show_diff(self, diff: LogDiff) -> None:
+        self.diff = diff
+        self.page = 0
+        self._render_page()
+
+    def _render_page(self) -> None:
+        """Renders only the hunks of the current page, read from the files on demand."""
+        removed, added = self.diff.changed_lines
+        page_count = max(1, -(-len(self.diff.hunks) // HUNKS_PER_PAGE))
+        self.query_one("#diff-summary", Static).update(
+            f"{self.old_path.name} → {self.new_path.name}: "
+            f"{len(self.diff.hunks)} hunks, -{removed} +{added} lines "
+            f"(page {self.page + 1}/{page_count})"
+        )
+        text = Text()
+        start = self.page * HUNKS_PER_PAGE
+        for hunk in self.diff.hunks[start : start + HUNKS_PER_PAGE]:
+            first, last = hunk[0], hunk[-1]
+            text.append(
+                f"@@ -{first.a_start + 1},{last.a_stop - first.a_start} "
+                f"+{first.b_start + 1},{last.b_stop - first.b_start} @@\n",
+                style="bold cyan",
+            )
+            for marker, line in self.diff.hunk_lines(hunk):
+                text.append(f"{marker} {line}\n", style=DIFF_STYLES[marker])
+        if not self.diff.hunks:
+            text.append("No differences (timestamps are ignored).")
+        self.query_one("#diff", Static).update(text)
+        self.query_one("#diff-view").scroll_home(animate=False)
+
+    def action_next_page(self) -> None:
+        if self.diff and (self.page + 1) * HUNKS_PER_PAGE < len(self.diff.hunks):
+            self.page += 1
+            self._render_page()
+
+    def action_previous_page(self) -> None:
+        if self.diff and self.page > 0:
+            self.page -= 1
+            self._render_page()
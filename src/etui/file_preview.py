@@ -0,0 +1,172 @@
+"""Chunked previews of text and binary files for the FileBrowser.
+
+Files are read chunk by chunk, so opening a large log doesn't read or render the whole
+file. Only the first HIGHLIGHT_SIZE bytes of a text file are syntax highlighted,
+further chunks are shown as plain text. Binary files are shown as a hex dump.
+"""
+
+import codecs
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from rich.text import Text
+from textual.highlight import highlight
+
+HIGHLIGHT_SIZE = 16 * 1024  # Size of the first, highlighted chunk of a text file
+TEXT_CHUNK_SIZE = 64 * 1024
+HEX_CHUNK_SIZE = 16 * 1024
+HEX_LINE_WIDTH = 16
+BINARY_SAMPLE_SIZE = 8192
+BINARY_THRESHOLD = 0.05  # Share of control characters
+PREVIEW_CACHE_SIZE = 32
+
+_TEXT_BYTES = bytes([*b"\t\n\r\f\b\x1b", *range(32, 127), *range(128, 256)])
+_PRINTABLE = bytes(byte if 32 <= byte < 127 else ord(".") for byte in range(256))
+
+
+def is_binary(sample: bytes) -> bool:
+    """Guesses if data is binary by NUL bytes or too many control characters."""
+    if b"\0" in sample:
+        return True
+    if not sample:
+        return False
+    control_count = len(sample.translate(None, _TEXT_BYTES))
+    return control_count / len(sample) > BINARY_THRESHOLD
+
+
+def guess_encoding(sample: bytes) -> str:
+    """Returns utf-8 if the sample is valid UTF-8, otherwise latin-1.
+
+    Latin-1 can decode any byte, so legacy encoded files are shown with the right
+    characters in most cases instead of replacement characters."""
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut off at the end of the sample
+        if e.start < len(sample) - 3:
+            return "latin-1"
+    return "utf-8"
+
+
+def hex_dump(data: bytes, offset: int = 0) -> Text:
+    """Renders data like `hexdump -C`: offset, hex bytes and printable characters."""
+    text = Text()
+    for start in range(0, len(data), HEX_LINE_WIDTH):
+        row = data[start : start + HEX_LINE_WIDTH]
+        text.append(f"{offset + start:08x}  ", style="dim")
+        text.append(f"{row.hex(' '):<{HEX_LINE_WIDTH * 3}} ")
+        text.append(f"|{row.translate(_PRINTABLE).decode('ascii')}|\n", style="cyan")
+    text.rstrip()
+    return text
+
+
+@dataclass
+class FilePreview:
+    """The rendered chunks of a file and how far the file was read."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+    binary: bool
+    encoding: str = "utf-8"
+    chunks: list[Text] = field(default_factory=list)
+    offset: int = 0
+    # Of the incremental decoder: bytes of a character split between two chunks
+    decoder_state: tuple[bytes, int] = (b"", 0)
+
+    @classmethod
+    def open(cls, path: Path) -> "FilePreview":
+        stat = path.stat()
+        with open(path, "rb") as file:
+            sample = file.read(BINARY_SAMPLE_SIZE)
+        return cls(
+            path,
+            stat.st_size,
+            stat.st_mtime_ns,
+            is_binary(sample),
+            guess_encoding(sample),
+        )
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.size
+
+    def read_chunk(self) -> tuple[int, int, Text, tuple[bytes, int]]:
+        """Reads and renders the chunk after the current offset.
+
+        Doesn't change the preview, so it can be called from a worker thread. Returns
+        the start and stop offset of the chunk with its renderable and the decoder
+        state after it, see add_chunk."""
+        start = self.offset
+        if self.binary:
+            chunk_size = HEX_CHUNK_SIZE
+        else:
+            chunk_size = HIGHLIGHT_SIZE if start == 0 else TEXT_CHUNK_SIZE
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            data = file.read(chunk_size)
+        if not data:  # The file got shorter since it was opened
+            return start, self.size, Text(), self.decoder_state
+        if self.binary:
+            return start, start + len(data), hex_dump(data, start), self.decoder_state
+        if len(data) == chunk_size:
+            # Cut at the last line break, so no line is split. A line longer than a
+            # chunk is split anyway, the decoder keeps a split character for the next.
+            cut = data.rfind(b"\n") + 1
+            data = data[:cut] if cut else data
+        stop = start + len(data)
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        decoder.setstate(self.decoder_state)
+        content = decoder.decode(data, final=stop >= self.size).removesuffix("\n")
+        if start == 0:
+            renderable = highlight(content, path=str(self.path))
+        else:
+            renderable = Text(content)
+        return start, stop, renderable, decoder.getstate()
+
+    def add_chunk(
+        self,
+        start: int,
+        stop: int,
+        renderable: Text,
+        decoder_state: tuple[bytes, int] = (b"", 0),
+    ) -> bool:
+        """Appends a chunk from read_chunk, unless it doesn't follow the last one."""
+        if start != self.offset:
+            return False
+        self.chunks.append(renderable)
+        self.offset = stop
+        self.decoder_state = decoder_state
+        return True
+
+
+class PreviewCache:
+    """Least recently used previews, outdated once the file was modified."""
+
+    def __init__(self, max_size: int = PREVIEW_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._previews: OrderedDict[Path, FilePreview] = OrderedDict()
+
+    def get(self, path: Path) -> FilePreview | None:
+        preview = self._previews.get(path)
+        if preview is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            stat = None
+        if stat is None or (stat.st_mtime_ns, stat.st_size) != (
+            preview.mtime_ns,
+            preview.size,
+        ):
+            del self._previews[path]
+            return None
+        self._previews.move_to_end(path)
+        return preview
+
+    def put(self, preview: FilePreview) -> None:
+        self._previews[preview.path] = preview
+        self._previews.move_to_end(preview.path)
+        while len(self._previews) > self.max_size:
+            self._previews.popitem(last=False)
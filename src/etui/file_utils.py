@@ -1,6 +1,9 @@
 """Utility classes and functions for file reading and manipulation."""
 
-from dataclasses import dataclass
+import ast
+import hashlib
+import json
+from dataclasses import asdict, dataclass
 from pathlib import Path
 from importlib.metadata import version, PackageNotFoundError
 
@@ -15,6 +18,17 @@ LOG_PATH = ROOT_PATH / "log"
 PYTHON_UV = ROOT_PATH / ".venv/bin/python"
 
 
+ARG_TYPES = {"int": "int", "float": "float", "str": "str", "Path": "path"}
+# boolean_optional is argparse.BooleanOptionalAction, which adds --x and --no-x
+FLAG_ACTIONS = (
+    "store_true",
+    "store_false",
+    "store_const",
+    "append_const",
+    "boolean_optional",
+)
+
+
 @dataclass
 class ParserArgument:
     name: str
@@ -23,12 +37,28 @@ class ParserArgument:
     action: str | None = None
     type: str = "str"
     help: str = ""
+    choices: list[str] | None = None
+    nargs: str | None = None
+
+    @property
+    def positional(self) -> bool:
+        return not self.name.startswith("-")
+
+    @property
+    def mandatory(self) -> bool:
+        """Required options and positionals without optional nargs must be given."""
+        return self.required or (self.positional and self.nargs not in ("?", "*"))
+
+    @property
+    def is_flag(self) -> bool:
+        return self.action in FLAG_ACTIONS
 
 
 @dataclass
 class Parser:
     name: str
     args: list[ParserArgument]
+    command: str | None = None  # Name of the (sub)command, if added with add_parser
 
 
 def get_version() -> str:
@@ -40,14 +70,125 @@ def get_version() -> str:
 
 
 def extract_argparse(script_path: Path, multiple_parsers: bool = True) -> dict:
-    """Extract argparse arguments from a script."""
-    parsers = {}
+    """Extract argparse arguments from a script.
+
+    The script is parsed into a syntax tree, so arguments spanning several lines and
+    literal values like choices are read correctly. Scripts that can't be parsed by
+    this python version (e.g. python 2 scripts) fall back to a line based search."""
     with open(script_path, "r") as file:
-        lines = file.readlines()
+        source = file.read()
+    try:
+        parsers = _extract_argparse_ast(ast.parse(source))
+    except SyntaxError:
+        parsers = _extract_argparse_lines(source.splitlines(keepends=True))
+    # ToDo: Remove as soon as multiple parser problem is fixed
+    if not multiple_parsers:
+        for value in parsers.values():
+            return value
+    return parsers
+
+
+_argparse_cache: dict[Path, tuple[int, dict[str, Parser]]] = {}
+
+
+def cached_extract_argparse(script_path: Path) -> dict[str, Parser]:
+    """Like extract_argparse, but parses a script again only after it was modified.
+
+    The cache is shared by the ScriptLauncher and the control API."""
+    mtime_ns = script_path.stat().st_mtime_ns
+    cached = _argparse_cache.get(script_path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    parsers = extract_argparse(script_path)
+    _argparse_cache[script_path] = (mtime_ns, parsers)
+    return parsers
+
+
+def _literal(node: ast.expr | None):
+    """Returns the value of a literal node, None for anything computed at runtime."""
+    if node is None:
+        return None
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError):
+        return None
+
+
+def _call_target(call: ast.Call) -> str | None:
+    """Returns the variable name a method is called on, e.g. 'parser'."""
+    if isinstance(call.func, ast.Attribute) and isinstance(call.func.value, ast.Name):
+        return call.func.value.id
+    return None
+
+
+def _action_name(node: ast.expr | None) -> str | None:
+    if isinstance(node, ast.Name | ast.Attribute):
+        name = node.id if isinstance(node, ast.Name) else node.attr
+        return "boolean_optional" if name == "BooleanOptionalAction" else None
+    return _literal(node)
+
+
+def _type_name(node: ast.expr | None) -> str:
+    if isinstance(node, ast.Name):
+        return ARG_TYPES.get(node.id, "str")
+    if isinstance(node, ast.Attribute):
+        return ARG_TYPES.get(node.attr, "str")
+    return "str"
+
+
+def _extract_argparse_ast(tree: ast.Module) -> dict[str, Parser]:
+    commands = {}  # Parser variable name -> (sub)command name
+    calls = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call):
+            call = node.value
+            is_add_parser = (
+                isinstance(call.func, ast.Attribute)
+                and call.func.attr == "add_parser"
+                and call.args
+            )
+            if is_add_parser and isinstance(node.targets[0], ast.Name):
+                commands[node.targets[0].id] = _literal(call.args[0])
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "add_argument"
+            and _call_target(node)
+        ):
+            calls.append(node)
+    parsers = {}
+    for call in sorted(calls, key=lambda call: (call.lineno, call.col_offset)):
+        parser_name = _call_target(call)
+        if parser_name not in parsers:
+            parsers[parser_name] = Parser(parser_name, [], commands.get(parser_name))
+        names = [_literal(arg) for arg in call.args]
+        names = [name for name in names if isinstance(name, str)]
+        if not names:
+            continue
+        # Prefer the long option, e.g. '--ip' of '-i, --ip'
+        name = next((name for name in names if name.startswith("--")), names[0])
+        keywords = {keyword.arg: keyword.value for keyword in call.keywords}
+        default = _literal(keywords.get("default"))
+        choices = _literal(keywords.get("choices"))
+        nargs = _literal(keywords.get("nargs"))
+        parsers[parser_name].args.append(
+            ParserArgument(
+                name,
+                bool(_literal(keywords.get("required"))),
+                None if default is None else str(default),
+                _action_name(keywords.get("action")),
+                _type_name(keywords.get("type")),
+                _literal(keywords.get("help")) or "",
+                [str(choice) for choice in choices] if choices else None,
+                None if nargs is None else str(nargs),
+            )
+        )
+    return parsers
+
+
+def _extract_argparse_lines(lines: list[str]) -> dict[str, Parser]:
+    parsers = {}
     arg_lines = _argparse_helper(lines)
-    # ToDo: Remove as soon as multiple parser problems is fixed:
-    if not arg_lines:
-        return parsers
     for line in arg_lines:
         parser_name = line.split(".")[0].lstrip()  # Get parser name
         if not parsers.get(parser_name):
@@ -75,13 +216,15 @@ def extract_argparse(script_path: Path, multiple_parsers: bool = True) -> dict:
                 arg_name, arg_required, arg_default, arg_action, arg_type, arg_help
             )
         )
-    # ToDo: Remove as soon as multiple parser problem is fixed
-    if not multiple_parsers:
-        for value in parsers.values():
-            return value
     return parsers
 
 
+def schema_hash(parsers: dict[str, Parser]) -> str:
+    """Returns a short hash of the parsed argparse schema of a script."""
+    schema = json.dumps([asdict(parser) for parser in parsers.values()], sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()[:16]
+
+
 def _argparse_helper(lines: list[str]) -> list[str]:
     """Returns list of argparse arguments from a script in 1 line per argument.
 
@@ -0,0 +1,216 @@
+"""Rule engine that decides how script output lines are displayed.
+
+The rules only affect the output box, the log file of a run always contains every line.
+"""
+
+import re
+import time
+from dataclasses import dataclass
+
+from etui.logging import LEVEL_ALIASES, detect_level
+from etui.triggers import literal_prefix
+
+LEVEL_RANKS = {
+    "DEBUG": 10,
+    "INFO": 20,
+    "WARNING": 30,
+    "ERROR": 40,
+    "CRITICAL": 50,
+    "STDERR": 30,  # Unlabeled stderr output (e.g. tracebacks) counts as a warning
+}
+RULE_ACTIONS = ("hide", "highlight", "count")
+
+
+def _level_name(level: str) -> str:
+    level = level.upper()
+    return LEVEL_ALIASES.get(level, level)
+
+
+@dataclass
+class IngestRule:
+    """One rule for output lines.
+
+    A rule matches a line if the line has the given level (if set) and the pattern
+    (if set) is found in it. Every match is counted, additionally the line is hidden
+    or the matched part is highlighted, depending on the action."""
+
+    pattern: str = ""
+    level: str = ""
+    action: str = "highlight"
+    style: str = "bold magenta"
+
+    @classmethod
+    def from_dict(cls, rule: dict) -> "IngestRule":
+        action = rule.get("action", cls.action)
+        if action not in RULE_ACTIONS:
+            raise ValueError(f"Unknown ingest rule action: {action}")
+        return cls(
+            rule.get("pattern", cls.pattern),
+            _level_name(rule.get("level", cls.level)),
+            action,
+            rule.get("style", cls.style),
+        )
+
+    @property
+    def label(self) -> str:
+        return self.pattern or self.level
+
+
+@dataclass
+class IngestResult:
+    show: bool
+    level: str | None
+    highlight: tuple[int, int, str] | None = None
+    dropped: int = 0  # Lines hidden by the rate limit in the last second
+
+
+class IngestFilter:
+    """Applies ingest rules, a minimum level and a rate limit to the lines of one run.
+
+    Every pattern is compiled on its own, so inline flags and group references work
+    as in a single pattern. Like for triggers (see etui.triggers), the literal
+    beginnings of the patterns are searched first, only rules whose beginning is found
+    are searched with their pattern. If several pattern rules match, the one that
+    matches first in the line wins. Rules without a pattern are looked up by level.
+
+    Rules of the settings that are invalid are skipped, see from_settings.
+    """
+
+    def __init__(
+        self,
+        rules: list[IngestRule] | None = None,
+        min_level: str = "",
+        max_lines_per_second: int = 0,
+        sample_rate: int = 0,
+    ) -> None:
+        self.rules = rules or []
+        self.counts = [0] * len(self.rules)
+        self.min_level = min_level
+        self.max_lines_per_second = max_lines_per_second
+        self.sample_rate = sample_rate
+        self.errors: list[str] = []  # Invalid rules skipped by from_settings
+        self._level_rules: dict[str, int] = {}
+        self._patterns: dict[int, re.Pattern] = {}
+        self._prefixed: list[tuple[str, int]] = []
+        self._unprefixed: list[int] = []
+        for index, rule in enumerate(self.rules):
+            if rule.pattern:
+                self._patterns[index] = re.compile(rule.pattern)
+                prefix = literal_prefix(rule.pattern)
+                if prefix:
+                    self._prefixed.append((prefix, index))
+                else:
+                    self._unprefixed.append(index)
+            elif rule.level:
+                self._level_rules.setdefault(rule.level, index)
+        prefixes = sorted({prefix for prefix, _ in self._prefixed})
+        self._prefilter = (
+            re.compile("|".join(map(re.escape, prefixes))) if prefixes else None
+        )
+        self._window = 0
+        self._window_lines = 0
+        self._window_dropped = 0
+        self.total_dropped = 0
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "IngestFilter":
+        """Creates the filter of the [ingest] settings.
+
+        Invalid rules are skipped, their error messages are kept in errors."""
+        rules = []
+        errors = []
+        for data in settings.get("rules", []):
+            try:
+                rule = IngestRule.from_dict(data)
+                re.compile(rule.pattern)
+            except (ValueError, re.error) as e:
+                errors.append(f"{data.get('pattern', '')!r}: {e}")
+                continue
+            rules.append(rule)
+        ingest = cls(
+            rules,
+            _level_name(settings.get("ui_min_level", "")),
+            int(settings.get("max_ui_lines_per_second", 0)),
+            int(settings.get("ui_sample_rate", 0)),
+        )
+        ingest.errors = errors
+        return ingest
+
+    @property
+    def min_level(self) -> str:
+        return self._min_level
+
+    @min_level.setter
+    def min_level(self, level: str) -> None:
+        self._min_level = level
+        self._min_rank = LEVEL_RANKS.get(level, 0)
+
+    def process(self, text: str, is_stderr: bool = False) -> IngestResult:
+        """Decides if and how a line is shown in the output box."""
+        level = detect_level(text)
+        effective_level = level or ("STDERR" if is_stderr else None)
+        result = IngestResult(True, level)
+        rule_index, span = self._match(text, effective_level)
+        if rule_index is not None:
+            self.counts[rule_index] += 1
+            rule = self.rules[rule_index]
+            if rule.action == "hide":
+                result.show = False
+            elif rule.action == "highlight" and span:
+                result.highlight = (*span, rule.style)
+        if self._min_rank and LEVEL_RANKS.get(effective_level, 0) < self._min_rank:
+            result.show = False
+        if result.show and self.max_lines_per_second:
+            result.show, result.dropped = self._rate_limit()
+        return result
+
+    def summary(self) -> str | None:
+        """Returns a summary of rule matches and rate limited lines of the run."""
+        parts = [
+            f"{rule.label!r}: {count}"
+            for rule, count in zip(self.rules, self.counts)
+            if count
+        ]
+        if self.total_dropped:
+            parts.append(f"rate limited: {self.total_dropped}")
+        return "Ingest summary: " + ", ".join(parts) if parts else None
+
+    def _match(
+        self, text: str, level: str | None
+    ) -> tuple[int | None, tuple[int, int] | None]:
+        candidates = self._unprefixed
+        if self._prefilter is not None and self._prefilter.search(text):
+            candidates = sorted(
+                candidates
+                + [index for prefix, index in self._prefixed if prefix in text]
+            )
+        best: tuple[int, re.Match] | None = None
+        for index in candidates:
+            rule = self.rules[index]
+            if rule.level and rule.level != level:
+                continue
+            match = self._patterns[index].search(text)
+            if match and (best is None or match.start() < best[1].start()):
+                best = index, match
+        if best is not None:
+            return best[0], best[1].span()
+        if level in self._level_rules:
+            return self._level_rules[level], None
+        return None, None
+
+    def _rate_limit(self) -> tuple[bool, int]:
+        """Returns if a line may be shown and how many lines were dropped before."""
+        window = int(time.monotonic())
+        dropped = 0
+        if window != self._window:
+            dropped = self._window_dropped
+            self._window = window
+            self._window_lines = 0
+            self._window_dropped = 0
+        self._window_lines += 1
+        overflow = self._window_lines - self.max_lines_per_second
+        if overflow <= 0 or (self.sample_rate and overflow % self.sample_rate == 0):
+            return True, dropped
+        self._window_dropped += 1
+        self.total_dropped += 1
+        return False, dropped
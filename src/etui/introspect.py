@@ -0,0 +1,294 @@
+"""Introspection of argparse parsers by running the parser construction of a script.
+
+The static extraction (extract_argparse) can't see arguments added in loops, from
+config files or by helper modules. For script folders with introspect enabled, the
+selected script is run with the folder's Python executable by introspect_helper.py
+until it calls parse_args, which is captured instead. Only scripts that create an
+ArgumentParser and call parse_args (or parse_known_args) themselves are run, any other
+script would run to completion. The run is sandboxed as far as possible
+without privileges: its own session, no stdin, limits for CPU time and memory and a
+timeout after which the whole process group is killed. Code of the script up to the
+parse_args call is still executed, so only enable introspection for trusted folders.
+
+Schemas are cached in the user cache directory by the hash of the script and the
+executable, together with the modification times of the helper modules the script
+imported from its folder. A small thread pool refreshes outdated schemas in the
+background, until then the static extraction is used.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from platformdirs import user_cache_dir
+
+from etui.file_utils import ARG_TYPES, ETUI_PATH, Parser, ParserArgument
+from etui.logging import get_logger
+
+SCHEMA_CACHE_PATH = Path(user_cache_dir("etui")) / "schemas"
+HELPER_PATH = ETUI_PATH / "introspect_helper.py"
+HELPER_VERSION = 3  # Increase to invalidate all cached schemas
+INTROSPECT_TIMEOUT = 10.0
+INTROSPECT_WORKERS = 2
+PARSE_METHODS = ("parse_args", "parse_known_args")
+
+
+class IntrospectionError(Exception):
+    pass
+
+
+def script_hash(script_path: Path, executable: Path) -> str:
+    digest = hashlib.sha256(f"{HELPER_VERSION}\0{executable}\0".encode())
+    digest.update(script_path.read_bytes())
+    return digest.hexdigest()
+
+
+def builds_parser(script_path: Path) -> bool:
+    """Returns whether the script creates an ArgumentParser and calls parse_args.
+
+    Checked before a script is introspected, as introspection stops a script only at
+    its parse_args call."""
+    try:
+        tree = ast.parse(script_path.read_bytes())
+    except (OSError, SyntaxError, ValueError):
+        return False
+    creates_parser = calls_parse = False
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Name) and node.id == "ArgumentParser") or (
+            isinstance(node, ast.Attribute) and node.attr == "ArgumentParser"
+        ):
+            creates_parser = True
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in PARSE_METHODS
+        ):
+            calls_parse = True
+    return creates_parser and calls_parse
+
+
+def _parsers_from_json(parsers: list[dict], map_types: bool) -> dict[str, Parser]:
+    """Creates the parsers of the helper's output or of a cache entry.
+
+    map_types maps the type names of the helper to argument types, the cache stores
+    the mapped ones."""
+    result = {}
+    for parser in parsers:
+        args = []
+        for arg in parser["args"]:
+            if map_types:
+                arg["type"] = ARG_TYPES.get(arg["type"], "str")
+            args.append(ParserArgument(**arg))
+        result[parser["name"]] = Parser(parser["name"], args, parser["command"])
+    return result
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def introspect_script(
+    script_path: Path,
+    executable: Path,
+    timeout: float = INTROSPECT_TIMEOUT,
+    processes: set[subprocess.Popen] | None = None,
+) -> tuple[dict[str, Parser], list[str]]:
+    """Runs the parser construction of a script in a sandboxed subprocess.
+
+    Returns the parsers and the files of the helper modules the script imported. The
+    subprocess is added to processes while it runs, so it can be killed on shutdown."""
+    processes = processes if processes is not None else set()
+    # Relative to the working directory of etui like for runs, not to the script's
+    executable = Path(executable).absolute()
+    script_path = script_path.absolute()
+    with tempfile.TemporaryDirectory(prefix="etui-introspect-") as temp_dir:
+        output_path = Path(temp_dir) / "schema.json"
+        process = subprocess.Popen(
+            [
+                str(executable),
+                str(HELPER_PATH),
+                str(script_path),
+                str(output_path),
+                str(int(timeout) + 1),
+            ],
+            cwd=script_path.parent,
+            env=os.environ | {"ETUI_INTROSPECTION": "1"},
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        processes.add(process)
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(process)
+            process.communicate()
+            raise IntrospectionError(f"Timeout after {timeout:.0f} s")
+        finally:
+            _kill_group(process)  # Processes the script started
+            processes.discard(process)
+        if process.returncode < 0:
+            raise IntrospectionError(f"Killed by signal {-process.returncode}")
+        if not output_path.exists():
+            lines = stderr.decode(errors="replace").strip().splitlines()
+            raise IntrospectionError(lines[-1] if lines else "No schema written")
+        result = json.loads(output_path.read_text())
+    if "error" in result:
+        raise IntrospectionError(result["error"])
+    return _parsers_from_json(result["parsers"], map_types=True), result["modules"]
+
+
+class SchemaCache:
+    """Introspected schemas on disk, see the module docstring."""
+
+    def __init__(self, path: Path = SCHEMA_CACHE_PATH) -> None:
+        self.path = path
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Parser] | None:
+        try:
+            entry = json.loads(self._entry_path(key).read_text())
+        except (OSError, ValueError):
+            return None
+        for module, mtime_ns in entry["modules"].items():
+            try:
+                if os.stat(module).st_mtime_ns != mtime_ns:
+                    return None
+            except OSError:
+                return None
+        return _parsers_from_json(entry["parsers"], map_types=False)
+
+    def put(self, key: str, parsers: dict[str, Parser], modules: list[str]) -> None:
+        entry = {
+            "parsers": [
+                {
+                    "name": parser.name,
+                    "command": parser.command,
+                    "args": [vars(arg) for arg in parser.args],
+                }
+                for parser in parsers.values()
+            ],
+            "modules": {module: os.stat(module).st_mtime_ns for module in modules},
+        }
+        self.path.mkdir(parents=True, exist_ok=True)
+        temp_path = self._entry_path(key).with_suffix(".tmp")
+        temp_path.write_text(json.dumps(entry))
+        os.replace(temp_path, self._entry_path(key))
+
+
+class Introspector:
+    """Refreshes introspected schemas with a small pool of worker threads.
+
+    Each worker waits for one sandboxed subprocess, so the pool limits how many
+    scripts are run at the same time."""
+
+    def __init__(
+        self, cache: SchemaCache | None = None, workers: int = INTROSPECT_WORKERS
+    ) -> None:
+        self.cache = cache or SchemaCache()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="introspect")
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()  # refresh is called from the UI and API threads
+        self._failed: dict[str, str] = {}  # Keys of scripts that can't be introspected
+        self._processes: set[subprocess.Popen] = set()
+
+    def cached(self, script_path: Path, executable: Path) -> dict[str, Parser] | None:
+        """Returns the introspected schema if it is up to date."""
+        try:
+            key = script_hash(script_path, executable)
+        except OSError:
+            return None
+        return self.cache.get(key)
+
+    def failure(self, script_path: Path, executable: Path) -> str | None:
+        """Returns why the script in its current version can't be introspected."""
+        try:
+            return self._failed.get(script_hash(script_path, executable))
+        except OSError:
+            return None
+
+    def refresh(
+        self,
+        script_path: Path,
+        executable: Path,
+        callback: Callable[[Path, dict[str, Parser] | None, str | None], None]
+        | None = None,
+    ) -> Future | None:
+        """Introspects a script in the pool, unless its cached schema is up to date.
+
+        The callback is called from the worker thread with the script, the parsers and
+        an error message. Returns None if nothing has to be done, also for scripts that
+        don't build a parser (see builds_parser)."""
+        if not builds_parser(script_path):
+            return None
+        try:
+            key = script_hash(script_path, executable)
+        except OSError:
+            return None
+        if key in self._failed or self.cache.get(key) is not None:
+            return None
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(
+                    self._introspect, key, script_path, executable
+                )
+                self._pending[key] = future
+        if callback is not None:
+
+            def on_done(done: Future) -> None:
+                if not done.cancelled():
+                    callback(script_path, *done.result())
+
+            future.add_done_callback(on_done)
+        return future
+
+    def _introspect(
+        self, key: str, script_path: Path, executable: Path
+    ) -> tuple[dict[str, Parser] | None, str | None]:
+        try:
+            parsers, modules = introspect_script(
+                script_path, executable, processes=self._processes
+            )
+            self.cache.put(key, parsers, modules)
+            return parsers, None
+        except (IntrospectionError, OSError, ValueError, KeyError, TypeError) as e:
+            get_logger().warning("Introspection of %s failed: %s", script_path, e)
+            self._failed[key] = str(e)
+            return None, str(e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def parsers(self, script_path: Path, executable: Path) -> dict[str, Parser] | None:
+        """Returns the introspected schema, introspecting the script if necessary.
+
+        Blocks until the subprocess finished, returns None if introspection failed."""
+        cached = self.cached(script_path, executable)
+        if cached is not None:
+            return cached
+        future = self.refresh(script_path, executable)
+        return future.result()[0] if future is not None else None
+
+    def shutdown(self) -> None:
+        """Cancels waiting refreshes and kills running subprocesses."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for process in list(self._processes):
+            _kill_group(process)
+
+
+INTROSPECTOR = Introspector()
@@ -0,0 +1,138 @@
+"""Captures the argparse parser of a script by running it until it parses arguments.
+
+Run by etui.introspect with the Python executable of the script folder, so it must not
+import etui and has to work with older Python versions:
+
+        python introspect_helper.py <script> <output file> <cpu seconds>
+
+ArgumentParser.parse_args and parse_known_args are patched to stop the script instead
+of parsing, the captured parser is written to the output file as JSON. Nothing after
+the parse_args call is executed.
+"""
+
+import argparse
+import json
+import os
+import runpy
+import sys
+
+TYPE_NAMES = ("int", "float", "str", "Path")
+ACTIONS = {
+    "_StoreTrueAction": "store_true",
+    "_StoreFalseAction": "store_false",
+    "_StoreConstAction": "store_const",
+    "_AppendAction": "append",
+    "_AppendConstAction": "append_const",
+    "_CountAction": "count",
+    "BooleanOptionalAction": "boolean_optional",
+}
+MEMORY_LIMIT = 2 * 1024**3
+
+
+class ParserCaptured(BaseException):
+    """Raised instead of parsing, a BaseException to pass `except Exception`."""
+
+    def __init__(self, parser):
+        super().__init__()
+        self.parser = parser
+
+
+def capture(self, *args, **kwargs):
+    raise ParserCaptured(self)
+
+
+def limit_resources(cpu_seconds):
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def describe_argument(action):
+    if action.option_strings:
+        long_names = [name for name in action.option_strings if name.startswith("--")]
+        name = (long_names or action.option_strings)[0]
+    else:
+        name = action.dest
+    default = action.default
+    kind = ACTIONS.get(type(action).__name__)
+    # Flags have no default to show, except for the --x/--no-x state
+    if (
+        default is None
+        or default == argparse.SUPPRESS
+        or (action.nargs == 0 and kind != "boolean_optional")
+    ):
+        default = None
+    else:
+        default = str(default)
+    type_name = getattr(action.type, "__name__", "str")
+    return {
+        "name": name,
+        "required": bool(action.required),
+        "default": default,
+        "action": kind,
+        "type": type_name if type_name in TYPE_NAMES else "str",
+        "help": action.help or "",
+        "choices": [str(choice) for choice in action.choices]
+        if action.choices
+        else None,
+        # Flags (nargs 0, e.g. count) take no values, like in the static extraction
+        "nargs": None if action.nargs in (None, 0) else str(action.nargs),
+    }
+
+
+def describe_parser(parser, name, command, parsers):
+    """Adds the parser and its subcommand parsers to parsers."""
+    args = []
+    parsers.append({"name": name, "command": command, "args": args})
+    for action in parser._actions:
+        if isinstance(action, (argparse._HelpAction, argparse._VersionAction)):
+            continue
+        if isinstance(action, argparse._SubParsersAction):
+            for sub_name, sub_parser in action.choices.items():
+                describe_parser(sub_parser, sub_name, sub_name, parsers)
+            continue
+        if action.help == argparse.SUPPRESS:
+            continue
+        args.append(describe_argument(action))
+
+
+def local_modules(script_dir):
+    """Files of modules imported from the folder of the script, e.g. helper modules."""
+    files = []
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.abspath(path).startswith(script_dir + os.sep):
+            files.append(os.path.abspath(path))
+    return sorted(set(files))
+
+
+def main():
+    script, output_path, cpu_seconds = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    limit_resources(cpu_seconds)
+    script_dir = os.path.dirname(os.path.abspath(script))
+    sys.path[0] = script_dir  # Instead of the folder of this helper
+    sys.argv = [script]
+    argparse.ArgumentParser.parse_args = capture
+    argparse.ArgumentParser.parse_known_args = capture
+    result = {"parsers": [], "modules": []}
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except ParserCaptured as captured:
+        describe_parser(captured.parser, "parser", None, result["parsers"])
+    except SystemExit:
+        pass
+    except Exception as e:  # noqa: BLE001 - any error of the script is reported
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["modules"] = [
+        path for path in local_modules(script_dir) if path != os.path.abspath(script)
+    ]
+    with open(output_path, "w") as file:
+        json.dump(result, file)
+
+
+if __name__ == "__main__":
+    main()
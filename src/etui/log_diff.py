@@ -0,0 +1,325 @@
+"""Diff of two run logs, which works on line hashes instead of the file contents.
+
+Both logs are streamed once to build an index with the offset and the hash of every
+line. The timestamps added by format_line are removed before hashing, so two runs with
+the same output are equal. The diff itself is Myers' algorithm in linear space (divide
+and conquer on the middle snake), common prefixes and suffixes are skipped beforehand,
+which is the largest part of two runs of the same script. Only the lines of the hunks
+that are displayed are read from the files again.
+"""
+
+import re
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+
+TIMESTAMP_PREFIX = re.compile(rb"\[\d\d:\d\d:\d\d\] ")
+CONTEXT_LINES = 3
+DIFF_TIMEOUT = 30.0  # Seconds, afterwards remaining regions count as replaced
+PREFIX_CHUNK = 4096
+
+
+def normalize_line(line: bytes) -> bytes:
+    """Removes line ending and the timestamp of format_line from a log line."""
+    match = TIMESTAMP_PREFIX.match(line)
+    if match:
+        line = line[match.end() :]
+    return line.rstrip(b"\r\n")
+
+
+class LineIndex:
+    """Offsets and hashes of the (normalized) lines of a file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.offsets = array("Q")
+        self.hashes = array("q")
+        with open(path, "rb") as file:
+            offset = 0
+            for line in file:
+                self.offsets.append(offset)
+                self.hashes.append(hash(normalize_line(line)))
+                offset += len(line)
+        self.offsets.append(offset)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def read_lines(self, start: int, stop: int) -> list[str]:
+        """Reads the lines [start, stop) from the file."""
+        if start >= stop:
+            return []
+        with open(self.path, "rb") as file:
+            file.seek(self.offsets[start])
+            data = file.read(self.offsets[stop] - self.offsets[start])
+        lines = data.split(b"\n")[: stop - start]
+        return [line.rstrip(b"\r").decode(errors="replace") for line in lines]
+
+
+@dataclass
+class Opcode:
+    """Like the opcodes of difflib: a[a_start:a_stop] should be b[b_start:b_stop]."""
+
+    tag: str  # "equal", "replace", "delete" or "insert"
+    a_start: int
+    a_stop: int
+    b_start: int
+    b_stop: int
+
+
+def _common_prefix(a: array, b: array, a_lo: int, a_hi: int, b_lo: int, b_hi: int):
+    length = min(a_hi - a_lo, b_hi - b_lo)
+    count = 0
+    # Compare whole chunks in C first, then find the exact end line by line
+    while count + PREFIX_CHUNK <= length and (
+        a[a_lo + count : a_lo + count + PREFIX_CHUNK]
+        == b[b_lo + count : b_lo + count + PREFIX_CHUNK]
+    ):
+        count += PREFIX_CHUNK
+    while count < length and a[a_lo + count] == b[b_lo + count]:
+        count += 1
+    return count
+
+
+def _common_suffix(a: array, b: array, a_lo: int, a_hi: int, b_lo: int, b_hi: int):
+    length = min(a_hi - a_lo, b_hi - b_lo)
+    count = 0
+    while count + PREFIX_CHUNK <= length and (
+        a[a_hi - count - PREFIX_CHUNK : a_hi - count]
+        == b[b_hi - count - PREFIX_CHUNK : b_hi - count]
+    ):
+        count += PREFIX_CHUNK
+    while count < length and a[a_hi - count - 1] == b[b_hi - count - 1]:
+        count += 1
+    return count
+
+
+def _middle_snake(
+    a: array, b: array, a_lo: int, a_hi: int, b_lo: int, b_hi: int, deadline: float
+) -> tuple[int, int] | None:
+    """Finds the split point of the shortest edit script of two regions.
+
+    Searches forward from the start and backward from the end at the same time until
+    both paths overlap. Returns the split point relative to the region starts, or None
+    if the regions have nothing in common or the deadline is exceeded."""
+    n, m = a_hi - a_lo, b_hi - b_lo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    forward = array("q", [-1]) * v_length
+    backward = array("q", [-1]) * v_length
+    forward[v_offset + 1] = 0
+    backward[v_offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+    for d in range(max_d):
+        if time.monotonic() > deadline:
+            return None
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (
+                k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]
+            ):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a_lo + x1] == b[b_lo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if (
+                    0 <= k2_offset < v_length
+                    and backward[k2_offset] != -1
+                    and x1 >= n - backward[k2_offset]
+                ):
+                    return x1, y1
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (
+                k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]
+            ):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a_hi - x2 - 1] == b[b_hi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+    return None
+
+
+def matching_blocks(
+    a: array, b: array, timeout: float = DIFF_TIMEOUT
+) -> list[tuple[int, int, int]]:
+    """Returns sorted (a_start, b_start, length) blocks of equal lines."""
+    deadline = time.monotonic() + timeout
+    blocks = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        prefix = _common_prefix(a, b, a_lo, a_hi, b_lo, b_hi)
+        if prefix:
+            blocks.append((a_lo, b_lo, prefix))
+            a_lo += prefix
+            b_lo += prefix
+        suffix = _common_suffix(a, b, a_lo, a_hi, b_lo, b_hi)
+        if suffix:
+            blocks.append((a_hi - suffix, b_hi - suffix, suffix))
+            a_hi -= suffix
+            b_hi -= suffix
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        split = _middle_snake(a, b, a_lo, a_hi, b_lo, b_hi, deadline)
+        if split is None:
+            continue
+        x, y = split
+        regions.append((a_lo, a_lo + x, b_lo, b_lo + y))
+        regions.append((a_lo + x, a_hi, b_lo + y, b_hi))
+    blocks.sort()
+    return blocks
+
+
+def diff_opcodes(a: array, b: array, timeout: float = DIFF_TIMEOUT) -> list[Opcode]:
+    """Returns the opcodes that turn sequence a into sequence b."""
+    opcodes = []
+    i = j = 0
+    for a_start, b_start, length in [
+        *matching_blocks(a, b, timeout),
+        (len(a), len(b), 0),
+    ]:
+        if i < a_start and j < b_start:
+            opcodes.append(Opcode("replace", i, a_start, j, b_start))
+        elif i < a_start:
+            opcodes.append(Opcode("delete", i, a_start, j, b_start))
+        elif j < b_start:
+            opcodes.append(Opcode("insert", i, a_start, j, b_start))
+        if length:
+            # Adjacent blocks from prefix/suffix trimming are merged
+            if opcodes and opcodes[-1].tag == "equal" and opcodes[-1].a_stop == a_start:
+                opcodes[-1].a_stop += length
+                opcodes[-1].b_stop += length
+            else:
+                opcodes.append(
+                    Opcode(
+                        "equal", a_start, a_start + length, b_start, b_start + length
+                    )
+                )
+        i, j = a_start + length, b_start + length
+    return opcodes
+
+
+def group_hunks(
+    opcodes: list[Opcode], context: int = CONTEXT_LINES
+) -> list[list[Opcode]]:
+    """Groups opcodes into hunks with some equal lines around each change.
+
+    Works like SequenceMatcher.get_grouped_opcodes of difflib."""
+    if not opcodes:
+        return []
+    codes = list(opcodes)
+    first, last = codes[0], codes[-1]
+    if first.tag == "equal":
+        codes[0] = Opcode(
+            "equal",
+            max(first.a_start, first.a_stop - context),
+            first.a_stop,
+            max(first.b_start, first.b_stop - context),
+            first.b_stop,
+        )
+    if last.tag == "equal":
+        codes[-1] = Opcode(
+            "equal",
+            last.a_start,
+            min(last.a_stop, last.a_start + context),
+            last.b_start,
+            min(last.b_stop, last.b_start + context),
+        )
+    hunks = []
+    hunk: list[Opcode] = []
+    for opcode in codes:
+        if opcode.tag == "equal" and opcode.a_stop - opcode.a_start > 2 * context:
+            hunk.append(
+                Opcode(
+                    "equal",
+                    opcode.a_start,
+                    opcode.a_start + context,
+                    opcode.b_start,
+                    opcode.b_start + context,
+                )
+            )
+            hunks.append(hunk)
+            hunk = [
+                Opcode(
+                    "equal",
+                    opcode.a_stop - context,
+                    opcode.a_stop,
+                    opcode.b_stop - context,
+                    opcode.b_stop,
+                )
+            ]
+            continue
+        hunk.append(opcode)
+    if hunk and not (len(hunk) == 1 and hunk[0].tag == "equal"):
+        hunks.append(hunk)
+    return hunks
+
+
+class LogDiff:
+    """Diff of two log files, hunks are read from the files on demand."""
+
+    def __init__(self, old_path: Path, new_path: Path) -> None:
+        self.old = LineIndex(old_path)
+        self.new = LineIndex(new_path)
+        self.opcodes = diff_opcodes(self.old.hashes, self.new.hashes)
+        self.hunks = group_hunks(self.opcodes)
+
+    @property
+    def changed_lines(self) -> tuple[int, int]:
+        """Number of removed and added lines."""
+        removed = added = 0
+        for opcode in self.opcodes:
+            if opcode.tag != "equal":
+                removed += opcode.a_stop - opcode.a_start
+                added += opcode.b_stop - opcode.b_start
+        return removed, added
+
+    def hunk_lines(self, hunk: list[Opcode]) -> list[tuple[str, str]]:
+        """Returns (marker, text) tuples of a hunk, marker is " ", "-" or "+"."""
+        lines = []
+        for opcode in hunk:
+            if opcode.tag == "equal":
+                lines += [
+                    (" ", line)
+                    for line in self.new.read_lines(opcode.b_start, opcode.b_stop)
+                ]
+                continue
+            lines += [
+                ("-", line)
+                for line in self.old.read_lines(opcode.a_start, opcode.a_stop)
+            ]
+            lines += [
+                ("+", line)
+                for line in self.new.read_lines(opcode.b_start, opcode.b_stop)
+            ]
+        return lines
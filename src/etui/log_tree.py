@@ -0,0 +1,257 @@
+"""Directory tree of the LogViewer, which scales to folders with many run logs.
+
+Logs named by create_log_file are grouped by script and date instead of being listed
+one by one. Directories are read with os.scandir in a worker, only when a node is
+expanded, and again only if the modification time of the directory changed. Nodes
+with many children are paginated, the rest is added on selecting the "more" node.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+from rich.text import Text
+from textual.message import Message
+from textual.widgets import Tree
+from textual.widgets.tree import TreeNode
+
+from etui.logging import parse_log_name
+
+PAGE_SIZE = 100
+GROUP_KINDS = ("directory", "script", "date")
+
+
+@dataclass
+class LogDirectory:
+    """Content of one directory, run logs are grouped by script and date."""
+
+    path: Path
+    mtime_ns: int
+    directories: list[str]
+    scripts: dict[str, dict[str, list[str]]]  # Script -> date -> names, newest first
+    files: list[str]  # Files that are not named like run logs
+
+
+def scan_directory(path: Path) -> LogDirectory:
+    """Lists a directory without calling stat on every entry."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    directories = []
+    files = []
+    scripts: dict[str, dict[str, list[str]]] = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                directories.append(entry.name)
+                continue
+            parsed = parse_log_name(entry.name)
+            if parsed is None:
+                files.append(entry.name)
+                continue
+            script, date, _ = parsed
+            scripts.setdefault(script, {}).setdefault(date, []).append(entry.name)
+    directories.sort(key=str.lower)
+    files.sort(key=str.lower)
+    for dates in scripts.values():
+        for names in dates.values():
+            names.sort(reverse=True)
+    return LogDirectory(
+        path,
+        mtime_ns,
+        directories,
+        {
+            script: dict(sorted(scripts[script].items(), reverse=True))
+            for script in sorted(scripts, key=str.lower)
+        },
+        files,
+    )
+
+
+class DirectoryCache:
+    """Scanned directories and stat results of their files.
+
+    A directory is only scanned again if its modification time changed, which also
+    drops the stat results of its files."""
+
+    def __init__(self) -> None:
+        self._directories: dict[Path, LogDirectory] = {}
+        self._stats: dict[Path, os.stat_result | None] = {}
+
+    def directory(self, path: Path) -> LogDirectory:
+        cached = self._directories.get(path)
+        if cached is not None and os.stat(path).st_mtime_ns == cached.mtime_ns:
+            return cached
+        directory = scan_directory(path)
+        self._directories[path] = directory
+        if cached is not None:
+            self._stats = {
+                file: stat for file, stat in self._stats.items() if file.parent != path
+            }
+        return directory
+
+    def stat(self, path: Path) -> os.stat_result | None:
+        if path not in self._stats:
+            try:
+                self._stats[path] = os.stat(path)
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def clear(self) -> None:
+        self._directories.clear()
+        self._stats.clear()
+
+
+@dataclass
+class LogEntry:
+    kind: str  # "directory", "script", "date", "file" or "more"
+    path: Path  # The directory the entry belongs to, for files the file itself
+    script: str = ""
+    date: str = ""
+    offset: int = 0  # For "more" entries: index of the next child to add
+    source: LogDirectory | None = None  # The scan the children were added from
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class LogTree(Tree[LogEntry]):
+    """Lazy, paginated tree of a log directory."""
+
+    BINDINGS = [("r", "reload", "Reload")]
+
+    class FileSelected(Message):
+        """Posted when a file is selected in the tree."""
+
+        def __init__(self, path: Path) -> None:
+            super().__init__()
+            self.path = path
+
+    def __init__(self, path: Path | str, *, id: str | None = None) -> None:
+        path = Path(path)
+        super().__init__(str(path), LogEntry("directory", path), id=id)
+        self.cache = DirectoryCache()
+
+    def on_mount(self) -> None:
+        self.root.expand()  # Loads the root directory like any other expanded node
+
+    def action_reload(self) -> None:
+        """Scans all directories again, e.g. to show logs of new runs."""
+        self.cache.clear()
+        self.root.data.source = None
+        self._load_page(self.root, 0)
+
+    def _on_tree_node_expanded(self, event: Tree.NodeExpanded[LogEntry]) -> None:
+        event.stop()
+        if event.node.data.kind in GROUP_KINDS:
+            self._load_page(event.node, 0)
+
+    def _on_tree_node_selected(self, event: Tree.NodeSelected[LogEntry]) -> None:
+        event.stop()
+        entry = event.node.data
+        if entry.kind == "file":
+            self.post_message(self.FileSelected(entry.path))
+        elif entry.kind == "more":
+            self._load_page(event.node.parent, entry.offset)
+
+    def _load_page(self, node: TreeNode[LogEntry], start: int) -> None:
+        self.run_worker(
+            partial(self._read_page, node, start), thread=True, group="log-tree"
+        )
+
+    def _read_page(self, node: TreeNode[LogEntry], start: int) -> None:
+        """Collects the children of a node from start on, runs in a thread."""
+        entry = node.data
+        try:
+            directory = self.cache.directory(entry.path)
+        except OSError as e:
+            self.app.call_from_thread(self.notify, str(e), severity="error")
+            return
+        if start == 0 and entry.source is directory:
+            return  # Nothing changed since the children were added
+        if entry.kind == "directory":
+            children = [("directory", name) for name in directory.directories]
+            children += [("script", script) for script in directory.scripts]
+            children += [("file", name) for name in directory.files]
+        elif entry.kind == "script":
+            children = [
+                ("date", date) for date in directory.scripts.get(entry.script, {})
+            ]
+        else:
+            dates = directory.scripts.get(entry.script, {})
+            children = [("file", name) for name in dates.get(entry.date, [])]
+        page = [
+            self._child_entry(entry, directory, kind, name)
+            for kind, name in children[start : start + PAGE_SIZE]
+        ]
+        self.app.call_from_thread(
+            self._add_page, node, directory, page, start, len(children)
+        )
+
+    def _child_entry(
+        self, parent: LogEntry, directory: LogDirectory, kind: str, name: str
+    ) -> tuple[LogEntry, Text]:
+        if kind == "directory":
+            return LogEntry(kind, parent.path / name), Text(name, style="bold")
+        if kind == "script":
+            count = sum(len(names) for names in directory.scripts[name].values())
+            return (
+                LogEntry(kind, parent.path, script=name),
+                Text.assemble((name, "bold"), (f" ({count})", "dim")),
+            )
+        if kind == "date":
+            count = len(directory.scripts[parent.script][name])
+            return (
+                LogEntry(kind, parent.path, script=parent.script, date=name),
+                Text.assemble(
+                    f"{name[:4]}-{name[4:6]}-{name[6:]}", (f" ({count})", "dim")
+                ),
+            )
+        path = parent.path / name
+        parsed = parse_log_name(name)
+        label = Text(
+            f"{parsed[2][:2]}:{parsed[2][2:4]}:{parsed[2][4:]}" if parsed else name
+        )
+        stat = self.cache.stat(path)
+        if stat is not None:
+            label.append(f" {format_size(stat.st_size)}", style="dim")
+        return LogEntry(kind, path, parent.script, parent.date), label
+
+    def _add_page(
+        self,
+        node: TreeNode[LogEntry],
+        directory: LogDirectory,
+        page: list[tuple[LogEntry, Text]],
+        start: int,
+        total: int,
+    ) -> None:
+        children = node.children
+        has_more = bool(children) and children[-1].data.kind == "more"
+        if start:
+            # The page was requested twice or the node was reloaded in the meantime
+            if not has_more or children[-1].data.offset != start:
+                return
+            children[-1].remove()
+        else:
+            node.remove_children()
+        node.data.source = directory
+        for entry, label in page:
+            if entry.kind == "file":
+                node.add_leaf(label, entry)
+            else:
+                node.add(label, entry)
+        stop = start + len(page)
+        if stop < total:
+            node.add_leaf(
+                Text(f"… {total - stop} more", style="dim italic"),
+                LogEntry("more", node.data.path, offset=stop),
+            )
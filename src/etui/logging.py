@@ -1,6 +1,9 @@
 """Logger for the whole project."""
 
+import glob
+import itertools
 import logging
+import re
 import time
 from datetime import datetime
 from pathlib import Path
@@ -16,21 +19,58 @@ LOG_COLORS = {
     "CRITICAL": "bold red on black",
     "STDERR": "red",
 }
+# Other names of levels, e.g. of Java or Go loggers
+LEVEL_ALIASES = {"WARN": "WARNING"}
+# The full names come first, so WARNING isn't found as WARN
+LEVEL_PATTERN = re.compile(
+    "|".join([*(level for level in LOG_COLORS if level != "STDERR"), *LEVEL_ALIASES])
+)
 
+_timestamp_second = -1
+_timestamp = ""
 
-def format_line(text: str, is_stderr=False) -> Text:
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    level = None
-    for lvl in LOG_COLORS:
-        if text.startswith(lvl):
-            level = lvl
-            break
+
+def current_timestamp() -> str:
+    """Returns the current time as HH:MM:SS, formatted only once per second."""
+    global _timestamp_second, _timestamp
+    now = time.time()
+    if int(now) != _timestamp_second:
+        _timestamp_second = int(now)
+        _timestamp = datetime.fromtimestamp(now).strftime("%H:%M:%S")
+    return _timestamp
+
+
+def detect_level(text: str) -> str | None:
+    """Returns the log level a line starts with, if any."""
+    match = LEVEL_PATTERN.match(text)
+    if not match:
+        return None
+    return LEVEL_ALIASES.get(match.group(), match.group())
+
+
+def format_line(
+    text: str,
+    is_stderr=False,
+    level: str | None = None,
+    highlight: tuple[int, int, str] | None = None,
+) -> Text:
+    """Formats an output line with timestamp and level color.
+
+    highlight is an optional (start, end, style) span of text to style additionally."""
+    level = level or detect_level(text)
     style = LOG_COLORS.get(level, LOG_COLORS["STDERR"] if is_stderr else None)
-    line = Text(f"[{timestamp}] ", style="dim")
+    line = Text(f"[{current_timestamp()}] ", style="dim")
+    offset = len(line)
     line.append(text.rstrip(), style=style)
+    if highlight:
+        start, end, highlight_style = highlight
+        line.stylize(highlight_style, offset + start, offset + end)
     return line
 
 
+LOG_NAME_PATTERN = re.compile(r"(?P<script>.+)_(?P<date>\d{8})_(?P<time>\d{6})\.log")
+
+
 def create_log_file(script_path: Path, logs_root: Path = LOG_PATH) -> Path:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     name = script_path.stem
@@ -39,6 +79,45 @@ def create_log_file(script_path: Path, logs_root: Path = LOG_PATH) -> Path:
     return log_dir / f"{name}_{timestamp}.log"
 
 
+def create_matrix_log_dir(script_path: Path, logs_root: Path = LOG_PATH) -> Path:
+    """Creates the parent directory of the instance logs of a matrix run."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"{script_path.stem}_{timestamp}_matrix"
+    log_dir = logs_root / script_path.parent.name
+    log_dir.mkdir(parents=True, exist_ok=True)
+    for number in itertools.count(1):
+        matrix_dir = log_dir / (name if number == 1 else f"{name}{number}")
+        try:
+            matrix_dir.mkdir()
+            return matrix_dir
+        except FileExistsError:  # Another matrix run of the script in this second
+            continue
+
+
+def parse_log_name(name: str) -> tuple[str, str, str] | None:
+    """Returns (script name, date, time) of a log file named by create_log_file."""
+    match = LOG_NAME_PATTERN.fullmatch(name)
+    if not match:
+        return None
+    return match["script"], match["date"], match["time"]
+
+
+def previous_run_log(log_path: Path) -> Path | None:
+    """Returns the log of the run of the same script before the given one."""
+    parsed = parse_log_name(log_path.name)
+    if not parsed:
+        return None
+    script = parsed[0]
+    previous = None
+    for path in log_path.parent.glob(f"{glob.escape(script)}_*.log"):
+        path_parsed = parse_log_name(path.name)
+        if not path_parsed or path_parsed[0] != script or path.name >= log_path.name:
+            continue
+        if previous is None or path.name > previous.name:
+            previous = path
+    return previous
+
+
 def get_logger(log_level: int = logging.INFO) -> logging.Logger:
     logger = logging.getLogger("etui")
     logger.setLevel(log_level)
@@ -0,0 +1,431 @@
+"""Matrix runs: one script run for every combination of values of some arguments.
+
+A matrix is entered in the ScriptLauncher as `<argument>=<values>` entries separated by
+semicolons, e.g. `--customer=@customers.csv; --region=eu,us; --retries=1..3`. Values
+are a comma separated list, which can contain integer ranges `start..end[..step]`
+(inclusive), or `@file.csv[:column]` for the values of a CSV column. Without a column,
+the column named like the argument is used, otherwise the first one.
+
+The cartesian product of all values is run with at most `concurrency` instances at a
+time. Every instance is a normal run of the RunManager, its log is written to a parent
+directory of the matrix run, together with a summary (matrix.json) once all instances
+finished.
+"""
+
+import asyncio
+import csv
+import itertools
+import json
+import math
+import re
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from textual.app import ComposeResult
+from textual.containers import Horizontal
+from textual.screen import Screen
+from textual.widgets import (
+    Button,
+    DataTable,
+    Footer,
+    Header,
+    ProgressBar,
+    RichLog,
+    Static,
+)
+
+from etui.config import ScriptFolder
+from etui.logging import create_matrix_log_dir
+from etui.runs import RunManager, ScriptRun, build_command
+
+MATRIX_DEFAULTS = {"concurrency": 4, "max_instances": 1000}
+SUMMARY_FILE = "matrix.json"
+RANGE_PATTERN = re.compile(r"(-?\d+)\.\.(-?\d+)(?:\.\.(\d+))?")
+REFRESH_INTERVAL = 0.5
+SLOWEST_COUNT = 5
+
+
+def parse_values(spec: str, name: str, base_path: Path) -> list[str]:
+    """Returns the values of one matrix entry, see the module docstring."""
+    if spec.startswith("@"):
+        file_name, _, column = spec[1:].partition(":")
+        return read_csv_column(base_path / file_name.strip(), column.strip(), name)
+    values = []
+    for part in spec.split(","):
+        part = part.strip()
+        match = RANGE_PATTERN.fullmatch(part)
+        if match is None:
+            if part:
+                values.append(part)
+            continue
+        start, end, step = int(match[1]), int(match[2]), int(match[3] or 1)
+        if step == 0:
+            raise ValueError(f"{name}: the step of {part} must not be 0")
+        if end < start:
+            step = -step
+        values.extend(
+            str(value) for value in range(start, end + step // abs(step), step)
+        )
+    if not values:
+        raise ValueError(f"{name}: no values")
+    return values
+
+
+def read_csv_column(path: Path, column: str, name: str) -> list[str]:
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        columns = reader.fieldnames or []
+        if not column:
+            # The column named like the argument, e.g. customer_id for --customer-id
+            candidates = (name.lstrip("-"), name.lstrip("-").replace("-", "_"))
+            column = next((c for c in candidates if c in columns), None)
+            column = column or (columns[0] if columns else "")
+        if column not in columns:
+            raise ValueError(f"{name}: {path.name} has no column {column!r}")
+        values = [value for row in reader if (value := (row[column] or "").strip())]
+    if not values:
+        raise ValueError(f"{name}: no values in column {column!r} of {path.name}")
+    return values
+
+
+def parse_matrix(text: str, base_path: Path) -> dict[str, list[str]]:
+    """Parses the matrix entries, relative CSV paths start at base_path.
+
+    Raises ValueError (or OSError for unreadable CSV files) if the matrix is invalid."""
+    matrix = {}
+    for entry in text.split(";"):
+        if not entry.strip():
+            continue
+        name, separator, spec = entry.partition("=")
+        name, spec = name.strip(), spec.strip()
+        if not separator or not name or not spec:
+            raise ValueError(
+                f"Expected <argument>=<values> instead of {entry.strip()!r}"
+            )
+        if name in matrix:
+            raise ValueError(f"{name} is in the matrix twice")
+        matrix[name] = parse_values(spec, name, base_path)
+    if not matrix:
+        raise ValueError("The matrix is empty")
+    return matrix
+
+
+def matrix_size(matrix: dict[str, list[str]]) -> int:
+    return math.prod(len(values) for values in matrix.values())
+
+
+def expand_matrix(matrix: dict[str, list[str]]) -> list[dict[str, str]]:
+    """Returns the cartesian product of the values, the last argument varies fastest."""
+    names = list(matrix)
+    return [
+        dict(zip(names, combination))
+        for combination in itertools.product(*matrix.values())
+    ]
+
+
+@dataclass
+class MatrixInstance:
+    """One combination of the matrix and its latest run."""
+
+    index: int  # Starts at 1
+    values: dict[str, str]
+    args: list[str]
+    run: ScriptRun | None = None
+    attempts: int = 0
+    ended_at: float | None = None
+    cancelled: bool = False  # Stopped before it was started
+
+    @property
+    def status(self) -> str:
+        if self.run is None:
+            return "cancelled" if self.cancelled else "queued"
+        if self.ended_at is None:
+            return "running"
+        return "passed" if self.run.return_code == 0 else "failed"
+
+    @property
+    def duration(self) -> float | None:
+        if self.run is None or self.run.started_at is None:
+            return None
+        return (self.ended_at or time.time()) - self.run.started_at
+
+    @property
+    def label(self) -> str:
+        return " ".join(f"{name}={value}" for name, value in self.values.items())
+
+
+class MatrixRun:
+    """Runs a script for every instance of a matrix, a limited number at a time.
+
+    Instances wait for the semaphore in their order, so they are started in order.
+    Listeners are called with an instance whenever it is started or finished."""
+
+    def __init__(
+        self,
+        runs: RunManager,
+        folder: ScriptFolder,
+        script_path: Path,
+        instances: list[MatrixInstance],
+        concurrency: int = MATRIX_DEFAULTS["concurrency"],
+        log_dir: Path | None = None,
+        **run_kwargs,
+    ) -> None:
+        self.runs = runs
+        self.folder = folder
+        self.script_path = script_path
+        self.instances = instances
+        self.concurrency = max(1, concurrency)
+        self.log_dir = log_dir or create_matrix_log_dir(script_path)
+        self.run_kwargs = run_kwargs  # Passed to RunManager.create, e.g. pty
+        self.started_at = time.time()
+        self.finished = asyncio.Event()
+        self.listeners: list[Callable[[MatrixInstance], None]] = []
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = False
+
+    @property
+    def names(self) -> list[str]:
+        """The arguments of the matrix."""
+        return list(self.instances[0].values) if self.instances else []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        for instance in self.instances:
+            self._schedule(instance)
+
+    def _schedule(self, instance: MatrixInstance) -> None:
+        self.finished.clear()
+        task = asyncio.create_task(self._run_instance(instance))
+        # Keeps a reference, as the event loop only holds weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not self._tasks:
+            self.write_summary()
+            self.finished.set()
+
+    async def _run_instance(self, instance: MatrixInstance) -> None:
+        async with self._semaphore:
+            if self._stopping:
+                instance.cancelled = True
+                self._changed(instance)
+                return
+            instance.attempts += 1
+            retry = f"_retry{instance.attempts - 1}" if instance.attempts > 1 else ""
+            run = self.runs.create(
+                self.script_path,
+                build_command(self.folder, self.script_path, instance.args),
+                detach=False,
+                ingest=self.runs.create_ingest_filter(),
+                log_file_path=self.log_dir / f"{instance.index:04d}{retry}.log",
+                **self.run_kwargs,
+            )
+            instance.run = run
+            instance.ended_at = None
+            self._changed(instance)
+            await run.start()
+            if self._stopping:  # stop() was called while the script was started
+                await run.terminate()
+            await run.finished.wait()
+            instance.ended_at = time.time()
+            self._changed(instance)
+
+    def _changed(self, instance: MatrixInstance) -> None:
+        for listener in list(self.listeners):
+            listener(instance)
+
+    async def stop(self) -> None:
+        """Cancels the queued instances and stops the running ones."""
+        self._stopping = True
+        await asyncio.gather(
+            *(
+                instance.run.terminate()
+                for instance in self.instances
+                if instance.status == "running"
+            )
+        )
+
+    def retry_failed(self) -> list[MatrixInstance]:
+        """Queues the failed and cancelled instances again, returns them."""
+        self._stopping = False
+        retried = [
+            instance
+            for instance in self.instances
+            if instance.status in ("failed", "cancelled")
+        ]
+        for instance in retried:
+            instance.run = None
+            instance.ended_at = None
+            instance.cancelled = False
+            self._changed(instance)
+            self._schedule(instance)
+        return retried
+
+    def counts(self) -> Counter:
+        return Counter(instance.status for instance in self.instances)
+
+    def slowest(self, count: int = SLOWEST_COUNT) -> list[MatrixInstance]:
+        started = [i for i in self.instances if i.duration is not None]
+        return sorted(started, key=lambda i: i.duration, reverse=True)[:count]
+
+    def write_summary(self) -> None:
+        summary = {
+            "script": str(self.script_path),
+            "started_at": self.started_at,
+            "concurrency": self.concurrency,
+            "counts": dict(self.counts()),
+            "instances": [
+                {
+                    "index": instance.index,
+                    "values": instance.values,
+                    "args": instance.args,
+                    "status": instance.status,
+                    "return_code": instance.run.return_code if instance.run else None,
+                    "duration": instance.duration,
+                    "attempts": instance.attempts,
+                    "log_file": str(instance.run.log_file_path)
+                    if instance.run
+                    else None,
+                }
+                for instance in self.instances
+            ],
+        }
+        with open(self.log_dir / SUMMARY_FILE, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+
+
+def format_duration(seconds: float | None) -> str:
+    return "" if seconds is None else f"{seconds:.1f} s"
+
+
+class MatrixScreen(Screen):
+    """Progress and summary of a matrix run, with the output of the selected instance."""
+
+    BINDINGS = [
+        ("ctrl+r", "retry_failed", "Retry Failed"),
+        ("ctrl+c", "stop", "Stop All"),
+    ]
+
+    def __init__(self, matrix: MatrixRun, title: str = "Matrix Run") -> None:
+        super().__init__()
+        self.matrix = matrix
+        self.title = title
+        self.sub_title = matrix.script_path.name
+        self.progress = ProgressBar(total=len(matrix.instances), show_eta=False)
+        self.summary = Static(id="matrix-summary")
+        self.table = DataTable(id="matrix-table", cursor_type="row")
+        self.output_box = RichLog(id="matrix-output")
+        self._changed: set[int] = {instance.index for instance in matrix.instances}
+        self._selected: MatrixInstance | None = None
+
+    def compose(self) -> ComposeResult:
+        yield Header(show_clock=True)
+        with Horizontal(id="matrix-buttons"):
+            yield Button("Retry Failed", variant="warning", id="retry")
+            yield Button("Stop All", variant="error", id="stop")
+        yield self.progress
+        yield self.summary
+        yield self.table
+        yield self.output_box
+        yield Footer()
+
+    def on_mount(self) -> None:
+        self.table.add_column("#", key="index")
+        for name in self.matrix.names:
+            self.table.add_column(name, key=f"value:{name}")
+        for column in ("Status", "Exit", "Duration", "Attempts"):
+            self.table.add_column(column, key=column.lower())
+        for instance in self.matrix.instances:
+            self.table.add_row(
+                str(instance.index),
+                *instance.values.values(),
+                "",
+                "",
+                "",
+                "",
+                key=str(instance.index),
+            )
+        self.matrix.listeners.append(self._on_instance_changed)
+        self.refresh_view()
+        self.set_interval(REFRESH_INTERVAL, self.refresh_view)
+
+    def on_unmount(self) -> None:
+        if self._on_instance_changed in self.matrix.listeners:
+            self.matrix.listeners.remove(self._on_instance_changed)
+
+    def _on_instance_changed(self, instance: MatrixInstance) -> None:
+        self._changed.add(instance.index)
+
+    def refresh_view(self) -> None:
+        """Updates the rows of changed and running instances and the summary."""
+        instances = self.matrix.instances
+        rows = self._changed | {i.index for i in instances if i.status == "running"}
+        self._changed = set()
+        for index in rows:
+            instance = instances[index - 1]
+            return_code = instance.run.return_code if instance.ended_at else None
+            for column, value in (
+                ("status", instance.status),
+                ("exit", "" if return_code is None else str(return_code)),
+                ("duration", format_duration(instance.duration)),
+                ("attempts", str(instance.attempts)),
+            ):
+                self.table.update_cell(str(index), column, value)
+            if instance is self._selected and instance.ended_at:
+                self.show_instance(instance)
+        counts = self.matrix.counts()
+        done = counts["passed"] + counts["failed"] + counts["cancelled"]
+        self.progress.update(progress=done)
+        slowest = ", ".join(
+            f"#{i.index} ({format_duration(i.duration)})" for i in self.matrix.slowest()
+        )
+        self.summary.update(
+            f"{counts['passed']} passed, {counts['failed']} failed, "
+            f"{counts['running']} running, {counts['queued']} queued, "
+            f"{counts['cancelled']} cancelled  ·  "
+            f"at most {self.matrix.concurrency} at a time  ·  "
+            f"logs: {self.matrix.log_dir}\n"
+            f"Slowest: {slowest or '-'}"
+        )
+
+    def show_instance(self, instance: MatrixInstance) -> None:
+        """Shows the kept output lines of the latest run of an instance."""
+        self._selected = instance
+        self.output_box.clear()
+        self.output_box.write(f"#{instance.index}: {instance.label}")
+        if instance.run is None:
+            return
+        self.output_box.write(f"Log file: {instance.run.log_file_path}")
+        for event in list(instance.run.history):
+            self.output_box.write(event.rich_text)
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        self.show_instance(self.matrix.instances[int(event.row_key.value) - 1])
+
+    def action_retry_failed(self) -> None:
+        retried = self.matrix.retry_failed()
+        if not retried:
+            self.notify("No failed instances to retry.")
+            return
+        self.notify(f"Retrying {len(retried)} instance(s).")
+        self.refresh_view()
+
+    async def action_stop(self) -> None:
+        """Stops the instances in a worker, so the UI stays responsive."""
+        if self.matrix.running:
+            self.run_worker(self.matrix.stop(), group="terminate", exclusive=True)
+
+    async def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "retry":
+            self.action_retry_failed()
+        elif event.button.id == "stop":
+            await self.action_stop()
@@ -0,0 +1,212 @@
+"""Export of the output lines of a run into a memory-mapped ring buffer.
+
+Other local processes (e.g. a monitoring sidecar) can follow the output of a run with
+sequence numbers, without tailing the log file. The ring buffer file is created in
+/dev/shm if available, so it lives in memory. The writer never waits for readers:
+readers that fall behind by more than the capacity skip the overwritten lines, which
+shows up as a gap in the sequence numbers.
+
+Layout of the file: a header of HEADER_SIZE bytes followed by the data area, in which
+records wrap around. Each record is a RECORD header (length of the text, sequence
+number, time in ns, flags) followed by the UTF-8 text. Positions in the header count
+all bytes ever written: the write position is updated after a record is complete, the
+tail (start of the oldest complete record) before a record overwrites older ones.
+
+Follow a run from a shell with:
+
+        python -m etui.output_export /dev/shm/etui/<log name>.ring
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+MAGIC = b"ETUIRING"
+VERSION = 1
+# Magic, version, flags, capacity, write position, last sequence number, tail
+HEADER = struct.Struct("<8sIIQQQQ")
+HEADER_SIZE = 64
+FLAGS_OFFSET = 12
+WRITE_POS_OFFSET = 24
+TAIL_OFFSET = 40
+RECORD = struct.Struct("<IQQB")  # text length, sequence number, time in ns, flags
+FLAG_CLOSED = 1
+FLAG_STDERR = 1
+DEFAULT_CAPACITY = 1024 * 1024
+MIN_CAPACITY = 4096  # Room for lines of up to about 2 KB
+FOLLOW_INTERVAL = 0.05
+
+
+def default_export_path() -> Path:
+    shm = Path("/dev/shm")
+    root = shm if shm.is_dir() else Path(tempfile.gettempdir())
+    return root / "etui"
+
+
+@dataclass
+class Record:
+    seq: int
+    time_ns: int
+    is_stderr: bool
+    text: str
+
+
+class RingBufferWriter:
+    """Publishes the lines of one run, see the module docstring for the layout."""
+
+    def __init__(self, path: Path, capacity: int = DEFAULT_CAPACITY) -> None:
+        if capacity < MIN_CAPACITY:
+            raise ValueError(f"capacity must be at least {MIN_CAPACITY} bytes")
+        self.path = path
+        self.capacity = capacity
+        self.seq = 0
+        self._write_pos = 0
+        self._record_starts: deque[int] = deque()
+        self._tail = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity)
+            self._buffer = mmap.mmap(fd, HEADER_SIZE + capacity)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, 0, capacity, 0, 0, 0)
+
+    def write(self, text: str, is_stderr: bool = False) -> int:
+        """Appends a line and returns its sequence number."""
+        payload = text.encode(errors="replace")
+        max_length = self.capacity // 2 - RECORD.size
+        if len(payload) > max_length:
+            payload = payload[:max_length]
+        self.seq += 1
+        record = (
+            RECORD.pack(
+                len(payload),
+                self.seq,
+                time.time_ns(),
+                FLAG_STDERR if is_stderr else 0,
+            )
+            + payload
+        )
+        buffer = self._buffer
+        # Readers detect overwritten records by the tail, so it moves on first
+        self._record_starts.append(self._write_pos)
+        overwritten_until = self._write_pos + len(record) - self.capacity
+        while self._record_starts[0] < overwritten_until:
+            self._record_starts.popleft()
+        if self._record_starts[0] != self._tail:
+            self._tail = self._record_starts[0]
+            struct.pack_into("<Q", buffer, TAIL_OFFSET, self._tail)
+        start = self._write_pos % self.capacity
+        first = min(len(record), self.capacity - start)
+        buffer[HEADER_SIZE + start : HEADER_SIZE + start + first] = record[:first]
+        if first < len(record):
+            buffer[HEADER_SIZE : HEADER_SIZE + len(record) - first] = record[first:]
+        self._write_pos += len(record)
+        # Published last, so readers never see a half written record
+        struct.pack_into("<QQ", buffer, WRITE_POS_OFFSET, self._write_pos, self.seq)
+        return self.seq
+
+    def close(self) -> None:
+        """Marks the run as finished and removes the file.
+
+        Readers that already mapped the file can still read the remaining lines."""
+        struct.pack_into("<I", self._buffer, FLAGS_OFFSET, FLAG_CLOSED)
+        self._buffer.close()
+        self.path.unlink(missing_ok=True)
+
+
+class RingBufferReader:
+    """Reads the records of a ring buffer written by RingBufferWriter."""
+
+    def __init__(self, path: Path, from_start: bool = True) -> None:
+        with open(path, "rb") as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.capacity, write_pos, _, tail = HEADER.unpack_from(
+            self._buffer
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an etui ring buffer")
+        self.pos = tail if from_start else write_pos
+
+    @property
+    def closed(self) -> bool:
+        return bool(HEADER.unpack_from(self._buffer)[2] & FLAG_CLOSED)
+
+    def _position(self, offset: int) -> int:
+        return struct.unpack_from("<Q", self._buffer, offset)[0]
+
+    def _copy(self, start: int, stop: int) -> bytes:
+        begin = start % self.capacity
+        end = begin + stop - start
+        if end <= self.capacity:
+            return self._buffer[HEADER_SIZE + begin : HEADER_SIZE + end]
+        return (
+            self._buffer[HEADER_SIZE + begin : HEADER_SIZE + self.capacity]
+            + self._buffer[HEADER_SIZE : HEADER_SIZE + end - self.capacity]
+        )
+
+    def read(self) -> list[Record]:
+        """Returns the records written since the last call.
+
+        Records overwritten before they were read are skipped."""
+        while True:
+            write_pos = self._position(WRITE_POS_OFFSET)
+            tail = self._position(TAIL_OFFSET)
+            start = max(self.pos, tail)
+            data = self._copy(start, write_pos)
+            # The writer might have overwritten the start while copying
+            if self._position(TAIL_OFFSET) <= start:
+                break
+        records = []
+        offset = 0
+        while offset < len(data):
+            length, seq, time_ns, flags = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            text = data[offset : offset + length].decode(errors="replace")
+            offset += length
+            records.append(Record(seq, time_ns, bool(flags & FLAG_STDERR), text))
+        self.pos = write_pos
+        return records
+
+    def follow(self, interval: float = FOLLOW_INTERVAL):
+        """Yields records until the run is finished."""
+        while True:
+            closed = self.closed
+            yield from self.read()
+            if closed:
+                return
+            time.sleep(interval)
+
+    def close(self) -> None:
+        self._buffer.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Follows the output of an etui run.")
+    parser.add_argument("path", type=Path, help="ring buffer file of the run")
+    parser.add_argument("--new", action="store_true", help="skip existing lines")
+    args = parser.parse_args()
+    reader = RingBufferReader(args.path, from_start=not args.new)
+    last_seq = None
+    for record in reader.follow():
+        if last_seq is not None and record.seq != last_seq + 1:
+            print(f"… {record.seq - last_seq - 1} lines skipped", file=sys.stderr)
+        last_seq = record.seq
+        print(
+            f"{record.seq} {record.text}",
+            file=sys.stderr if record.is_stderr else sys.stdout,
+            flush=True,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
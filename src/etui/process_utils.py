@@ -0,0 +1,232 @@
+"""Helpers for starting and stopping script processes and their descendants."""
+
+import asyncio
+import os
+import pty
+import signal
+import termios
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+
+PROC_PATH = Path("/proc")
+
+# Every run gets its own session and with that its own process group (pgid == pid).
+# Signals can then be sent to the whole group without hitting etui itself.
+SPAWN_KWARGS = {"start_new_session": True}
+
+POLL_INTERVAL = 0.05
+PTY_READ_SIZE = 65536
+
+
+@dataclass
+class GracePeriods:
+    """Seconds to wait for the process tree to exit after each signal."""
+
+    sigint: float = 2.0
+    sigterm: float = 5.0
+    sigkill: float = 2.0
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> "GracePeriods":
+        return cls(
+            float(settings.get("sigint_grace", cls.sigint)),
+            float(settings.get("sigterm_grace", cls.sigterm)),
+            float(settings.get("sigkill_grace", cls.sigkill)),
+        )
+
+
+def descendant_pids(pid: int) -> set[int]:
+    """Returns the pids of all descendants of a process.
+
+    Reads the parent pids from /proc, so this only works on Linux. On other systems an
+    empty set is returned and only the process group is used for signalling."""
+    children: dict[int, list[int]] = {}
+    try:
+        entries = os.listdir(PROC_PATH)
+    except OSError:
+        return set()
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            stat = (PROC_PATH / entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces and brackets, the ppid follows the last ")"
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    descendants = set()
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in descendants:
+                descendants.add(child)
+                stack.append(child)
+    return descendants
+
+
+def is_running(pid: int) -> bool:
+    """Checks if a pid belongs to a living (not zombie) process."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        stat = (PROC_PATH / str(pid) / "stat").read_text()
+    except OSError:
+        return True
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def process_cmdline(pid: int) -> list[str] | None:
+    """Returns the command line of a process from /proc, None if it can't be read."""
+    try:
+        cmdline = (PROC_PATH / str(pid) / "cmdline").read_bytes()
+    except OSError:
+        return None
+    return cmdline.decode(errors="replace").split("\0")[:-1]
+
+
+def group_alive(pgid: int) -> bool:
+    """Checks if any process of a process group is still running.
+
+    Zombies don't count, as nothing might reap them (e.g. children whose parent was
+    killed, until init adopts them). Their states are read from /proc, without it any
+    existing process counts."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        entries = os.listdir(PROC_PATH)
+    except OSError:
+        return True
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            stat = (PROC_PATH / entry / "stat").read_text()
+        except OSError:
+            continue
+        # State, ppid and pgid follow the command name, which ends with the last ")"
+        state, _, group = stat.rsplit(")", 1)[1].split()[:3]
+        if int(group) == pgid and state != "Z":
+            return True
+    return False
+
+
+def _send_signal(pgid: int, pids: set[int], sig: signal.Signals) -> None:
+    """Sends a signal to a process group and to descendants that left the group."""
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _tree_released(process: asyncio.subprocess.Process, pids: set[int]) -> bool:
+    if process.returncode is None:
+        return False
+    if group_alive(process.pid):
+        return False
+    return not any(is_running(pid) for pid in pids)
+
+
+async def _wait_released(
+    process: asyncio.subprocess.Process, pids: set[int], timeout: float
+) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        if _tree_released(process, pids):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def terminate_process_tree(
+    process: asyncio.subprocess.Process, grace: GracePeriods | None = None
+) -> signal.Signals | None:
+    """Stops a process started with SPAWN_KWARGS together with all its descendants.
+
+    Escalates from SIGINT to SIGTERM to SIGKILL and waits the corresponding grace
+    period after each signal. The tree counts as released when the process itself was
+    reaped, its process group is empty and no known descendant is still running.
+
+    Returns the signal that released the tree, or None if something survived SIGKILL
+    (e.g. a process stuck in uninterruptible sleep)."""
+    grace = grace or GracePeriods()
+    pids = descendant_pids(process.pid)
+    steps = (
+        (signal.SIGINT, grace.sigint),
+        (signal.SIGTERM, grace.sigterm),
+        (signal.SIGKILL, grace.sigkill),
+    )
+    for sig, timeout in steps:
+        if _tree_released(process, pids):
+            return sig
+        if process.returncode is None:
+            # Workers might have been spawned since the last signal
+            pids |= descendant_pids(process.pid)
+        _send_signal(process.pid, pids, sig)
+        if await _wait_released(process, pids, timeout):
+            return sig
+    return None
+
+
+async def terminate_processes(
+    processes: list[asyncio.subprocess.Process], grace: GracePeriods | None = None
+) -> list[signal.Signals | None]:
+    """Stops several process trees concurrently.
+
+    All trees escalate in parallel, so stopping many runs takes about as long as
+    stopping the slowest one."""
+    return await asyncio.gather(
+        *(terminate_process_tree(process, grace) for process in processes)
+    )
+
+
+def open_pty(columns: int = 120, rows: int = 40) -> tuple[int, int]:
+    """Opens a pseudo-terminal and returns its (master, slave) file descriptors.
+
+    Echo is disabled, so input sent to the script doesn't show up in its output. The
+    slave fd has to be closed in the parent after the process was started, otherwise
+    the end of the output is never detected."""
+    master_fd, slave_fd = pty.openpty()
+    attributes = termios.tcgetattr(slave_fd)
+    attributes[3] &= ~termios.ECHO
+    termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
+    termios.tcsetwinsize(slave_fd, (rows, columns))
+    return master_fd, slave_fd
+
+
+async def read_pty(master_fd: int) -> AsyncIterator[bytes]:
+    """Yields output chunks from the master side of a pseudo-terminal until EOF."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes] = asyncio.Queue()
+
+    def on_readable() -> None:
+        try:
+            data = os.read(master_fd, PTY_READ_SIZE)
+        except OSError:  # Linux raises EIO once all slave fds are closed
+            data = b""
+        if not data:
+            loop.remove_reader(master_fd)
+        queue.put_nowait(data)
+
+    loop.add_reader(master_fd, on_readable)
+    try:
+        while data := await queue.get():
+            yield data
+    finally:
+        loop.remove_reader(master_fd)
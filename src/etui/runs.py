@@ -0,0 +1,810 @@
+"""Script runs, which belong to the app instead of the screen that started them.
+
+A run owns the process, its log file and output export and passes every output line
+through its ingest filter. Screens and the control API follow a run by registering a
+listener, which receives a RunEvent for every line, live line update and the exit.
+
+Detached runs are owned by a supervisor process instead (see etui.supervisor), which
+keeps the script running when etui quits or crashes. Their state lives in a directory
+under RUNS_STATE_PATH: the state file, a journal of the output lines (JSON lines) and a
+FIFO for the script's stdin. A restarted etui reattaches to them by following the
+journal, see RunManager.reattach.
+"""
+
+import asyncio
+import codecs
+import itertools
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from functools import partial
+from io import TextIOWrapper
+from pathlib import Path
+
+from platformdirs import user_state_dir
+from rich.text import Text
+
+from etui.config import ScriptFolder, load_settings_section, load_trigger_rules
+from etui.diagnostics import METRICS
+from etui.ingest import IngestFilter
+from etui.logging import create_log_file, format_line, get_logger
+from etui.output_export import RingBufferWriter, default_export_path
+from etui.process_utils import (
+    PROC_PATH,
+    SPAWN_KWARGS,
+    GracePeriods,
+    is_running,
+    open_pty,
+    process_cmdline,
+    read_pty,
+    terminate_process_tree,
+)
+from etui.terminal import TerminalLineBuffer
+from etui.triggers import TriggerHit, TriggerSet
+
+LIVE_LINE_INTERVAL = 0.1  # Min. seconds between updates of the PTY live line
+PROMPT_IDLE_TIME = 0.2  # Seconds without output before triggers see a partial line
+STREAM_READ_SIZE = 65536
+STREAM_DRAIN_TIMEOUT = 1.0  # Seconds to wait for remaining output after the exit
+HISTORY_SIZE = 1000  # Lines kept per run for listeners that start following late
+MAX_FINISHED_RUNS = 100
+EXPORT_DEFAULTS = {"enabled": False, "capacity_kb": 1024, "path": ""}
+
+RUNS_STATE_PATH = Path(user_state_dir("etui")) / "runs"
+STATE_FILE = "state.json"
+JOURNAL_FILE = "journal.jsonl"
+STDIN_FIFO = "stdin"
+SUPERVISOR_ERROR_FILE = "supervisor.err"
+JOURNAL_POLL_INTERVAL = 0.05
+JOURNAL_READ_SIZE = 256 * 1024
+REPLAY_SIZE = 256 * 1024  # Bytes of the journal replayed when reattaching to a run
+
+
+def build_command(
+    folder: ScriptFolder, script_path: Path, args: list[str]
+) -> list[str]:
+    return [str(folder.executable), "-u", str(script_path), *args]
+
+
+@dataclass
+class RunEvent:
+    # "line" (script output), "status" (etui messages), "live", "notify" (by a trigger)
+    # or "exit"
+    kind: str
+    text: str = ""
+    rich_text: Text | None = None
+    is_stderr: bool = False
+    show: bool = True  # False if the ingest rules hide the line from the output box
+    dropped: int = 0  # Lines hidden by the rate limit before this one
+    seq: int = 0
+    return_code: int | None = None
+
+
+class ScriptRun:
+    """One run of a script.
+
+    Output lines are written to the log file and the export and then sent to all
+    listeners, the log file always contains every line regardless of the ingest rules.
+    """
+
+    detached = False
+
+    def __init__(
+        self,
+        run_id: int,
+        script_path: Path,
+        cmd: list[str],
+        pty: bool = False,
+        ingest: IngestFilter | None = None,
+        triggers: TriggerSet | None = None,
+        grace: GracePeriods | None = None,
+        export_settings: dict | None = None,
+        pty_columns: int = 120,
+        log_file_path: Path | None = None,
+    ) -> None:
+        self.id = run_id
+        self.script_path = script_path
+        self.cmd = cmd
+        self.pty = pty
+        self.ingest = ingest or IngestFilter()
+        self.triggers = triggers or TriggerSet()
+        self.marks: list[str] = []
+        self.grace = grace or GracePeriods()
+        self.export_settings = EXPORT_DEFAULTS | (export_settings or {})
+        self.pty_columns = pty_columns
+        self.log_file_path = log_file_path or create_log_file(script_path)
+        self.log_file: TextIOWrapper | None = None
+        self.export: RingBufferWriter | None = None
+        self.process: asyncio.subprocess.Process | None = None
+        self.started_at: float | None = None
+        self.return_code: int | None = None
+        self.live_line = ""
+        self.history: deque[RunEvent] = deque(maxlen=HISTORY_SIZE)
+        self.finished = asyncio.Event()
+        self._listeners: list[Callable[[RunEvent], None]] = []
+        self._seq = 0
+        self._pty_master: int | None = None
+        self._pty_buffer: TerminalLineBuffer | None = None
+        self._readers: list[asyncio.Task] = []
+        self._terminating: asyncio.Task | None = None
+        self._exit_handler: asyncio.Task | None = None
+        self._trigger_tasks: set[asyncio.Task] = set()
+        # Streams (by is_stderr) whose partial line was already acted on by a trigger
+        self._prompt_hits: set[bool] = set()
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and not self.finished.is_set()
+
+    @property
+    def pid(self) -> int | None:
+        return self.process.pid if self.process else None
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "script": str(self.script_path),
+            "cmd": self.cmd,
+            "pid": self.pid,
+            "pty": self.pty,
+            "detached": self.detached,
+            "log_file": str(self.log_file_path),
+            "started_at": self.started_at,
+            "running": self.running,
+            "return_code": self.return_code,
+            "marks": self.marks,
+        }
+
+    def add_listener(self, listener: Callable[[RunEvent], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[RunEvent], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event: RunEvent) -> None:
+        if event.kind in ("line", "status"):
+            self._seq += 1
+            event.seq = self._seq
+            self.history.append(event)
+        for listener in list(self._listeners):
+            listener(event)
+
+    async def start(self) -> None:
+        """Opens the log file and the export and starts the process."""
+        self.log_file = open(self.log_file_path, "w", encoding="utf-8")
+        self.export = self._create_export()
+        self.status(f"Running: {' '.join(self.cmd)}")
+        try:
+            if self.pty:
+                await self._start_pty_process()
+            else:
+                await self._start_pipe_process()
+        except OSError as e:
+            self.status(f"Script could not be started: {e}", is_stderr=True)
+            self._finish(None)
+            return
+        self.started_at = time.time()
+        METRICS.increment("runs_started")
+        self._exit_handler = asyncio.create_task(self._wait_for_exit())
+
+    def _create_export(self) -> RingBufferWriter | None:
+        if not self.export_settings["enabled"]:
+            return None
+        export_path = Path(self.export_settings["path"] or default_export_path())
+        try:
+            return RingBufferWriter(
+                export_path / f"{self.log_file_path.stem}.ring",
+                int(self.export_settings["capacity_kb"]) * 1024,
+            )
+        except (OSError, ValueError) as e:  # ValueError: e.g. capacity_kb too small
+            self.status(f"Output export not possible: {e}", is_stderr=True)
+            return None
+
+    async def _start_pipe_process(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **SPAWN_KWARGS,
+        )
+        self._readers = [
+            asyncio.create_task(self._read_stream(self.process.stdout)),
+            asyncio.create_task(self._read_stream(self.process.stderr, True)),
+        ]
+
+    async def _read_stream(self, stream: asyncio.StreamReader, is_stderr=False):
+        """Reads the output of a script line by line.
+
+        If the script waits with a partial line, e.g. a prompt of input(), the
+        triggers see it after PROMPT_IDLE_TIME."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        prompt_checked = True
+        while True:
+            timeout = None if prompt_checked or not self.triggers else PROMPT_IDLE_TIME
+            try:
+                chunk = await asyncio.wait_for(stream.read(STREAM_READ_SIZE), timeout)
+            except TimeoutError:
+                self._match_prompt(pending, is_stderr)
+                prompt_checked = True
+                continue
+            if not chunk:
+                break
+            *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                self.ingest_line(line, is_stderr=is_stderr)
+            prompt_checked = not pending
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            self.ingest_line(pending, is_stderr=is_stderr)
+
+    async def _start_pty_process(self) -> None:
+        """Starts the script with stdin, stdout and stderr attached to a PTY."""
+        master_fd, slave_fd = open_pty(columns=self.pty_columns)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                **SPAWN_KWARGS,
+            )
+        except BaseException:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+        self._pty_master = master_fd
+        self._readers = [asyncio.create_task(self._read_pty_stream(master_fd))]
+
+    async def _read_pty_stream(self, master_fd: int) -> None:
+        """Reads the PTY output of a script and logs only settled lines.
+
+        Carriage return redraws (e.g. progress bars) are collapsed in place, the line
+        that is currently drawn is sent as a "live" event instead."""
+        buffer = self._pty_buffer = TerminalLineBuffer()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        last_update = 0.0
+        # Like in _read_stream, the triggers see the current line once output stops
+        prompt_check: asyncio.TimerHandle | None = None
+        loop = asyncio.get_running_loop()
+        try:
+            async for chunk in read_pty(master_fd):
+                METRICS.increment("pty_chunks")
+                for line in buffer.feed(decoder.decode(chunk)):
+                    self.ingest_line(line)
+                now = time.monotonic()
+                if now - last_update >= LIVE_LINE_INTERVAL:
+                    self._set_live_line(buffer.current_line)
+                    last_update = now
+                if prompt_check is not None:
+                    prompt_check.cancel()
+                if self.triggers and buffer.current_line:
+                    prompt_check = loop.call_later(
+                        PROMPT_IDLE_TIME,
+                        lambda: self._match_prompt(buffer.current_line, False),
+                    )
+            for line in buffer.feed(decoder.decode(b"", final=True)) + buffer.flush():
+                self.ingest_line(line)
+        finally:
+            if prompt_check is not None:
+                prompt_check.cancel()
+            self._pty_master = self._pty_buffer = None
+            os.close(master_fd)
+            self._set_live_line("")
+
+    def _set_live_line(self, text: str) -> None:
+        if text != self.live_line:
+            self.live_line = text
+            self._emit(RunEvent("live", text))
+
+    async def send_input(self, text: str) -> bool:
+        """Sends a line to the script, returns False if it isn't running anymore."""
+        if not self.running or self.process.returncode is not None:
+            return False
+        data = (text + "\n").encode()
+        if self._pty_master is not None:
+            # Echo is off, so a prompt would otherwise merge with the following output
+            for line in self._pty_buffer.flush():
+                self.ingest_line(line)
+            os.write(self._pty_master, data)
+        else:
+            self.process.stdin.write(data)
+            await self.process.stdin.drain()
+        return True
+
+    async def terminate(self) -> signal.Signals | None:
+        """Stops the script and all processes it started.
+
+        Escalates from SIGINT to SIGTERM to SIGKILL, see terminate_process_tree. Calling
+        it again while the run is being stopped waits for the same termination."""
+        if not self.running:
+            return None
+        if self._terminating is None:
+            self._terminating = asyncio.create_task(self._terminate())
+        return await asyncio.shield(self._terminating)
+
+    async def _terminate(self) -> signal.Signals | None:
+        self.status(
+            "User interrupt. Stopping script process group (SIGINT → SIGTERM → SIGKILL)."
+        )
+        released_by = await terminate_process_tree(self.process, self.grace)
+        if released_by is None:
+            self.status(
+                "Process tree survived SIGKILL, some processes are still running.",
+                is_stderr=True,
+            )
+        else:
+            self.status(f"Process tree released after {released_by.name}.")
+        return released_by
+
+    async def _wait_for_exit(self) -> None:
+        """Logs the exit code and closes the log file and the export."""
+        return_code = await self.process.wait()
+        # Output still buffered in the pipes belongs before the exit message
+        await asyncio.wait(self._readers, timeout=STREAM_DRAIN_TIMEOUT)
+        if self._terminating is not None:
+            await self._terminating
+        summary = self.ingest.summary()
+        if summary:
+            self.status(summary)
+        self.status(
+            f"✔ Script finished (exit code {return_code})", "=== SCRIPT FINISHED ==="
+        )
+        self._finish(return_code)
+
+    def _finish(self, return_code: int | None) -> None:
+        self.return_code = return_code
+        if self.export is not None:
+            self.export.close()
+            self.export = None
+        if self.log_file is not None:
+            self.log_file.close()
+        self.finished.set()
+        self._emit(RunEvent("exit", return_code=return_code))
+
+    def ingest_line(
+        self, text: str, is_stderr: bool = False, run_triggers: bool = True
+    ) -> None:
+        """Logs and exports a line of script output and sends it to the listeners.
+
+        Afterwards the triggers of the run act on the line, unless run_triggers is
+        False (e.g. for output that is replayed)."""
+        result = self.ingest.process(text, is_stderr=is_stderr)
+        rich_text = format_line(
+            text, is_stderr=is_stderr, level=result.level, highlight=result.highlight
+        )
+        METRICS.increment("lines_ingested")
+        if self.export is not None:
+            self.export.write(text.rstrip("\r\n"), is_stderr)
+        if self.log_file is not None and not self.log_file.closed:
+            start = time.perf_counter()
+            self.log_file.write(str(rich_text) + "\n")
+            self.log_file.flush()
+            METRICS.observe("log_flush_latency", time.perf_counter() - start)
+        self._emit(
+            RunEvent(
+                "line",
+                text.rstrip("\r\n"),
+                rich_text,
+                is_stderr,
+                result.show,
+                result.dropped,
+            )
+        )
+        if is_stderr in self._prompt_hits:  # Acted on while the line was partial
+            self._prompt_hits.discard(is_stderr)
+            run_triggers = False
+        if run_triggers and self.triggers:
+            hit = self.triggers.process(text)
+            if hit is not None:
+                self._run_trigger(hit)
+
+    def _match_prompt(self, text: str, is_stderr: bool) -> None:
+        """Lets the triggers act on a partial line the script waits at, e.g. a prompt.
+
+        If a trigger acts, the triggers skip the line once it is complete."""
+        if not text or not self.triggers or self.finished.is_set():
+            return
+        hit = self.triggers.process(text)
+        if hit is not None:
+            self._prompt_hits.add(is_stderr)
+            self._run_trigger(hit)
+
+    def _run_trigger(self, hit: TriggerHit) -> None:
+        """Carries out the action of a trigger that matched an output line."""
+        trigger = hit.trigger
+        label = f'Trigger "{trigger.pattern}"'
+        if trigger.action == "send":
+            self.status(f"{label}: sending {hit.text!r}")
+            task = asyncio.create_task(self.send_input(hit.text))
+        elif trigger.action == "terminate":
+            self.status(f"{label}: stopping the script")
+            task = asyncio.create_task(self.terminate())
+        elif trigger.action == "mark":
+            self.marks.append(hit.text or trigger.pattern)
+            self.status(f"{label}: run marked as {self.marks[-1]!r}")
+            return
+        else:
+            self.status(f"{label}: {hit.text}")
+            self._emit(RunEvent("notify", hit.text or trigger.pattern))
+            return
+        # Keeps a reference, as the event loop only holds weak references to tasks
+        self._trigger_tasks.add(task)
+        task.add_done_callback(self._trigger_tasks.discard)
+
+    def status(
+        self, output: str, log_text: str | None = None, is_stderr: bool = False
+    ) -> None:
+        """Logs a message of etui about the run, which is always shown."""
+        rich_text = format_line(output, is_stderr=is_stderr)
+        if self.log_file is not None and not self.log_file.closed:
+            self.log_file.write((log_text or str(rich_text)) + "\n")
+            self.log_file.flush()
+        self._emit(RunEvent("status", output, rich_text, is_stderr))
+
+
+def read_state(run_dir: Path) -> dict:
+    with open(run_dir / STATE_FILE, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_state(run_dir: Path, state: dict) -> None:
+    """Replaces the state file atomically, so readers never see a partial state."""
+    temp_path = run_dir / f"{STATE_FILE}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file)
+    os.replace(temp_path, run_dir / STATE_FILE)
+
+
+class DetachedRun(ScriptRun):
+    """A run whose script is started and owned by a supervisor process.
+
+    The supervisor writes the log file, so this run only follows the journal: its lines
+    are passed through the ingest filter and the export like the output of an attached
+    run. Input is sent through the FIFO, terminate() asks the supervisor to stop the
+    script with SIGTERM."""
+
+    detached = True
+
+    def __init__(self, *args, state_dir: Path = RUNS_STATE_PATH, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.state_dir = state_dir
+        self.run_dir: Path | None = None
+        self.supervisor_pid: int | None = None
+        self._supervisor: subprocess.Popen | None = None
+        self._child_pid: int | None = None
+        self._stdin_fd: int | None = None
+        self._offset = 0
+        self._replay_end = 0  # Journal offset up to which lines were written before
+        self._released_by: str | None = None
+
+    @classmethod
+    def reattach(cls, run_id: int, run_dir: Path, **kwargs) -> "DetachedRun":
+        """Follows a run started by an earlier etui, replaying its recent output."""
+        state = read_state(run_dir)
+        run = cls(
+            run_id,
+            Path(state["script"]),
+            state["cmd"],
+            pty=state["pty"],
+            log_file_path=Path(state["log_file"]),
+            state_dir=run_dir.parent,
+            **kwargs,
+        )
+        run.run_dir = run_dir
+        run.supervisor_pid = state.get("supervisor_pid")
+        run.started_at = state.get("started_at")
+        run.export = run._create_export()
+        try:
+            run._replay_end = (run_dir / JOURNAL_FILE).stat().st_size
+            run._offset = max(0, run._replay_end - REPLAY_SIZE)
+        except OSError:
+            pass
+        return run
+
+    @property
+    def running(self) -> bool:
+        return self.supervisor_pid is not None and not self.finished.is_set()
+
+    @property
+    def pid(self) -> int | None:
+        """The pid of the script, known once the supervisor started it."""
+        if self._child_pid is None and self.run_dir is not None:
+            try:
+                self._child_pid = read_state(self.run_dir).get("pid")
+            except (OSError, ValueError):
+                pass
+        return self._child_pid
+
+    async def start(self) -> None:
+        """Starts the supervisor in its own session, which then starts the script."""
+        self.export = self._create_export()
+        try:
+            self._supervisor = await asyncio.to_thread(self._start_supervisor)
+        except OSError as e:
+            self.status(f"Supervisor could not be started: {e}", is_stderr=True)
+            self._finish(None)
+            return
+        self.supervisor_pid = self._supervisor.pid
+        self.started_at = time.time()
+        METRICS.increment("runs_started")
+        self.follow()
+
+    def _start_supervisor(self) -> subprocess.Popen:
+        """Creates the run directory and starts the supervisor, runs in a thread."""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.run_dir = Path(
+            tempfile.mkdtemp(prefix=f"{self.log_file_path.stem}_", dir=self.state_dir)
+        )
+        os.mkfifo(self.run_dir / STDIN_FIFO, 0o600)
+        write_state(
+            self.run_dir,
+            {
+                "script": str(self.script_path),
+                "cmd": self.cmd,
+                "pty": self.pty,
+                "pty_columns": self.pty_columns,
+                "log_file": str(self.log_file_path),
+                "grace": asdict(self.grace),
+            },
+        )
+        # Not an asyncio subprocess, which would be killed when the event loop closes
+        with open(self.run_dir / SUPERVISOR_ERROR_FILE, "wb") as error_file:
+            return subprocess.Popen(
+                [sys.executable, "-m", "etui.supervisor", str(self.run_dir)],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=error_file,
+                **SPAWN_KWARGS,
+            )
+
+    def follow(self) -> None:
+        """Starts following the journal until the run finished."""
+        self._exit_handler = asyncio.create_task(self._follow_journal())
+
+    async def _follow_journal(self) -> None:
+        journal_path = self.run_dir / JOURNAL_FILE
+        # A replay starts somewhere in the journal, skip the rest of that line
+        skip_partial_line = self._offset > 0 and not self._at_line_start(journal_path)
+        pending = b""
+        line_start = self._offset  # Journal offset of the pending line
+        while True:
+            data = self._read_journal(journal_path)
+            if data:
+                self._offset += len(data)
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    line_end = line_start + len(line) + 1
+                    line_start = line_end
+                    if skip_partial_line:
+                        skip_partial_line = False
+                        continue
+                    # Triggers already acted on replayed lines in the former session
+                    replaying = line_end <= self._replay_end
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        get_logger().warning("Corrupt journal line in %s", journal_path)
+                        continue
+                    if record["kind"] == "exit":
+                        self._released_by = record.get("released_by")
+                        self._finish_detached(record.get("return_code"))
+                        return
+                    if record["kind"] == "line":
+                        self.ingest_line(
+                            record["text"], record["is_stderr"], not replaying
+                        )
+                    else:
+                        self.status(record["text"], is_stderr=record["is_stderr"])
+                await asyncio.sleep(0)  # Keeps the UI responsive during a replay
+                continue
+            if not self._supervisor_alive():
+                # The exit record is written last, so check once more for lines
+                if self._read_journal(journal_path):
+                    continue
+                self.status(
+                    "Supervisor stopped unexpectedly, the script might still be "
+                    f"running. {self._supervisor_error()}",
+                    is_stderr=True,
+                )
+                self._finish_detached(None)
+                return
+            await asyncio.sleep(JOURNAL_POLL_INTERVAL)
+
+    def _at_line_start(self, journal_path: Path) -> bool:
+        """Returns whether the journal offset is at the beginning of a line."""
+        try:
+            with open(journal_path, "rb") as file:
+                file.seek(self._offset - 1)
+                return file.read(1) == b"\n"
+        except FileNotFoundError:
+            return True
+
+    def _read_journal(self, journal_path: Path) -> bytes:
+        try:
+            with open(journal_path, "rb") as file:
+                file.seek(self._offset)
+                return file.read(JOURNAL_READ_SIZE)
+        except FileNotFoundError:  # Not created by the supervisor yet
+            return b""
+
+    def _supervisor_alive(self) -> bool:
+        if self._supervisor is not None:
+            return self._supervisor.poll() is None  # Also reaps the supervisor
+        return (
+            self.supervisor_pid is not None
+            and is_running(self.supervisor_pid)
+            and self._is_own_supervisor()
+        )
+
+    def _is_own_supervisor(self) -> bool:
+        """Checks that the supervisor pid wasn't reused by another process.
+
+        Without /proc the pid can't be checked and is trusted."""
+        cmdline = process_cmdline(self.supervisor_pid)
+        if cmdline is None:
+            return not PROC_PATH.is_dir()
+        return "etui.supervisor" in cmdline and str(self.run_dir) in cmdline
+
+    def _supervisor_error(self) -> str:
+        """Returns the last line the supervisor wrote to stderr, e.g. an exception."""
+        try:
+            lines = (self.run_dir / SUPERVISOR_ERROR_FILE).read_text().splitlines()
+        except OSError:
+            return ""
+        return next((line for line in reversed(lines) if line.strip()), "")
+
+    def _finish_detached(self, return_code: int | None) -> None:
+        summary = self.ingest.summary()
+        if summary:
+            self.status(summary)
+        self._finish(return_code)
+        if self._stdin_fd is not None:
+            os.close(self._stdin_fd)
+            self._stdin_fd = None
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    async def send_input(self, text: str) -> bool:
+        if not self.running:
+            return False
+        try:
+            if self._stdin_fd is None:
+                # Opened for reading too, so lines are buffered in the FIFO until the
+                # supervisor opened it
+                self._stdin_fd = os.open(
+                    self.run_dir / STDIN_FIFO, os.O_RDWR | os.O_NONBLOCK
+                )
+            os.write(self._stdin_fd, (text + "\n").encode())
+        except OSError:  # E.g. the FIFO is full, as the supervisor stopped reading
+            return False
+        return True
+
+    async def _terminate(self) -> signal.Signals | None:
+        # The follower finishes the run if the supervisor is gone
+        if self._supervisor_alive():
+            try:
+                os.kill(self.supervisor_pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        await self.finished.wait()
+        return signal.Signals[self._released_by] if self._released_by else None
+
+
+class RunManager:
+    """All runs of the app, whether started in the ScriptLauncher or by the API."""
+
+    def __init__(self, state_dir: Path = RUNS_STATE_PATH) -> None:
+        self.runs: dict[int, ScriptRun] = {}
+        self.state_dir = state_dir
+        # Called with the run and the event for the events of every run
+        self.listeners: list[Callable[[ScriptRun, RunEvent], None]] = []
+        self._ids = itertools.count(1)
+
+    def create(
+        self, script_path: Path, cmd: list[str], detach: bool | None = None, **kwargs
+    ) -> ScriptRun:
+        """Creates a run with the process and export settings, start it with start().
+
+        Runs are detached if the settings say so, unless detach is given. kwargs are
+        passed to ScriptRun, e.g. pty or ingest."""
+        process_settings = load_settings_section("process", {"detach": False})
+        kwargs.setdefault("grace", GracePeriods.from_settings(process_settings))
+        kwargs.setdefault(
+            "export_settings", load_settings_section("export", EXPORT_DEFAULTS)
+        )
+        kwargs.setdefault("triggers", self.create_triggers(script_path))
+        if detach is None:
+            detach = process_settings["detach"]
+        if detach:
+            run = DetachedRun(
+                next(self._ids), script_path, cmd, state_dir=self.state_dir, **kwargs
+            )
+        else:
+            run = ScriptRun(next(self._ids), script_path, cmd, **kwargs)
+        self._register(run)
+        return run
+
+    def reattach(self) -> list[DetachedRun]:
+        """Follows the detached runs of former etui sessions.
+
+        Runs that finished while etui was closed are replayed as well and finish right
+        away, which also removes their state directory."""
+        if not self.state_dir.is_dir():
+            return []
+        attached = {run.run_dir for run in self.runs.values() if run.detached}
+        export_settings = load_settings_section("export", EXPORT_DEFAULTS)
+        runs = []
+        for run_dir in sorted(self.state_dir.iterdir()):
+            if run_dir in attached or not (run_dir / STATE_FILE).exists():
+                continue
+            try:
+                run = DetachedRun.reattach(
+                    next(self._ids),
+                    run_dir,
+                    ingest=self.create_ingest_filter(),
+                    export_settings=export_settings,
+                )
+            except (OSError, ValueError, KeyError) as e:
+                get_logger().warning("Cannot reattach to run %s: %s", run_dir, e)
+                continue
+            run.triggers = self.create_triggers(run.script_path)
+            self._register(run)
+            run.follow()
+            runs.append(run)
+        return runs
+
+    def create_ingest_filter(self) -> IngestFilter:
+        """Returns the ingest filter of the settings, or no filter if they're invalid.
+
+        Invalid rules are left out of the filter."""
+        settings = load_settings_section("ingest", {})
+        try:
+            ingest = IngestFilter.from_settings(settings)
+        except ValueError as e:
+            get_logger().warning("Invalid ingest settings: %s", e)
+            return IngestFilter()
+        for error in ingest.errors:
+            get_logger().warning("Invalid ingest rule in settings: %s", error)
+        return ingest
+
+    def create_triggers(self, script_path: Path) -> TriggerSet:
+        """Returns the triggers of a script, or no triggers if they're invalid."""
+        try:
+            return TriggerSet.from_rules(load_trigger_rules(script_path))
+        except (ValueError, re.error) as e:
+            get_logger().warning("Invalid trigger for %s: %s", script_path.name, e)
+            return TriggerSet()
+
+    def _register(self, run: ScriptRun) -> None:
+        self.runs[run.id] = run
+        for listener in self.listeners:
+            run.add_listener(partial(listener, run))
+        self._remove_finished()
+
+    def running(self) -> list[ScriptRun]:
+        return [run for run in self.runs.values() if run.running]
+
+    async def terminate_all(self) -> None:
+        """Stops all running scripts concurrently, detached runs keep running."""
+        await asyncio.gather(
+            *(run.terminate() for run in self.running() if not run.detached)
+        )
+
+    def _remove_finished(self) -> None:
+        finished = [
+            run_id for run_id, run in self.runs.items() if run.finished.is_set()
+        ]
+        for run_id in finished[: max(0, len(finished) - MAX_FINISHED_RUNS)]:
+            del self.runs[run_id]
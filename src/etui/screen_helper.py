@@ -1,5 +1,6 @@
 """Small screen classes."""
 
+import shlex
 from pathlib import Path
 
 from textual.app import ComposeResult
@@ -13,44 +14,224 @@ from textual.widgets import (
     Input,
     Checkbox,
     Footer,
+    Select,
 )
 from textual.containers import Vertical, Grid
 
+from etui.file_utils import Parser, ParserArgument
+
+INPUT_TYPES = {"int": "integer", "float": "number"}
+TYPE_CHECKS = {"int": int, "float": float}
+FLAG_TRUE_VALUES = ("1", "true", "yes", "on")
+
 
 class ArgInputRow(Static):
     """One input row for a single CLI argument."""
 
-    def __init__(self, arg_name: str, default=None):
+    def __init__(self, argument: ParserArgument):
         super().__init__()
-        self.arg_name = arg_name
-        self.default = default
+        self.argument = argument
+        self.arg_name = argument.name
+        self.default = argument.default
+        self.tooltip = argument.help or None
 
     def compose(self):
-        yield Label(f"{self.arg_name}:")
-        yield Input(value=self.default or "")
-
-    def get_value(self):
-        input_widget = self.query_one(Input)
-        text = input_widget.value.strip()
-        if text:
-            return [self.arg_name, text]
-        return []
+        arg = self.argument
+        arg_type = "int" if arg.action == "count" else arg.type
+        input_type = "text" if arg.nargs else INPUT_TYPES.get(arg_type, "text")
+        placeholder = arg.help
+        if arg.nargs:
+            placeholder = f"{arg.help} (values separated by spaces)".lstrip()
+        yield Label(f"{self.arg_name}{' *' if arg.mandatory else ''}:")
+        yield Input(value=self.default or "", type=input_type, placeholder=placeholder)
+
+    def _values(self, text: str | None = None) -> list[str]:
+        if text is None:
+            text = self.query_one(Input).value
+        text = text.strip()
+        if self.argument.nargs:
+            return shlex.split(text)
+        return [text] if text else []
+
+    def get_value(self, text: str | None = None):
+        values = self._values(text)
+        if not values:
+            return []
+        if self.argument.positional:
+            return values
+        if self.argument.action == "count":
+            return [self.arg_name] * int(values[0])
+        if self.argument.action == "append":
+            return [part for value in values for part in (self.arg_name, value)]
+        return [self.arg_name, *values]
+
+    def validate(self, text: str | None = None) -> str | None:
+        """Returns an error message, if the entered value (or text) can't be used."""
+        arg = self.argument
+        try:
+            values = self._values(text)
+        except ValueError as e:
+            return f"{self.arg_name}: {e}"
+        if not values:
+            return f"{self.arg_name} is required." if arg.mandatory else None
+        if arg.nargs and arg.nargs.isdigit() and len(values) != int(arg.nargs):
+            return f"{self.arg_name} expects {arg.nargs} values."
+        arg_type = "int" if arg.action == "count" else arg.type
+        for value in values:
+            if arg.choices and value not in arg.choices:
+                return f"{self.arg_name}: {value!r} is not one of {arg.choices}."
+            if arg_type in TYPE_CHECKS:
+                try:
+                    TYPE_CHECKS[arg_type](value)
+                except ValueError:
+                    return f"{self.arg_name}: {value!r} is not a valid {arg_type}."
+        return None
+
+    def get_state(self) -> str:
+        return self.query_one(Input).value
+
+    def set_state(self, value: str) -> None:
+        self.query_one(Input).value = str(value)
+
+
+class ArgSelectRow(Static):
+    """For arguments with choices, only one of the choices can be selected."""
+
+    def __init__(self, argument: ParserArgument):
+        super().__init__()
+        self.argument = argument
+        self.arg_name = argument.name
+        self.tooltip = argument.help or None
+
+    def compose(self):
+        arg = self.argument
+        yield Label(f"{self.arg_name}{' *' if arg.mandatory else ''}:")
+        yield Select(
+            [(choice, choice) for choice in arg.choices],
+            value=arg.default if arg.default in arg.choices else Select.NULL,
+        )
+
+    def _value(self, text: str | None = None):
+        if text is None:
+            return self.query_one(Select).value
+        return text or Select.NULL
+
+    def get_value(self, text: str | None = None):
+        value = self._value(text)
+        if value is Select.NULL:
+            return []
+        return [value] if self.argument.positional else [self.arg_name, value]
+
+    def validate(self, text: str | None = None) -> str | None:
+        value = self._value(text)
+        if value is Select.NULL:
+            return f"{self.arg_name} is required." if self.argument.mandatory else None
+        if value not in self.argument.choices:
+            return f"{self.arg_name}: {value!r} is not one of {self.argument.choices}."
+        return None
+
+    def get_state(self) -> str:
+        value = self.query_one(Select).value
+        return "" if value is Select.NULL else value
+
+    def set_state(self, value: str) -> None:
+        select = self.query_one(Select)
+        if value in self.argument.choices:
+            select.value = value
+        else:
+            select.clear()
 
 
 class ArgFlagRow(Static):
-    """For flags with action='store_true' or 'store_false'."""
+    """For flags with action='store_true' or 'store_false'.
+
+    Unchecked BooleanOptionalAction flags pass --no-<flag>, they are checked initially
+    if they default to True."""
 
-    def __init__(self, arg_name: str):
+    def __init__(self, argument: ParserArgument):
         super().__init__()
-        self.arg_name = arg_name
+        self.argument = argument
+        self.arg_name = argument.name
+        self.tooltip = argument.help or None
 
     def compose(self):
-        yield Checkbox(self.arg_name)
+        arg = self.argument
+        checked = arg.action == "boolean_optional" and arg.default == "True"
+        yield Checkbox(self.arg_name, value=checked)
         yield Label()
 
-    def get_value(self):
-        checkbox = self.query_one(Checkbox)
-        return [self.arg_name] if checkbox.value else []
+    def get_value(self, text: str | None = None):
+        if text is None:
+            checked = self.query_one(Checkbox).value
+        else:
+            checked = text.strip().lower() in FLAG_TRUE_VALUES
+        if checked:
+            return [self.arg_name]
+        if self.argument.action == "boolean_optional":
+            return [f"--no-{self.arg_name.removeprefix('--')}"]
+        return []
+
+    def validate(self, text: str | None = None) -> str | None:
+        return None
+
+    def get_state(self) -> bool:
+        return self.query_one(Checkbox).value
+
+    def set_state(self, value: bool) -> None:
+        self.query_one(Checkbox).value = bool(value)
+
+
+class ArgForm(Vertical):
+    """All argument rows of one parser.
+
+    Forms stay mounted (hidden) when another script is selected, so entered values are
+    kept and switching back doesn't build the rows again."""
+
+    def __init__(self, parser: Parser):
+        super().__init__(classes="arg-form")
+        self.parser = parser
+
+    def compose(self):
+        for arg in self.parser.args:
+            if arg.is_flag:
+                yield ArgFlagRow(arg)
+            elif arg.choices and not arg.nargs:
+                yield ArgSelectRow(arg)
+            else:
+                yield ArgInputRow(arg)
+
+    @property
+    def rows(self) -> list[ArgInputRow | ArgSelectRow | ArgFlagRow]:
+        return [row for row in self.children if hasattr(row, "get_value")]
+
+    def get_value(self, overrides: dict[str, str] | None = None) -> list[str]:
+        """Returns the arguments for the script.
+
+        overrides replace the entered text of some arguments by name, e.g. the values
+        of a matrix run."""
+        overrides = overrides or {}
+        args = [self.parser.command] if self.parser.command else []
+        for row in self.rows:
+            args.extend(row.get_value(overrides.get(row.arg_name)))
+        return args
+
+    def validate(self, overrides: dict[str, str] | None = None) -> list[str]:
+        """Checks all entered values (or overrides), returns the error messages."""
+        overrides = overrides or {}
+        return [
+            error
+            for row in self.rows
+            if (error := row.validate(overrides.get(row.arg_name)))
+        ]
+
+    def get_state(self) -> dict[str, str | bool]:
+        """Returns the entered values by argument name, e.g. for saving a preset."""
+        return {row.arg_name: row.get_state() for row in self.rows}
+
+    def set_state(self, state: dict[str, str | bool]) -> None:
+        for row in self.rows:
+            if row.arg_name in state:
+                row.set_state(state[row.arg_name])
 
 
 class QuestionScreen(ModalScreen[bool]):
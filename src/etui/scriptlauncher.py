@@ -1,7 +1,8 @@
 import asyncio
-from io import TextIOWrapper
+from functools import partial
 from pathlib import Path
 
+from rich.text import Text
 from textual.app import ComposeResult
 from textual.screen import Screen
 from textual.widgets import (
@@ -20,14 +21,45 @@ from textual.widgets import (
 from textual.containers import Horizontal, Vertical, VerticalScroll
 
 from etui.config import (
+    load_presets,
     load_script_folders,
+    load_settings_section,
+    save_preset,
     save_script_folders,
     ScriptFolder,
     restore_default_script_folders,
 )
-from etui.logging import create_log_file, format_line
-from etui.file_utils import TCSS_PATH, extract_argparse, ROOT_PATH, PYTHON_UV, Parser
-from etui.screen_helper import ArgFlagRow, ArgInputRow, QuestionScreen
+from etui.ingest import IngestFilter
+from etui.diagnostics import METRICS
+from etui.file_utils import (
+    TCSS_PATH,
+    cached_extract_argparse,
+    ROOT_PATH,
+    PYTHON_UV,
+    Parser,
+    schema_hash,
+)
+from etui.environments import ENVIRONMENTS, ProvisioningError, provisioned_folder
+from etui.introspect import INTROSPECTOR
+from etui.matrix import (
+    MATRIX_DEFAULTS,
+    MatrixInstance,
+    MatrixRun,
+    MatrixScreen,
+    expand_matrix,
+    matrix_size,
+    parse_matrix,
+)
+from etui.runs import RunEvent, ScriptRun, build_command
+from etui.screen_helper import ArgForm, QuestionScreen
+
+FORM_CACHE_SIZE = 32  # Argument forms kept mounted for fast switching
+LEVEL_FILTER_OPTIONS = [
+    ("All levels", ""),
+    ("INFO+", "INFO"),
+    ("WARNING+", "WARNING"),
+    ("ERROR+", "ERROR"),
+]
 
 
 class ScriptLauncher(Screen):
@@ -35,12 +67,15 @@ class ScriptLauncher(Screen):
     BINDINGS = [
         ("ctrl+r", "run_script", "Run Script"),
         ("ctrl+c", "terminate_process", "Terminate"),
+        ("ctrl+t", "show_matrix", "Matrix Summary"),
     ]
 
     def __init__(self, title: str = "Scriptlauncher") -> None:
         super().__init__()
         self.title = title
-        self.process: asyncio.subprocess.Process | None = None
+        self.run: ScriptRun | None = None
+        self._run_listener = None
+        self._batch_writes = 0  # Output box writes since the last refresh
         self.script_folders = load_script_folders()
         self.folder_select = Select(
             options=[(name, name) for name in self.script_folders],
@@ -53,10 +88,45 @@ class ScriptLauncher(Screen):
         self.arg_panel = VerticalScroll(id="arg_panel")
         self.output_box = RichLog(id="output_box")
         self.input_box = Input(placeholder="Send input to script…", id="input_box")
-        self.log_file_path: Path | None = None
-        self.log_file: TextIOWrapper | None = None
+        self.pty_checkbox = Checkbox("PTY", id="pty_checkbox")
+        self.live_line = Label(id="live_line")
+        self.ingest_settings = load_settings_section("ingest", {"ui_min_level": ""})
+        min_level = self.ingest_settings["ui_min_level"].upper()
+        if min_level not in dict(LEVEL_FILTER_OPTIONS).values():
+            min_level = ""
+        self.ingest = IngestFilter(min_level=min_level)
+        self.level_select = Select(
+            options=LEVEL_FILTER_OPTIONS,
+            value=min_level,
+            allow_blank=False,
+            id="level_select",
+        )
         self._parsers: dict[str, Parser] = {}
-        self.parser_select: Select | None = None
+        # Script -> (mtime, parsers, whether they are final, see _get_parsers)
+        self._parser_cache: dict[Path, tuple[float, dict[str, Parser], bool]] = {}
+        self._forms: dict[tuple[Path, str], ArgForm] = {}  # In LRU order
+        self._current_form: ArgForm | None = None
+        self._script_path: Path | None = None
+        self._schema = ""
+        self._schema_final = False
+        self._presets: dict[str, dict] = {}
+        self.parser_select = Select([], id="parser_select")
+        self.preset_panel = Horizontal(id="preset_panel")
+        self.preset_select = Select([], prompt="Load preset", id="preset_select")
+        self.preset_name_input = Input(placeholder="Preset name", id="preset_name")
+        self.no_args_label = Label("No argparse arguments found.")
+        self._provision_errors: set[str] = set()  # Notified once per screen
+        self.matrix_settings = load_settings_section("matrix", MATRIX_DEFAULTS)
+        self.matrix_input = Input(
+            placeholder="Matrix, e.g. --id=1..200; --region=eu,us; --customer=@ids.csv",
+            id="matrix_input",
+        )
+        self.matrix_jobs = Input(
+            str(self.matrix_settings["concurrency"]),
+            type="integer",
+            tooltip="Instances running at the same time",
+            id="matrix_jobs",
+        )
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
@@ -71,59 +141,221 @@ class ScriptLauncher(Screen):
 
             # RIGHT: arguments + output
             with Vertical(id="main"):
-                yield self.parser_panel
-                yield self.arg_panel
+                with self.parser_panel:
+                    yield Label("Command:")
+                    yield self.parser_select
+                with self.preset_panel:
+                    yield self.preset_select
+                    yield self.preset_name_input
+                    yield Button("Save Preset", id="save_preset")
+                with self.arg_panel:
+                    yield self.no_args_label
                 with Horizontal():
                     yield Button("Run Script", variant="success", id="run_button")
                     yield Button("Clear Output", id="clear")
                     yield Button("Stop Script", variant="error", id="stop_button")
+                    yield self.pty_checkbox
+                    yield self.level_select
+                with Horizontal(id="matrix_panel"):
+                    yield self.matrix_input
+                    yield self.matrix_jobs
+                    yield Button("Run Matrix", variant="primary", id="matrix_button")
                 yield self.output_box
+                yield self.live_line
                 yield self.input_box
         yield Footer()
 
     async def on_mount(self):
+        self.parser_panel.display = False
+        self.preset_panel.display = False
+        self.no_args_label.display = False
         initial_folder = self.folder_select.value
         self.load_scripts_for_folder(initial_folder)
+        self.pty_checkbox.value = self.script_folders[initial_folder].pty
         self.script_list.focus()
+        running = self.app.runs.running()
+        if running:
+            # E.g. a detached run of a former session or a run started before the
+            # screen was closed
+            self.follow_run(running[-1])
+
+    def on_unmount(self) -> None:
+        if self.run is not None:
+            self.run.remove_listener(self._run_listener)
 
     async def on_select_changed(self, event: Select.Changed):
         """Loads scripts when folder is selected."""
         if event.select is self.folder_select:
             self.load_scripts_for_folder(event.value)
+            self.pty_checkbox.value = self.script_folders[event.value].pty
         elif event.select is self.parser_select:
-            await self.render_arguments(event.value)
+            if event.value is not Select.NULL:
+                await self.render_arguments(event.value)
+        elif event.select is self.preset_select:
+            if event.value is not Select.NULL:
+                await self._apply_preset(event.value)
+        elif event.select is self.level_select:
+            self.ingest.min_level = event.value
 
     async def on_list_view_selected(self, message: ListView.Selected):
-        """Gets and mounts arguments for chosen script."""
-        await self.parser_panel.remove_children()
+        """Shows the argument form and the presets of the chosen script."""
         item = message.item  # This is a ListItem
-        script_path: Path = item.script_path
-        self._parsers = extract_argparse(script_path)
-        if not self._parsers:
-            await self.arg_panel.mount(Label("No argparse arguments found."))
-            return
-        elif len(self._parsers) == 1:
-            for parser_name in self._parsers:
-                await self.render_arguments(parser_name)
-                return
-        self.parser_select = Select(
-            options=[(parser_name, parser_name) for parser_name in self._parsers],
-            value=list(self._parsers.keys())[0],
-            allow_blank=False,
-            id="parser_select",
+        await self.show_script(item.script_path)
+
+    async def show_script(self, script_path: Path):
+        self._script_path = script_path
+        self._parsers, self._schema_final = await self._get_parsers(script_path)
+        self._schema = schema_hash(self._parsers)
+        # load_presets deletes presets of another schema, so only the final one is used
+        self._presets = (
+            load_presets(script_path, self._schema) if self._schema_final else {}
+        )
+        self._refresh_preset_select()
+        self.preset_panel.display = bool(self._parsers)
+        self.parser_panel.display = len(self._parsers) > 1
+        if len(self._parsers) > 1:
+            self.parser_select.set_options(
+                [(parser_name, parser_name) for parser_name in self._parsers]
+            )
+            self.parser_select.value = next(iter(self._parsers))
+        await self.render_arguments(next(iter(self._parsers), None))
+
+    async def _get_parsers(self, script_path: Path) -> tuple[dict[str, Parser], bool]:
+        """Returns the parsers of a script, parsed again only if the script changed.
+
+        Cached forms of a changed script are removed, as its arguments might differ.
+        In folders with introspection, the statically found arguments are shown until
+        the introspected schema is available. They are only a provisional fallback
+        then, which is returned as False besides the parsers."""
+        mtime = script_path.stat().st_mtime
+        cached = self._parser_cache.get(script_path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        await self._remove_forms(script_path)
+        parsers = None
+        folder = self.script_folders[self.folder_select.value]
+        executable = self._introspection_executable(folder, script_path)
+        if executable is not None:
+            parsers = INTROSPECTOR.cached(script_path, executable)
+            error = INTROSPECTOR.failure(script_path, executable)
+            if error is not None:
+                self._notify_introspection_failed(script_path, error)
+            elif parsers is None:
+                INTROSPECTOR.refresh(script_path, executable, self._on_introspected)
+        final = parsers is not None or not folder.introspect
+        if parsers is None:
+            parsers = cached_extract_argparse(script_path)
+        self._parser_cache[script_path] = (mtime, parsers, final)
+        return parsers, final
+
+    @staticmethod
+    def _introspection_executable(
+        folder: ScriptFolder, script_path: Path
+    ) -> Path | None:
+        """Returns the executable to introspect the script with, if it is introspected.
+
+        In provisioned folders, that is the script's environment once it is built."""
+        if not folder.introspect:
+            return None
+        if not folder.provision:
+            return folder.executable
+        return ENVIRONMENTS.ready_executable(folder.executable, script_path)
+
+    async def _remove_forms(self, script_path: Path):
+        for key in [key for key in self._forms if key[0] == script_path]:
+            await self._forms.pop(key).remove()
+
+    def _on_introspected(
+        self, script_path: Path, parsers: dict[str, Parser] | None, error: str | None
+    ):
+        """Called from the introspection pool when a script was introspected."""
+        try:
+            self.app.call_from_thread(
+                self._apply_introspected, script_path, parsers, error
+            )
+        except RuntimeError:  # The app was closed in the meantime
+            pass
+
+    def _notify_introspection_failed(self, script_path: Path, error: str | None):
+        self.notify(
+            f"Introspection of {script_path.name} failed: {error}\n"
+            "Showing the statically found arguments.",
+            severity="warning",
         )
-        await self.parser_panel.mount(Label("Command:"))
-        await self.parser_panel.mount(self.parser_select)
-
-    async def render_arguments(self, parser_name: str):
-        await self.arg_panel.remove_children()  # Clear old args
-        parser = self._parsers[parser_name]
-        for arg in parser.args:
-            if arg.action == "store_true":
-                row = ArgFlagRow(arg.name)
-            else:
-                row = ArgInputRow(arg.name, arg.default)
-            await self.arg_panel.mount(row)
+
+    async def _apply_introspected(
+        self, script_path: Path, parsers: dict[str, Parser] | None, error: str | None
+    ):
+        """Replaces the statically found arguments with the introspected ones."""
+        is_shown = script_path == self._script_path and self.is_attached
+        if parsers is None:
+            if is_shown:
+                self._notify_introspection_failed(script_path, error)
+            return
+        if script_path not in self._parser_cache:
+            return  # Not shown yet, the cached schema is used once it is selected
+        await self._remove_forms(script_path)
+        self._parser_cache[script_path] = (script_path.stat().st_mtime, parsers, True)
+        if is_shown:
+            await self.show_script(script_path)
+
+    async def render_arguments(self, parser_name: str | None):
+        """Shows the form of a parser, which is only built the first time."""
+        if self._current_form is not None:
+            self._current_form.display = False
+            self._current_form = None
+        self.no_args_label.display = parser_name is None
+        if parser_name is None:
+            return
+        key = (self._script_path, parser_name)
+        form = self._forms.pop(key, None)  # Re-inserted below as most recently used
+        if form is None:
+            form = ArgForm(self._parsers[parser_name])
+            await self.arg_panel.mount(form)
+        self._forms[key] = form
+        form.display = True
+        self._current_form = form
+        while len(self._forms) > FORM_CACHE_SIZE:
+            await self._forms.pop(next(iter(self._forms))).remove()
+
+    def _refresh_preset_select(self):
+        self.preset_select.set_options([(name, name) for name in self._presets])
+
+    async def _apply_preset(self, name: str):
+        preset = self._presets.get(name)
+        if not preset:
+            return
+        parser_name = preset.get("parser")
+        if parser_name not in self._parsers:
+            return
+        if len(self._parsers) > 1:
+            self.parser_select.value = parser_name
+        await self.render_arguments(parser_name)
+        self._current_form.set_state(preset.get("values", {}))
+        self.preset_name_input.value = name
+
+    def _save_preset(self):
+        name = self.preset_name_input.value.strip()
+        if not name:
+            self.notify("Please enter a name for the preset.", severity="error")
+            return
+        if self._current_form is None:
+            return
+        if not self._schema_final:
+            # Saving would replace the presets of the final schema
+            self.notify(
+                "Presets can be saved once the arguments are introspected.",
+                severity="warning",
+            )
+            return
+        preset = {
+            "parser": self._current_form.parser.name,
+            "values": self._current_form.get_state(),
+        }
+        save_preset(self._script_path, self._schema, name, preset)
+        self._presets[name] = preset
+        self._refresh_preset_select()
+        self.notify(f"Preset {name} saved.", timeout=3)
 
     async def action_run_script(self):
         """Runs chosen script."""
@@ -136,80 +368,225 @@ class ScriptLauncher(Screen):
         script_path: Path = item.script_path
 
         folder_name = self.folder_select.value
-        python_exe = self.script_folders[folder_name].executable
+        folder = self.script_folders[folder_name]
 
         args = []
-        for row in self.arg_panel.children:
-            if hasattr(row, "get_value"):
-                args.extend(row.get_value())
-
-        cmd = [str(python_exe), "-u", str(script_path), *args]
-
-        self.log_file_path = create_log_file(script_path)
-        self.log_file = open(self.log_file_path, "w", encoding="utf-8")
-
-        self.output_box.write(f"Logging to: {self.log_file_path}", scroll_end=True)
-        output = f"Running: {' '.join(cmd)}"
-        self._output_and_log(output)
-        self.input_box.disabled = False
+        if self._current_form:
+            errors = self._current_form.validate()
+            if errors:
+                for error in errors:
+                    self.output_box.write(f"✘ {error}", scroll_end=True)
+                self.notify(
+                    "\n".join(errors), title="Invalid arguments", severity="error"
+                )
+                return
+            args = self._current_form.get_value()
 
-        self.process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        folder = await self._provisioned_folder(folder, script_path)
+        if folder is None:
+            return
+        self.ingest = self._create_ingest_filter()
+        run = self.app.runs.create(
+            script_path,
+            build_command(folder, script_path, args),
+            pty=self.pty_checkbox.value,
+            ingest=self.ingest,
+            pty_columns=max(self.output_box.size.width, 80),
         )
-
-        self.run_worker(self.read_stream(self.process.stdout), exclusive=False)
-        self.run_worker(
-            self.read_stream(self.process.stderr, is_stderr=True), exclusive=False
+        self.follow_run(run)
+        self.output_box.write(f"Logging to: {run.log_file_path}", scroll_end=True)
+        await run.start()
+        if run.export is not None:
+            self.output_box.write(
+                f"Exporting output to: {run.export.path}", scroll_end=True
+            )
+
+    async def action_run_matrix(self):
+        """Runs the chosen script for every combination of the matrix values.
+
+        Arguments that are not in the matrix keep the values entered in the form."""
+        selected = self.script_list.index
+        if selected is None or self._current_form is None:
+            self.notify(
+                "Select a script with arguments for a matrix run.", severity="error"
+            )
+            return
+        script_path: Path = self.script_list.children[selected].script_path
+        folder = self.script_folders[self.folder_select.value]
+        form = self._current_form
+        try:
+            matrix = parse_matrix(self.matrix_input.value, folder.path)
+        except (ValueError, OSError) as e:
+            self.notify(str(e), title="Invalid matrix", severity="error")
+            return
+        names = [row.arg_name for row in form.rows]
+        unknown = [name for name in matrix if name not in names]
+        if unknown:
+            self.notify(
+                f"Unknown arguments: {', '.join(unknown)}\n"
+                f"Arguments of the script: {', '.join(names)}",
+                title="Invalid matrix",
+                severity="error",
+            )
+            return
+        size = matrix_size(matrix)
+        max_instances = int(self.matrix_settings["max_instances"])
+        if size > max_instances:
+            self.notify(
+                f"The matrix has {size} instances, at most {max_instances} are "
+                "allowed (max_instances in the [matrix] settings).",
+                title="Invalid matrix",
+                severity="error",
+            )
+            return
+        instances = []
+        for index, values in enumerate(expand_matrix(matrix), 1):
+            errors = form.validate(values)
+            if errors:
+                self.notify(
+                    "\n".join(errors),
+                    title=f"Invalid arguments of instance {index}",
+                    severity="error",
+                )
+                return
+            instances.append(MatrixInstance(index, values, form.get_value(values)))
+        try:
+            concurrency = int(self.matrix_jobs.value)
+        except ValueError:
+            concurrency = int(self.matrix_settings["concurrency"])
+        folder = await self._provisioned_folder(folder, script_path)
+        if folder is None:
+            return
+        matrix_run = MatrixRun(
+            self.app.runs,
+            folder,
+            script_path,
+            instances,
+            concurrency,
+            pty=self.pty_checkbox.value,
+            pty_columns=max(self.output_box.size.width, 80),
         )
-        # Worker for outside of script logging and exit handling
-        self.run_worker(self.wait_for_exit(), group="process")
-
-    async def read_stream(self, stream, is_stderr=False):
-        """Reads the output stream in a subprocess."""
-        while True:
-            line = await stream.readline()
-            if not line:
-                break
-
-            text = line.decode(errors="replace")
-            self._output_and_log(text, is_stderr=is_stderr)
+        self.app.matrix_runs.append(matrix_run)
+        matrix_run.start()
+        self.output_box.write(
+            f"Matrix run with {size} instances, logging to: {matrix_run.log_dir}",
+            scroll_end=True,
+        )
+        await self.app.push_screen(MatrixScreen(matrix_run))
 
-    async def on_input_submitted(self, event: Input.Submitted):
-        """Sends input to script."""
-        if not self.process or self.process.returncode is not None:
+    def action_show_matrix(self):
+        """Shows the summary of the latest matrix run."""
+        if not self.app.matrix_runs:
+            self.notify("No matrix run was started yet.")
             return
+        self.app.push_screen(MatrixScreen(self.app.matrix_runs[-1]))
+
+    async def _provisioned_folder(
+        self, folder: ScriptFolder, script_path: Path
+    ) -> ScriptFolder | None:
+        """Returns the folder with the executable of the script's environment.
+
+        Waits for the environment if it isn't built yet, None if it can't be built."""
+        if not folder.provision:
+            return folder
+        if ENVIRONMENTS.ready_executable(folder.executable, script_path) is None:
+            self.output_box.write(
+                f"Building the environment of {script_path.name}…", scroll_end=True
+            )
+        try:
+            return await asyncio.to_thread(provisioned_folder, folder, script_path)
+        except ProvisioningError as e:
+            self.output_box.write(f"✘ Environment not built: {e}", scroll_end=True)
+            self.notify(str(e), title="Environment not built", severity="error")
+            return None
+
+    def _on_provisioned(
+        self, script_path: Path, executable: Path | None, error: str | None
+    ):
+        """Called from the build pool when the environment of a script was built."""
+        try:
+            self.app.call_from_thread(
+                self._apply_provisioned, script_path, executable, error
+            )
+        except RuntimeError:  # The app was closed in the meantime
+            pass
 
-        text = event.value + "\n"
-        self.process.stdin.write(text.encode())
-        await self.process.stdin.drain()
-        event.input.clear()
+    def _apply_provisioned(
+        self, script_path: Path, executable: Path | None, error: str | None
+    ):
+        if executable is None:
+            self._notify_provision_failed(error)
+        elif (
+            script_path == self._script_path
+            and self.script_folders[self.folder_select.value].introspect
+        ):
+            # Introspection of the selected script had to wait for its dependencies
+            INTROSPECTOR.refresh(script_path, executable, self._on_introspected)
+
+    def _notify_provision_failed(self, error: str | None):
+        if error in self._provision_errors:
+            return
+        self._provision_errors.add(error)
+        self.notify(f"{error}", title="Environment not built", severity="error")
+
+    def follow_run(self, run: ScriptRun) -> None:
+        """Shows the output of a run on this screen, starting with its kept lines."""
+        if self.run is not None:
+            self.run.remove_listener(self._run_listener)
+        self.run = run
+        self.ingest = run.ingest
+        for event in list(run.history):
+            self._on_run_event(run, event)
+        self._run_listener = partial(self._on_run_event, run)
+        run.add_listener(self._run_listener)
+        self.input_box.disabled = False
 
-    async def wait_for_exit(self):
-        """Handles events of script/process finishing.
+    def _on_run_event(self, run: ScriptRun, event: RunEvent) -> None:
+        """Shows the output and state of a run started on this screen."""
+        if event.kind == "line":
+            if event.dropped:
+                self._write_output(
+                    f"… {event.dropped} lines not shown (rate limit), see log file"
+                )
+            if event.show:
+                self._write_output(event.rich_text)
+        elif event.kind == "status":
+            self._write_output(event.rich_text)
+        elif event.kind == "live":
+            self.live_line.update(event.text)
+        elif event.kind == "exit" and self.run is run:
+            self.input_box.disabled = True
+            self.run = None
+
+    def _write_output(self, content: Text | str) -> None:
+        """Writes to the output box and counts the writes per UI batch.
+
+        A batch are the writes until the next refresh of the screen, e.g. the lines of
+        one chunk of output."""
+        self.output_box.write(content, scroll_end=True)
+        if METRICS.enabled:
+            if not self._batch_writes:
+                METRICS.increment("ui_batches")
+                self.call_after_refresh(self._end_batch)
+            self._batch_writes += 1
+
+    def _end_batch(self) -> None:
+        METRICS.observe("ui_batch_writes", self._batch_writes)
+        self._batch_writes = 0
 
-        Gets the exit code to print it to the output box and log file. Closes log file,
-        deletes process object and disables
-        the input box."""
-        return_code = await self.process.wait()
-        output = f"✔ Script finished (exit code {return_code})"
-        log_text = "=== SCRIPT FINISHED ===\n"
-        self._output_and_log(output, log_text)
-        self.input_box.disabled = True
-        self.process = None
+    async def on_input_submitted(self, event: Input.Submitted):
+        """Sends input to script."""
+        if self.run and await self.run.send_input(event.value):
+            event.input.clear()
 
     async def action_terminate_process(self):
-        """Terminates script by sending SIGTERM."""
-        if not self.process:
+        """Terminates the script and all processes it started.
+
+        The termination runs in a worker, so the UI stays responsive during the grace
+        periods."""
+        if not self.run:
             return
-        output = "User interrupt. Sending SIGTERM to script process."
-        self._output_and_log(output)
-        try:
-            self.process.terminate()
-        except AttributeError:
-            pass
+        self.run_worker(self.run.terminate(), group="terminate", exclusive=True)
 
     async def on_button_pressed(self, event: Button.Pressed):
         """Handles all buttons in event of them being pressed."""
@@ -219,6 +596,10 @@ class ScriptLauncher(Screen):
             self.output_box.clear()
         elif event.button.id == "stop_button":
             await self.action_terminate_process()
+        elif event.button.id == "save_preset":
+            self._save_preset()
+        elif event.button.id == "matrix_button":
+            await self.action_run_matrix()
 
     def load_scripts_for_folder(self, folder_name: str):
         """Loads and displays all py scripts in chosen folder.
@@ -228,22 +609,39 @@ class ScriptLauncher(Screen):
         script_folder = self.script_folders[folder_name]
         if not script_folder.path.exists():
             return
-        for script in sorted(script_folder.path.glob(script_folder.file_extension)):
-            if script.name[0] in script_folder.exclude_start:
-                continue
+        builds = set()
+        for script in script_folder.scripts():
             item = ListItem(Label(script.name))
             item.script_path = script
             self.script_list.append(item)
-
-    def _output_and_log(
-        self, output: str, log_text: str | None = None, is_stderr: bool = False
-    ) -> None:
-        rich_text = format_line(output, is_stderr=is_stderr)
-        if not log_text:
-            log_text = str(rich_text)
-        self.output_box.write(rich_text, scroll_end=True)
-        self.log_file.write(log_text + "\n")
-        self.log_file.flush()
+            # Warms the environments, so starting a script is fast. Scripts are only
+            # introspected once selected, as that runs them.
+            if script_folder.provision:
+                build = ENVIRONMENTS.prepare(
+                    script_folder.executable, script, self._on_provisioned
+                )
+                if build is not None:
+                    builds.add(build)  # Scripts with the same dependencies share it
+        for build in builds:
+            if build.done() and build.result()[0] is None:
+                self._notify_provision_failed(build.result()[1])
+        building = sum(1 for build in builds if not build.done())
+        if building:
+            self.notify(f"Building {building} environment(s) in the background…")
+
+    def _create_ingest_filter(self) -> IngestFilter:
+        """Creates the ingest filter for a new run from the settings."""
+        try:
+            ingest = IngestFilter.from_settings(self.ingest_settings)
+        except ValueError as e:
+            self.notify(f"Invalid ingest settings: {e}", severity="error")
+            ingest = IngestFilter()
+        for error in ingest.errors:
+            self.notify(
+                f"Invalid ingest rule in settings, ignored: {error}", severity="error"
+            )
+        ingest.min_level = self.level_select.value
+        return ingest
 
 
 class ScriptFolderManager(Screen):
@@ -264,6 +662,19 @@ class ScriptFolderManager(Screen):
             "Check, if working directory should be folder path",
             value=True,
         )
+        self.pty_checkbox = Checkbox(
+            "Check, if scripts should run in a pseudo-terminal (PTY) by default",
+            value=False,
+        )
+        self.introspect_checkbox = Checkbox(
+            "Check, if scripts should be run to read dynamically built parsers",
+            value=False,
+        )
+        self.provision_checkbox = Checkbox(
+            "Check, if scripts should run in environments with their dependencies "
+            "(PEP 723 metadata or requirements.txt)",
+            value=False,
+        )
 
     def compose(self):
         yield Header(show_clock=True)
@@ -274,6 +685,9 @@ class ScriptFolderManager(Screen):
         yield self.path_input
         yield self.python_input
         yield self.cwd_checkbox
+        yield self.pty_checkbox
+        yield self.introspect_checkbox
+        yield self.provision_checkbox
         with Horizontal():
             yield Button("Add", id="add", variant="success")
             yield Button("Remove Selected", id="remove", variant="error")
@@ -317,7 +731,15 @@ class ScriptFolderManager(Screen):
         if name in folders:
             self.notify(f"Name {name} already exists.", severity="error", timeout=3)
             return
-        folders[name] = ScriptFolder(name, path, python, cwd)
+        folders[name] = ScriptFolder(
+            name,
+            path,
+            python,
+            cwd,
+            pty=self.pty_checkbox.value,
+            introspect=self.introspect_checkbox.value,
+            provision=self.provision_checkbox.value,
+        )
         save_script_folders(folders)
         self.refresh_folder_list()
         self._clear_inputs()
@@ -360,3 +782,6 @@ class ScriptFolderManager(Screen):
         self.path_input.value = ""
         self.python_input.value = ""
         self.cwd_checkbox.value = True
+        self.pty_checkbox.value = False
+        self.introspect_checkbox.value = False
+        self.provision_checkbox.value = False
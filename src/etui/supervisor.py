@@ -0,0 +1,129 @@
+"""Supervisor of a detached run, which keeps the script running when etui quits.
+
+Started by DetachedRun in its own session, so neither quitting etui nor a closed
+terminal or SSH session stops it:
+
+        python -m etui.supervisor <run directory>
+
+The supervisor runs the script like etui itself (see ScriptRun), writes the log file
+and appends every output line to the journal in the run directory, ending with an exit
+record. Lines written to the FIFO in the run directory are sent to the script's stdin,
+SIGTERM stops the script with the grace periods from the state file.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import TextIO
+
+from etui.process_utils import GracePeriods
+from etui.runs import (
+    JOURNAL_FILE,
+    STDIN_FIFO,
+    RunEvent,
+    ScriptRun,
+    read_state,
+    write_state,
+)
+
+STDIN_READ_SIZE = 65536
+
+
+class Supervisor:
+    """Runs the script of a run directory and journals its output."""
+
+    def __init__(self, run_dir: Path, journal: TextIO) -> None:
+        self.run_dir = run_dir
+        self.state = read_state(run_dir)
+        self.run = ScriptRun(
+            0,
+            Path(self.state["script"]),
+            self.state["cmd"],
+            pty=self.state["pty"],
+            grace=GracePeriods(**self.state["grace"]),
+            pty_columns=self.state["pty_columns"],
+            log_file_path=Path(self.state["log_file"]),
+        )
+        self.journal = journal
+        self.run.add_listener(self._journal_event)
+        self._terminating: asyncio.Task | None = None
+        self._stop_requested = False
+        self._stdin_buffer = b""
+
+    def _write_record(self, record: dict) -> None:
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+
+    def _journal_event(self, event: RunEvent) -> None:
+        if event.kind in ("line", "status"):
+            self._write_record(
+                {"kind": event.kind, "text": event.text, "is_stderr": event.is_stderr}
+            )
+
+    def _on_stdin(self, fd: int) -> None:
+        """Sends complete lines from the FIFO to the script."""
+        try:
+            self._stdin_buffer += os.read(fd, STDIN_READ_SIZE)
+        except BlockingIOError:
+            return
+        *lines, self._stdin_buffer = self._stdin_buffer.split(b"\n")
+        for line in lines:
+            asyncio.create_task(self.run.send_input(line.decode(errors="replace")))
+
+    def _on_sigterm(self) -> None:
+        self._stop_requested = True
+        # Before the script was started, it is stopped right after the start
+        if self.run.running and self._terminating is None:
+            self._terminating = asyncio.create_task(self.run.terminate())
+
+    async def supervise(self) -> int:
+        loop = asyncio.get_running_loop()
+        # Ignored by a handler, not SIG_IGN, which the script would inherit
+        loop.add_signal_handler(signal.SIGHUP, lambda: None)
+        loop.add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        # Opened for writing too, so the FIFO never reports EOF between two writers
+        stdin_fd = os.open(self.run_dir / STDIN_FIFO, os.O_RDWR | os.O_NONBLOCK)
+        loop.add_reader(stdin_fd, self._on_stdin, stdin_fd)
+        write_state(self.run_dir, self.state | {"supervisor_pid": os.getpid()})
+        try:
+            await self.run.start()
+            if self._stop_requested:
+                self._on_sigterm()
+            write_state(
+                self.run_dir,
+                self.state
+                | {
+                    "supervisor_pid": os.getpid(),
+                    "pid": self.run.pid,
+                    "started_at": self.run.started_at,
+                },
+            )
+            await self.run.finished.wait()
+            released_by = await self._terminating if self._terminating else None
+        finally:
+            loop.remove_reader(stdin_fd)
+            os.close(stdin_fd)
+        self._write_record(
+            {
+                "kind": "exit",
+                "return_code": self.run.return_code,
+                "released_by": released_by.name if released_by else None,
+            }
+        )
+        return 0
+
+
+def main() -> int:
+    if len(sys.argv) != 2:
+        print("Usage: python -m etui.supervisor <run directory>", file=sys.stderr)
+        return 2
+    run_dir = Path(sys.argv[1])
+    with open(run_dir / JOURNAL_FILE, "a", encoding="utf-8") as journal:
+        return asyncio.run(Supervisor(run_dir, journal).supervise())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Minimal terminal emulation for output of scripts that run in a pseudo-terminal."""
+
+import re
+
+TAB_SIZE = 8
+MAX_PENDING_ESCAPE = 64
+
+_TOKEN = re.compile(
+    r"(?P<text>[^\x00-\x1f\x7f]+)"
+    r"|(?P<csi>\x1b\[(?P<params>[0-?]*)[ -/]*(?P<final>[@-~]))"
+    r"|(?P<osc>\x1b\][^\x07\x1b]*(?:\x07|\x1b\\))"
+    r"|(?P<esc>\x1b[ -/]*[0-Z\\^-~])"
+    r"|(?P<control>[^\x1b])"
+)
+
+
+class TerminalLineBuffer:
+    """Collapses terminal output into settled lines.
+
+    Only the current line is emulated: carriage returns, backspaces, tabs, cursor
+    movement within the line and erasing the line are applied in place. A line counts
+    as settled when a newline is written, so a progress bar which redraws itself with
+    carriage returns hundreds of times results in a single line. Colors and all other
+    escape sequences (e.g. moving the cursor to another line) are dropped."""
+
+    def __init__(self) -> None:
+        self._line = ""
+        self._col = 0
+        self._pending = ""
+
+    @property
+    def current_line(self) -> str:
+        """The line that is currently drawn, but not yet settled."""
+        return self._line.rstrip()
+
+    def feed(self, data: str) -> list[str]:
+        """Processes terminal output and returns all lines settled by it."""
+        settled = []
+        data = self._pending + data
+        self._pending = ""
+        pos = 0
+        while pos < len(data):
+            match = _TOKEN.match(data, pos)
+            if match is None:
+                # Only an incomplete escape sequence can fail to match
+                if len(data) - pos < MAX_PENDING_ESCAPE:
+                    self._pending = data[pos:]
+                    break
+                pos += 1
+                continue
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "text":
+                self._write(match.group())
+            elif kind == "csi":
+                self._csi(match.group("params"), match.group("final"))
+            elif kind == "control":
+                char = match.group()
+                if char == "\n":
+                    settled.append(self._line.rstrip())
+                    self._line, self._col = "", 0
+                elif char == "\r":
+                    self._col = 0
+                elif char == "\b":
+                    self._col = max(0, self._col - 1)
+                elif char == "\t":
+                    self._col += TAB_SIZE - self._col % TAB_SIZE
+        return settled
+
+    def flush(self) -> list[str]:
+        """Settles the current line, if anything was drawn on it."""
+        line = self.current_line
+        self._line, self._col, self._pending = "", 0, ""
+        return [line] if line else []
+
+    def _write(self, text: str) -> None:
+        line, col = self._line, self._col
+        if col == len(line):
+            self._line = line + text
+        else:
+            self._line = line[:col].ljust(col) + text + line[col + len(text) :]
+        self._col = col + len(text)
+
+    def _csi(self, params: str, final: str) -> None:
+        values = [int(value) if value.isdigit() else 0 for value in params.split(";")]
+        count = max(values[0], 1)
+        if final == "K":  # Erase in line
+            if values[0] == 0:
+                self._line = self._line[: self._col]
+            elif values[0] == 1:
+                self._line = " " * self._col + self._line[self._col :]
+            else:
+                self._line = ""
+        elif final == "C":  # Cursor forward
+            self._col += count
+        elif final == "D":  # Cursor back
+            self._col = max(0, self._col - count)
+        elif final == "G":  # Cursor to column
+            self._col = count - 1
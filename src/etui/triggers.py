@@ -0,0 +1,133 @@
+"""Triggers that act on output lines of a run, e.g. to answer prompts of a script.
+
+Triggers are configured per script in triggers.toml. The literal beginnings of all
+patterns are compiled into one alternation, which is searched first: lines that can't
+match any trigger cost a single search regardless of the number of triggers, only the
+rare candidates are searched with the full patterns. (An alternation of the full
+patterns is much slower, as the regex engine then tries every pattern at every
+position.) Patterns without a literal beginning, e.g. starting with a group or a
+character class, are searched in every line.
+
+If several triggers match a line, the one that matches first in the line wins. Triggers
+see complete lines, and a partial line once the script wrote nothing for a moment (see
+PROMPT_IDLE_TIME in etui.runs), so prompts without a newline can be answered. A
+trigger that acted on a partial line doesn't act on it again once it is complete.
+"""
+
+import re
+from dataclasses import dataclass
+
+TRIGGER_ACTIONS = ("send", "notify", "terminate", "mark")
+_SPECIAL_CHARACTERS = set("\\.^$*+?{}[]|()")
+
+
+def literal_prefix(pattern: str) -> str:
+    """Returns text that every match of the pattern starts with, possibly empty.
+
+    Errs on the safe side: patterns with alternatives have no literal prefix."""
+    if "|" in pattern:
+        return ""
+    pattern = pattern.removeprefix("^")
+    for index, char in enumerate(pattern):
+        if char in "*?{":  # The character before might not be part of the match
+            return pattern[: index - 1]
+        if char in _SPECIAL_CHARACTERS:
+            return pattern[:index]
+    return pattern
+
+
+@dataclass
+class Trigger:
+    """One trigger of a script.
+
+    text is the input line to send, the notification or the mark, it can contain named
+    groups of the pattern like {name}."""
+
+    pattern: str
+    action: str = "notify"
+    text: str = ""
+    once: bool = False  # Only act on the first matching line
+
+    @classmethod
+    def from_dict(cls, trigger: dict) -> "Trigger":
+        action = trigger.get("action", cls.action)
+        if action not in TRIGGER_ACTIONS:
+            raise ValueError(f"Unknown trigger action: {action}")
+        if not trigger.get("pattern"):
+            raise ValueError("Trigger without pattern")
+        return cls(
+            trigger["pattern"],
+            action,
+            trigger.get("text", cls.text),
+            bool(trigger.get("once", cls.once)),
+        )
+
+
+@dataclass
+class TriggerHit:
+    trigger: Trigger
+    text: str  # The text of the trigger with the matched groups filled in
+
+
+class TriggerSet:
+    """The triggers of one run, with the state of triggers that act only once."""
+
+    def __init__(self, triggers: list[Trigger] | None = None) -> None:
+        self.triggers = triggers or []
+        self.counts = [0] * len(self.triggers)
+        self._patterns = [re.compile(trigger.pattern) for trigger in self.triggers]
+        self._prefixes = [literal_prefix(trigger.pattern) for trigger in self.triggers]
+        self._prefilter: re.Pattern | None = None
+        self._prefixed: list[tuple[str, int]] = []
+        self._unprefixed: list[int] = []
+        self._compile()
+
+    @classmethod
+    def from_rules(cls, rules: list[dict]) -> "TriggerSet":
+        return cls([Trigger.from_dict(rule) for rule in rules])
+
+    def __bool__(self) -> bool:
+        return bool(self._prefixed or self._unprefixed)
+
+    def _compile(self) -> None:
+        """Builds the prefilter of all triggers that may still act."""
+        active = [
+            index
+            for index, trigger in enumerate(self.triggers)
+            if not (trigger.once and self.counts[index])
+        ]
+        self._prefixed = [
+            (self._prefixes[index], index) for index in active if self._prefixes[index]
+        ]
+        self._unprefixed = [index for index in active if not self._prefixes[index]]
+        prefixes = sorted({prefix for prefix, _ in self._prefixed})
+        self._prefilter = (
+            re.compile("|".join(map(re.escape, prefixes))) if prefixes else None
+        )
+
+    def process(self, text: str) -> TriggerHit | None:
+        """Returns the trigger that acts on a line, if any."""
+        candidates = self._unprefixed
+        if self._prefilter is not None and self._prefilter.search(text):
+            candidates = sorted(
+                candidates
+                + [index for prefix, index in self._prefixed if prefix in text]
+            )
+        best: tuple[int, re.Match] | None = None
+        for index in candidates:
+            match = self._patterns[index].search(text)
+            if match and (best is None or match.start() < best[1].start()):
+                best = index, match
+        if best is None:
+            return None
+        index, match = best
+        trigger = self.triggers[index]
+        self.counts[index] += 1
+        if trigger.once:
+            self._compile()  # Rare, so rebuilding is cheaper than checking every line
+        groups = {name: value or "" for name, value in match.groupdict().items()}
+        try:
+            hit_text = trigger.text.format_map(groups)
+        except (KeyError, IndexError, ValueError):
+            hit_text = trigger.text
+        return TriggerHit(trigger, hit_text)
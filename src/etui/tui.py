@@ -1,19 +1,56 @@
+import asyncio
+import logging
+from pathlib import Path
+
 from textual.app import App, ComposeResult
+from textual.message import Message
 from textual.screen import Screen
 from textual.widgets import Button, Header, Footer
 from textual.containers import Vertical
-from textual.reactive import reactive
 
-from etui.config import ensure_user_configs
+from etui.config import ensure_user_configs, load_settings_section
 from etui.scriptlauncher import ScriptLauncher, ScriptFolderManager
 from etui.screen_helper import NotImplementedScreen, QuestionScreen, InfoScreen
 from etui.file_browser import FileBrowser
 from etui.file_utils import ETUI_PATH, LOG_PATH, TCSS_PATH, get_version
-from etui.logging import cleanup_old_logs
+from etui.logging import cleanup_old_logs, get_logger
+from etui.diagnostics import (
+    METRICS,
+    PROFILER,
+    DiagnosticsScreen,
+    monitor_event_loop_lag,
+)
+from etui.runs import RunEvent, RunManager, ScriptRun
+from etui.control_api import ControlServer
+from etui.environments import ENVIRONMENTS
+from etui.introspect import INTROSPECTOR
+from etui.matrix import MatrixRun
 
 README_PATH = ETUI_PATH / "README.md"
 
 
+class LogMessage(Message):
+    """A warning or error logged by etui, shown as a notification."""
+
+    def __init__(self, record: logging.LogRecord) -> None:
+        super().__init__()
+        self.record = record
+
+
+class NotifyHandler(logging.Handler):
+    """Posts the warnings of the etui logger to the app.
+
+    Posting a message is thread-safe, so warnings of the worker threads (e.g. of the
+    introspection pool) are shown as well."""
+
+    def __init__(self, app: App) -> None:
+        super().__init__(logging.WARNING)
+        self.app = app
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.app.post_message(LogMessage(record))
+
+
 class MainScreen(Screen):
     """Main application menu."""
 
@@ -66,20 +103,87 @@ class ETui(App):
         ("down", "focus_next", "Focus next"),
         ("enter", "activate", "Activate"),
         ("escape", "back", "Back"),
+        ("f12", "show_diagnostics", "Diagnostics"),
+        ("f9", "toggle_profiler", "Profiler"),
     ]
 
-    running_scripts = reactive(dict)
-
     def __init__(self):
         super().__init__()
         ensure_user_configs()
+        self.runs = RunManager()
+        self.runs.listeners.append(self._on_run_event)
+        self.control_server: ControlServer | None = None
+        self.matrix_runs: list[MatrixRun] = []
+        self._log_handler = NotifyHandler(self)
         self.title = "ETUI"
         self.sub_title = get_version()
 
     async def on_mount(self) -> None:
+        get_logger().addHandler(self._log_handler)
         cleanup_old_logs()
+        if load_settings_section("diagnostics", {"enabled": False})["enabled"]:
+            self.set_diagnostics(True)
+        api = load_settings_section("api", {"enabled": False, "socket": ""})
+        if api["enabled"]:
+            await self.start_control_server(api["socket"])
+        reattached = self.runs.reattach()
+        if reattached:
+            self.notify(
+                f"Reattached to {len(reattached)} detached run(s), "
+                "open the ScriptLauncher to follow them."
+            )
         await self.push_screen(MainScreen())
 
+    async def start_control_server(self, socket_path: str = "") -> None:
+        """Serves the control API, see etui.control_api."""
+        server = ControlServer(self.runs, Path(socket_path) if socket_path else None)
+        try:
+            await server.start()
+        except OSError as e:
+            self.notify(f"Control API not started: {e}", severity="error")
+            return
+        self.control_server = server
+
+    def on_unmount(self) -> None:
+        get_logger().removeHandler(self._log_handler)
+
+    def on_log_message(self, message: LogMessage) -> None:
+        record = message.record
+        self.notify(
+            record.getMessage(),
+            title="etui",
+            severity="error" if record.levelno >= logging.ERROR else "warning",
+        )
+
+    def _on_run_event(self, run: ScriptRun, event: RunEvent) -> None:
+        """Shows notifications of output triggers, whichever screen is open."""
+        if event.kind == "notify":
+            self.notify(event.text, title=run.script_path.name, timeout=10)
+
+    def set_diagnostics(self, enabled: bool) -> None:
+        """Enables or disables collecting metrics of the hot paths."""
+        if enabled and not METRICS.enabled:
+            METRICS.enabled = True
+            METRICS.reset()
+            # Exclusive, so enabling again replaces the monitor instead of adding one
+            self.run_worker(
+                monitor_event_loop_lag(), group="diagnostics", exclusive=True
+            )
+        elif not enabled:
+            METRICS.enabled = False
+
+    def action_show_diagnostics(self) -> None:
+        if not isinstance(self.screen, DiagnosticsScreen):
+            self.push_screen(DiagnosticsScreen())
+
+    def action_toggle_profiler(self) -> None:
+        """Starts or stops cProfile, the profile is written next to the logs."""
+        path = PROFILER.toggle()
+        if path:
+            self.notify(f"Profile written to {path}")
+        else:
+            self.notify("Profiler started, press F9 again to stop it.")
+
     def action_back(self) -> None:
         if len(self.app.screen_stack) > 2:  # Avoid popping Main Screen
             self.app.pop_screen()
@@ -87,9 +191,14 @@ class ETui(App):
     def action_request_quit(self) -> None:
         """Displays the quit screen."""
 
-        def check_quit(is_quit: bool | None) -> None:
+        async def check_quit(is_quit: bool | None) -> None:
             """Called when Quitscreen is dismissed."""
             if is_quit:
+                await self.terminate_running_scripts()
+                if self.control_server is not None:
+                    await self.control_server.stop()
+                INTROSPECTOR.shutdown()
+                ENVIRONMENTS.shutdown()
                 self.exit()
 
         self.push_screen(
@@ -99,6 +208,20 @@ class ETui(App):
             check_quit,
         )
 
+    async def terminate_running_scripts(self) -> None:
+        """Stops all running scripts and their child processes concurrently.
+
+        Matrix runs are stopped as well, so they don't start their queued instances."""
+        running = [run for run in self.runs.running() if not run.detached]
+        matrices = [matrix for matrix in self.matrix_runs if matrix.running]
+        if not running and not matrices:
+            return
+        if running:
+            self.notify(f"Stopping {len(running)} running script(s)…")
+        await asyncio.gather(
+            self.runs.terminate_all(), *(matrix.stop() for matrix in matrices)
+        )
+
 
 def main():
     """Sets up and runs the TUI."""
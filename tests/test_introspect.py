@@ -0,0 +1,60 @@
+"""Tests of the introspection of argparse parsers, run with pytest or as a script."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from etui.introspect import SchemaCache, introspect_script
+
+
+def test_relative_executable():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        script_path = Path(temp_dir) / "script.py"
+        script_path.write_text(
+            "import argparse\n"
+            "parser = argparse.ArgumentParser()\n"
+            "parser.add_argument('--name')\n"
+            "parser.parse_args()\n"
+        )
+        # Relative to the working directory, like the default .venv/bin/python
+        executable = Path(os.path.relpath(sys.executable))
+        parsers, _ = introspect_script(script_path, executable)
+        assert [arg.name for arg in parsers["parser"].args] == ["--name"]
+
+
+def test_count_action_takes_no_values():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        script_path = Path(temp_dir) / "script.py"
+        script_path.write_text(
+            "import argparse\n"
+            "parser = argparse.ArgumentParser()\n"
+            "parser.add_argument('--verbose', action='count')\n"
+            "parser.parse_args()\n"
+        )
+        parsers, _ = introspect_script(script_path, Path(sys.executable))
+        (verbose,) = parsers["parser"].args
+        assert verbose.nargs is None
+
+
+def test_cached_schema_equals_fresh_schema():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        script_path = Path(temp_dir) / "script.py"
+        script_path.write_text(
+            "import argparse, pathlib\n"
+            "parser = argparse.ArgumentParser()\n"
+            "parser.add_argument('--file', type=pathlib.Path)\n"
+            "parser.parse_args()\n"
+        )
+        parsers, modules = introspect_script(script_path, Path(sys.executable))
+        assert parsers["parser"].args[0].type == "path"
+        cache = SchemaCache(Path(temp_dir) / "cache")
+        cache.put("key", parsers, modules)
+        assert cache.get("key") == parsers
+
+
+if __name__ == "__main__":
+    test_relative_executable()
+    test_count_action_takes_no_values()
+    test_cached_schema_equals_fresh_schema()
+    print("All introspection tests passed.")